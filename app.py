@@ -1,430 +1,596 @@
-import tensorflow as tf
+import time
+
+# startup is timed from here, before the heavier imports below
+IMPORT_STARTED = time.perf_counter()
+
 import numpy as np
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse
-from PIL import Image
-import io
-
-# load tf model
-try:
-    model = tf.keras.models.load_model("trained_model.keras")
-    # getting class names
-    CLASS_NAMES = ['Apple - Apple scab', 'Apple - Black rot', 'Apple - Cedar apple rust', 'Apple - healthy', 'Blueberry - healthy', 'Cherry - Powdery mildew', 'Cherry - healthy', 'Corn (maize) - Cercospora leaf spot Gray leaf spot', 'Corn (maize) - Common rust ', 'Corn (maize) - Northern Leaf Blight', 'Corn (maize) - healthy', 'Grape - Black rot', 'Grape - Esca (Black Measles)', 'Grape - Leaf blight (Isariopsis Leaf Spot)', 'Grape - healthy', 'Orange - Haunglongbing (Citrus greening)', 'Peach - Bacterial spot', 'Peach - healthy', 'Pepper, bell - Bacterial spot', 'Pepper, bell - healthy', 'Potato - Early blight', 'Potato - Late blight', 'Potato - healthy', 'Raspberry - healthy', 'Soybean - healthy', 'Squash - Powdery mildew', 'Strawberry - Leaf scorch', 'Strawberry - healthy', 'Tomato - Bacterial spot', 'Tomato - Early blight', 'Tomato - Late blight', 'Tomato - Leaf Mold', 'Tomato - Septoria leaf spot', 'Tomato - Spider mites Two-spotted spider mite', 'Tomato - Target Spot', 'Tomato - Tomato Yellow Leaf Curl Virus', 'Tomato - Tomato mosaic virus', 'Tomato - healthy']
-    print("TensorFlow model loaded successfully.")
-except Exception as e:
-    print(f"Error loading TensorFlow model: {e}")
-    model = None 
-
-
-# --- Disease Descriptions and Solutions Dictionary ---
-PLANT_DISEASE_INFO = {
-    "Apple - Apple scab": {
-        "description": "Fungal disease causing olive-green to brown spots on leaves, fruit, and twigs, eventually leading to defoliation and fruit distortion.",
-        "solutions": [
-            "**Sanitation:** Rake and destroy fallen leaves and infected fruit in the autumn to reduce overwintering spores. Prune out infected twigs during dormancy.",
-            "**Fungicides:** Apply fungicides containing Myclobutanil, Captan, or Copper at bud break and continue through the growing season, especially during wet periods. Follow label instructions for timing and frequency.",
-            "**Resistant Varieties:** Consider planting scab-resistant apple varieties if available in your region.",
-            "**Air Circulation:** Prune trees to improve air circulation within the canopy."
-        ]
-    },
-    "Apple - Black rot": {
-        "description": "Fungal disease affecting fruit (causing black, shriveled rot), leaves (purple-bordered brown spots), and bark (cankers).",
-        "solutions": [
-            "**Sanitation:** Remove and destroy mummified fruit from the tree and ground. Prune out cankered branches and any dead wood.",
-            "**Fungicides:** Apply fungicides like Captan or Copper at bud break and throughout the growing season, especially during warm, humid conditions.",
-            "**Wound Protection:** Protect trees from mechanical injury, as wounds provide entry points for the fungus.",
-            "**Pruning:** Maintain good tree structure and air circulation through proper pruning."
-        ]
-    },
-    "Apple - Cedar apple rust": {
-        "description": "Fungal disease requiring two hosts: cedar/juniper and apple. Causes bright orange-yellow spots on apple leaves and sometimes fruit.",
-        "solutions": [
-            "**Remove Cedars/Junipers:** The most effective long-term solution is to remove susceptible cedar or juniper trees within a few hundred feet of apple trees.",
-            "**Resistant Varieties:** Plant rust-resistant apple varieties.",
-            "**Fungicides:** Apply fungicides such as Myclobutanil or Chlorothalonil (on apples, check label for post-bloom use) when orange galls appear on cedars in spring, and continue until early summer.",
-            "**Pruning:** Prune out galls from cedar trees before they produce spores."
-        ]
-    },
-    "Apple - healthy": {
-        "description": "The apple plant appears healthy.",
-        "solutions": [
-            "**Location:** Plant in full sun (at least 6-8 hours direct sunlight daily).",
-            "**Soil:** Well-draining, fertile soil with a pH of 6.0-7.0.",
-            "**Watering:** Consistent watering, especially during dry periods and fruit development. Deep watering is better than shallow frequent watering.",
-            "**Fertilization:** Annually with a balanced fertilizer, based on soil test results.",
-            "**Pruning:** Regular dormant pruning for structural integrity, air circulation, and fruit production. Summer pruning for shape and light penetration.",
-            "**Pest and Disease Monitoring:** Regularly inspect trees for any signs of pests or diseases and address them promptly.",
-            "**Weed Control:** Keep the area around the tree free of weeds to reduce competition for nutrients and water."
-        ]
-    },
-    "Blueberry - healthy": {
-        "description": "The blueberry plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Highly acidic soil (pH 4.5-5.5) rich in organic matter. Amend with peat moss, pine bark, or sulfur if needed.",
-            "**Watering:** Consistent moisture, especially during fruit development. Blueberries have shallow root systems.",
-            "**Mulching:** Apply a thick layer of acidic mulch (pine needles, wood chips) to conserve moisture, suppress weeds, and maintain soil acidity.",
-            "**Fertilization:** Use acid-loving plant fertilizers or ammonium sulfate, especially in early spring.",
-            "**Pruning:** Annual dormant pruning to remove old, unproductive canes and encourage new growth.",
-            "**Pest and Disease Monitoring:** Regular inspection."
-        ]
-    },
-    "Cherry - Powdery mildew": {
-        "description": "Fungal disease causing a white, powdery growth on leaves, shoots, and sometimes fruit. Can lead to distorted growth and reduced vigor.",
-        "solutions": [
-            "**Air Circulation:** Prune trees to improve air circulation within the canopy.",
-            "**Watering:** Avoid overhead watering, which can spread spores. Water at the base of the plant.",
-            "**Fungicides:** Apply fungicides containing Myclobutanil, Sulfur (avoid on sulfur-sensitive varieties), or Potassium Bicarbonate at the first sign of symptoms and repeat as needed.",
-            "**Resistant Varieties:** Choose powdery mildew-resistant cherry varieties if available.",
-            "**Sanitation:** Remove and destroy heavily infected leaves and shoots."
-        ]
-    },
-    "Cherry - healthy": {
-        "description": "The cherry plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Well-draining, loamy soil with a pH of 6.0-7.0.",
-            "**Watering:** Consistent watering, especially during dry periods and fruit development.",
-            "**Fertilization:** Annually with a balanced fertilizer, based on soil test results.",
-            "**Pruning:** Regular dormant pruning to maintain an open canopy, remove dead or diseased wood, and encourage fruit production.",
-            "**Pest and Disease Monitoring:** Regular inspection."
-        ]
-    },
-    "Corn (maize) - Cercospora leaf spot Gray leaf spot": {
-        "description": "Fungal disease causing rectangular, gray-to-tan lesions with dark borders on leaves. Can lead to significant yield loss.",
-        "solutions": [
-            "**Resistant Varieties:** Plant corn hybrids with resistance to gray leaf spot.",
-            "**Crop Rotation:** Rotate corn with non-host crops (e.g., soybeans, small grains) to reduce inoculum in the soil.",
-            "**Tillage:** Burying crop residue can help reduce the overwintering inoculum.",
-            "**Fungicides:** Apply fungicides (e.g., strobilurins, triazoles) if disease pressure is high and environmental conditions favor disease development. Consult local agricultural extension for recommended timing."
-        ]
-    },
-    "Corn (maize) - Common rust ": {
-        "description": "Fungal disease characterized by cinnamon-brown to dark brown pustules on leaves, which release powdery spores.",
-        "solutions": [
-            "**Resistant Varieties:** Plant corn hybrids with resistance to common rust.",
-            "**Fungicides:** Fungicides can be effective if applied early in the disease development, especially on susceptible hybrids or in areas with high disease pressure."
-        ]
-    },
-    "Corn (maize) - Northern Leaf Blight": {
-        "description": "Fungal disease causing long, elliptical, grayish-green to tan lesions on leaves, often starting on lower leaves and progressing upwards.",
-        "solutions": [
-            "**Resistant Varieties:** Plant corn hybrids with good resistance to Northern Leaf Blight.",
-            "**Crop Rotation:** Rotate corn with non-host crops.",
-            "**Tillage:** Burying crop residue helps reduce inoculum.",
-            "**Fungicides:** Apply fungicides when disease reaches threshold levels, especially on susceptible hybrids."
-        ]
-    },
-    "Corn (maize) - healthy": {
-        "description": "The corn (maize) plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Well-draining, fertile soil.",
-            "**Watering:** Consistent moisture, especially during silking and kernel fill.",
-            "**Fertilization:** Adequate nitrogen, phosphorus, and potassium as determined by soil test.",
-            "**Spacing:** Proper spacing to allow for good air circulation.",
-            "**Weed Control:** Effective weed management."
-        ]
-    },
-    "Grape - Black rot": {
-        "description": "Fungal disease causing small, circular, reddish-brown spots on leaves, and eventually shriveling, black mummified berries.",
-        "solutions": [
-            "**Sanitation:** Remove and destroy all mummified berries from the vine and ground. Prune out any infected tendrils or shoots.",
-            "**Fungicides:** Apply fungicides (e.g., Myclobutanil, Mancozeb, Copper) according to a protective spray schedule, starting at bud break and continuing through fruit set.",
-            "**Air Circulation:** Prune vines to ensure good air circulation and sunlight penetration.",
-            "**Resistant Varieties:** Choose black rot-resistant grape varieties."
-        ]
-    },
-    "Grape - Esca (Black Measles)": {
-        "description": "Complex disease caused by a group of fungi. Symptoms include interveinal necrosis and tiger-stripe patterns on leaves, and internal wood discoloration (black spotting). Can lead to vine decline and death.",
-        "solutions": [
-            "**Pruning:** Remove diseased wood completely, cutting back to healthy tissue. Disinfect pruning tools between cuts.",
-            "**Trunk Renewal:** In severe cases, cut back affected trunks below the diseased wood to encourage new shoots.",
-            "**Wound Protection:** Apply wound protectants to large pruning cuts to prevent fungal entry.",
-            "**Vineyard Hygiene:** Good vineyard sanitation and management to reduce stress on vines.",
-            "**No Chemical Cure:** There is no direct chemical cure for established Esca. Focus on prevention and management."
-        ]
-    },
-    "Grape - Leaf blight (Isariopsis Leaf Spot)": {
-        "description": "Fungal disease causing angular, dark brown spots on leaves, often with a yellow halo. Can lead to premature defoliation.",
-        "solutions": [
-            "**Sanitation:** Rake and destroy fallen leaves in the autumn to reduce overwintering inoculum.",
-            "**Air Circulation:** Prune vines to improve air circulation.",
-            "**Fungicides:** Apply fungicides (e.g., Mancozeb, Copper-based fungicides) according to a protective spray schedule, especially during wet periods."
-        ]
-    },
-    "Grape - healthy": {
-        "description": "The grape plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Well-draining, moderately fertile soil.",
-            "**Watering:** Consistent moisture, especially during fruit development.",
-            "**Pruning:** Regular dormant pruning for vine structure, fruit production, and air circulation. Summer pruning for canopy management.",
-            "**Trellising:** Provide adequate trellising or support for vines.",
-            "**Fertilization:** Based on soil test results, typically a balanced fertilizer.",
-            "**Pest and Disease Monitoring:** Regular inspection."
-        ]
-    },
-    "Orange - Haunglongbing (Citrus greening)": {
-        "description": "Bacterial disease spread by the Asian citrus psyllid. Causes yellowing of leaves in blotchy patterns, stunted growth, lopsided fruit, and bitter taste. Fatal to trees.",
-        "solutions": [
-            "**Vector Control:** Control the Asian citrus psyllid through insecticide applications (systemic and foliar) in affected areas.",
-            "**Remove Infected Trees:** Immediately remove and destroy infected trees to prevent further spread.",
-            "**Quarantine:** Adhere to local and national quarantines to prevent the movement of infected plant material.",
-            "**Resistant Varieties:** Research and plant any newly developed tolerant or resistant varieties.",
-            "**No Cure:** There is currently no cure for HLB. Prevention and vector control are paramount."
-        ]
-    },
-    "Peach - Bacterial spot": {
-        "description": "Bacterial disease causing small, angular, water-soaked spots on leaves that turn dark brown/black, often with a purplish halo. Causes spots on fruit and cankers on twigs.",
-        "solutions": [
-            "**Resistant Varieties:** Plant peach varieties with genetic resistance to bacterial spot.",
-            "**Copper Sprays:** Apply dormant copper sprays in late fall or early spring. Repeated applications during the growing season may be needed, but can cause phytotoxicity.",
-            "**Pruning:** Prune out severely infected twigs during dormancy.",
-            "**Avoid Overhead Watering:** Water at the base of the tree to reduce leaf wetness.",
-            "**Minimize Wounds:** Avoid practices that create wounds on the tree."
-        ]
-    },
-    "Peach - healthy": {
-        "description": "The peach plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Well-draining, loamy soil with a pH of 6.0-7.0.",
-            "**Watering:** Consistent watering, especially during fruit development.",
-            "**Fertilization:** Annually with a balanced fertilizer, based on soil test results.",
-            "**Pruning:** Regular dormant pruning for an open vase shape to promote air circulation and fruit production. Thinning fruit is also crucial.",
-            "**Pest and Disease Monitoring:** Regular inspection and timely intervention."
-        ]
-    },
-    "Pepper, bell - Bacterial spot": {
-        "description": "Bacterial disease causing small, circular, water-soaked spots on leaves, stems, and fruit. Spots on leaves turn brown with yellow halos; on fruit, they are raised and scab-like.",
-        "solutions": [
-            "**Resistant Varieties:** Plant bell pepper varieties with resistance to bacterial spot.",
-            "**Sanitation:** Remove and destroy infected plant debris. Avoid working with plants when wet.",
-            "**Seed Treatment:** Use disease-free seeds or treat seeds with hot water.",
-            "**Copper Sprays:** Apply copper-based fungicides/bactericides as a preventative measure, but resistance can develop.",
-            "**Crop Rotation:** Rotate peppers with non-host crops.",
-            "**Spacing:** Provide adequate spacing for air circulation."
-        ]
-    },
-    "Pepper, bell - healthy": {
-        "description": "The bell pepper plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Well-draining, fertile soil rich in organic matter.",
-            "**Watering:** Consistent and even moisture. Avoid waterlogging.",
-            "**Fertilization:** Balanced fertilizer, especially during flowering and fruiting.",
-            "**Support:** Provide stakes or cages for support as fruit develops.",
-            "**Pest and Disease Monitoring:** Regular inspection."
-        ]
-    },
-    "Potato - Early blight": {
-        "description": "Fungal disease causing dark brown to black spots on leaves, often with concentric rings (target-like appearance). Primarily affects older leaves.",
-        "solutions": [
-            "**Resistant Varieties:** Plant early blight-resistant potato varieties.",
-            "**Crop Rotation:** Rotate potatoes with non-solanaceous crops for at least 2-3 years.",
-            "**Sanitation:** Remove and destroy infected plant debris at the end of the season.",
-            "**Fungicides:** Apply fungicides containing Chlorothalonil or Mancozeb as a preventative measure when disease pressure is high.",
-            "**Watering:** Avoid overhead watering. Water at the base of the plants.",
-            "**Plant Spacing:** Ensure adequate spacing for air circulation."
-        ]
-    },
-    "Potato - Late blight": {
-        "description": "Oomycete disease (not a true fungus) causing irregular, water-soaked lesions on leaves that rapidly turn brown/black, often with a fuzzy white growth on the undersides in humid conditions. Can quickly decimate crops. Affects tubers as well.",
-        "solutions": [
-            "**Resistant Varieties:** Plant late blight-resistant potato varieties.",
-            "**Sanitation:** Do not plant infected tubers. Destroy all volunteers and cull piles.",
-            "**Fungicides:** Apply highly effective systemic and protectant fungicides (e.g., those containing Propamocarb, Mancozeb, Chlorothalonil, or Fluazinam) on a regular schedule, especially during cool, wet weather.",
-            "**Hilling:** Hill soil around plants to prevent spores from reaching tubers.",
-            "**Air Circulation:** Ensure good air circulation.",
-            "**Remove Infected Plants:** Promptly remove and destroy any infected plants."
-        ]
-    },
-    "Potato - healthy": {
-        "description": "The potato plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Loose, well-drraining, slightly acidic to neutral soil.",
-            "**Watering:** Consistent and even moisture, especially during tuber development.",
-            "**Fertilization:** Balanced fertilizer, with emphasis on potassium.",
-            "**Hilling:** Regularly hill soil around plants to protect developing tubers from light and disease.",
-            "**Crop Rotation:** Practice good crop rotation.",
-            "**Disease-Free Seed:** Use certified disease-free seed potatoes."
-        ]
-    },
-    "Raspberry - healthy": {
-        "description": "The raspberry plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun to partial shade.",
-            "**Soil:** Well-draining, loamy soil with a pH of 6.0-6.5.",
-            "**Watering:** Consistent moisture, especially during fruiting.",
-            "**Support:** Provide trellising or support for canes.",
-            "**Pruning:** Regular pruning to remove old fruiting canes (floricanes) and thin new canes (primocanes) for better air circulation and light penetration.",
-            "**Mulching:** Apply mulch to conserve moisture and suppress weeds.",
-            "**Fertilization:** Annually with a balanced fertilizer, based on soil test results."
-        ]
-    },
-    "Soybean - healthy": {
-        "description": "The soybean plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Well-draining, fertile soil with appropriate pH.",
-            "**Watering:** Adequate moisture, especially during critical growth stages (flowering and pod fill).",
-            "**Crop Rotation:** Essential for managing soil-borne diseases and pests.",
-            "**Seed Treatment:** Use high-quality, treated seeds.",
-            "**Nutrient Management:** Proper fertilization based on soil tests.",
-            "**Weed Control:** Effective weed management."
-        ]
-    },
-    "Squash - Powdery mildew": {
-        "description": "Fungal disease causing a white, powdery growth on the surface of leaves and stems. Can lead to premature defoliation and reduced fruit quality.",
-        "solutions": [
-            "**Resistant Varieties:** Plant squash varieties with resistance to powdery mildew.",
-            "**Air Circulation:** Space plants adequately to promote good air circulation.",
-            "**Watering:** Water at the base of the plants to avoid wetting leaves.",
-            "**Fungicides:** Apply fungicides like Neem oil, Sulfur (avoid on sulfur-sensitive varieties), or Potassium Bicarbonate at the first sign of symptoms. Biological fungicides containing *Bacillus subtilis* can also be effective.",
-            "**Sanitation:** Remove and destroy infected leaves or entire plants at the end of the season."
-        ]
-    },
-    "Strawberry - Leaf scorch": {
-        "description": "Fungal disease causing purplish to reddish-brown spots on leaves that enlarge and coalesce, causing the leaf edges to 'scorch' and curl upwards. Can affect fruit development.",
-        "solutions": [
-            "**Sanitation:** Remove and destroy infected leaves and plant debris.",
-            "**Air Circulation:** Ensure good air circulation by proper plant spacing and removing excess runners.",
-            "**Fungicides:** Apply fungicides containing Myclobutanil or Chlorothalonil as a preventative measure, especially during wet periods.",
-            "**Resistant Varieties:** Plant leaf scorch-resistant strawberry varieties.",
-            "**Watering:** Water at the base of plants."
-        ]
-    },
-    "Strawberry - healthy": {
-        "description": "The strawberry plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun.",
-            "**Soil:** Well-draining, slightly acidic soil (pH 5.5-6.5) rich in organic matter.",
-            "**Watering:** Consistent and even moisture, especially during flowering and fruiting.",
-            "**Mulching:** Apply straw mulch around plants to conserve moisture, suppress weeds, and keep fruit clean.",
-            "**Runner Management:** Control runners to prevent overcrowding and maintain plant vigor.",
-            "**Fertilization:** Balanced fertilizer, especially after harvest.",
-            "**Renovation:** Consider renovating June-bearing plants after harvest for better production next year."
-        ]
-    },
-    "Tomato - Bacterial spot": {
-        "description": "Bacterial disease causing small, circular, water-soaked spots on leaves, stems, and fruit. Spots on leaves turn dark brown/black with yellow halos; on fruit, they are raised, scab-like, and often have a white halo.",
-        "solutions": [
-            "**Resistant Varieties:** Plant bacterial spot-resistant tomato varieties.",
-            "**Sanitation:** Remove and destroy infected plant debris. Avoid working with plants when wet.",
-            "**Seed Treatment:** Use disease-free seeds or treat seeds with hot water.",
-            "**Copper Sprays:** Apply copper-based bactericides preventatively. Can cause phytotoxicity.",
-            "**Crop Rotation:** Rotate tomatoes with non-solanaceous crops.",
-            "**Spacing:** Provide adequate spacing for air circulation."
-        ]
-    },
-    "Tomato - Early blight": {
-        "description": "Fungal disease causing dark brown to black spots on leaves, often with concentric rings (target-like appearance). Primarily affects older leaves.",
-        "solutions": [
-            "**Resistant Varieties:** Plant early blight-resistant tomato varieties.",
-            "**Crop Rotation:** Rotate tomatoes with non-solanaceous crops for at least 2-3 years.",
-            "**Sanitation:** Remove and destroy infected plant debris at the end of the season. Prune off lower, older leaves that touch the soil.",
-            "**Fungicides:** Apply fungicides containing Chlorothalonil or Mancozeb as a preventative measure when disease pressure is high.",
-            "**Watering:** Avoid overhead watering. Water at the base of the plants.",
-            "**Mulching:** Apply mulch to prevent splashing of spores from soil to leaves."
-        ]
-    },
-    "Tomato - Late blight": {
-        "description": "Oomycete disease (not a true fungus) causing irregular, water-soaked lesions on leaves that rapidly turn brown/black, often with a fuzzy white growth on the undersides in humid conditions. Can quickly decimate crops. Affects stems and fruit.",
-        "solutions": [
-            "**Resistant Varieties:** Plant late blight-resistant tomato varieties.",
-            "**Sanitation:** Do not plant infected transplants. Destroy all volunteer potato and tomato plants.",
-            "**Fungicides:** Apply highly effective systemic and protectant fungicides (e.g., those containing Propamocarb, Mancozeb, Chlorothalonil, or Fluazinam) on a regular schedule, especially during cool, wet weather.",
-            "**Air Circulation:** Ensure good air circulation.",
-            "**Remove Infected Plants:** Promptly remove and destroy any infected plants."
-        ]
-    },
-    "Tomato - Leaf Mold": {
-        "description": "Fungal disease causing pale green or yellow spots on the upper leaf surface, with olive-green to brown velvety patches on the corresponding undersides.",
-        "solutions": [
-            "**Air Circulation:** Good ventilation in greenhouses and proper spacing in gardens. Prune to improve airflow.",
-            "**Humidity Control:** Reduce humidity levels if growing in a greenhouse.",
-            "**Resistant Varieties:** Plant leaf mold-resistant tomato varieties.",
-            "**Fungicides:** Some fungicides (e.g., copper-based) can offer limited control, but cultural practices are key.",
-            "**Sanitation:** Remove infected leaves."
-        ]
-    },
-    "Tomato - Septoria leaf spot": {
-        "description": "Fungal disease causing numerous small, circular spots with dark brown borders and tan/gray centers, often with tiny black dots (fruiting bodies) in the center of the spot. Primarily affects lower leaves.",
-        "solutions": [
-            "**Sanitation:** Remove and destroy infected lower leaves. Clean up all plant debris at the end of the season.",
-            "**Watering:** Water at the base of the plants to avoid splashing spores.",
-            "**Mulching:** Apply mulch to prevent splashing from soil to leaves.",
-            "**Fungicides:** Apply fungicides containing Chlorothalonil or Mancozeb as a preventative measure.",
-            "**Staking/Caging:** Keep plants off the ground.",
-            "**Crop Rotation:** Rotate tomatoes."
-        ]
-    },
-    "Tomato - Spider mites Two-spotted spider mite": {
-        "description": "Tiny arachnids that feed on plant sap, causing stippling (tiny yellow/white dots) on leaves, bronze discoloration, and fine webbing, especially on the undersides of leaves.",
-        "solutions": [
-            "**Water Spray:** Strong spray of water to dislodge mites, especially on the undersides of leaves.",
-            "**Horticultural Oil/Insecticidal Soap:** Apply horticultural oils or insecticidal soaps, ensuring thorough coverage of both sides of leaves.",
-            "**Predatory Mites:** Introduce natural predators like predatory mites (*Phytoseiulus persimilis*) in enclosed environments.",
-            "**Humidity:** Increase humidity if possible, as spider mites prefer dry conditions.",
-            "**Remove Infested Leaves:** Remove and destroy heavily infested leaves."
-        ]
-    },
-    "Tomato - Target Spot": {
-        "description": "Fungal disease causing dark brown spots on leaves, often with concentric rings, similar to early blight but typically darker and more irregular. Can also affect stems and fruit.",
-        "solutions": [
-            "**Sanitation:** Remove and destroy infected plant debris.",
-            "**Crop Rotation:** Rotate tomatoes with non-solanaceous crops.",
-            "**Fungicides:** Apply fungicides containing Chlorothalonil or Mancozeb."
-        ]
-    },
-    "Tomato - Tomato Yellow Leaf Curl Virus": {
-        "description": "Viral disease transmitted by whiteflies. Causes severe stunting, upward curling and yellowing of leaf margins, and reduced fruit set.",
-        "solutions": [
-            "**Whitefly Control:** Control whitefly populations using insecticides (e.g., neonicotinoids, pyrethroids) or biological controls (e.g., predatory insects, parasitic wasps).",
-            "**Resistant Varieties:** Plant tomato varieties with genetic resistance or tolerance to TYLCV.",
-            "**Remove Infected Plants:** Immediately remove and destroy infected plants to prevent further spread.",
-            "**Row Covers:** Use fine mesh row covers to exclude whiteflies.",
-            "**Weed Control:** Control weeds that can host whiteflies or the virus."
-        ]
-    },
-    "Tomato - Tomato mosaic virus": {
-        "description": "Viral disease causing mosaic patterns (light and dark green patches) on leaves, leaf distortion, stunting, and reduced fruit production.",
-        "solutions": [
-            "**Sanitation:** Wash hands and disinfect tools thoroughly when working with tomatoes, as the virus is highly transmissible mechanically.",
-            "**Resistant Varieties:** Plant tomato varieties resistant to TMV.",
-            "**Remove Infected Plants:** Promptly remove and destroy infected plants.",
-            "**Avoid Tobacco Products:** Avoid smoking or using tobacco products around tomatoes, as tobacco can carry the virus.",
-            "**Weed Control:** Control weeds that may host the virus."
-        ]
-    },
-    "Tomato - healthy": {
-        "description": "The tomato plant appears healthy.",
-        "solutions": [
-            "**Location:** Full sun (at least 6-8 hours direct sunlight daily).",
-            "**Soil:** Well-draining, fertile soil rich in organic matter, with a pH of 6.0-6.8.",
-            "**Watering:** Consistent, deep watering at the base of the plant, especially during flowering and fruiting. Avoid overhead watering.",
-            "**Staking/Caging:** Provide strong support (stakes, cages, or trellises) for plants to keep fruit and foliage off the ground, improving air circulation.",
-            "**Pruning:** Remove suckers (side shoots) for indeterminate varieties to direct energy to fruit production. Remove lower leaves touching the soil.",
-            "**Mulching:** Apply a layer of mulch (straw, shredded leaves) to conserve moisture, suppress weeds, and prevent soil splash.",
-            "**Fertilization:** Balanced fertilizer, with emphasis on phosphorus and potassium during flowering and fruiting.",
-            "**Crop Rotation:** Rotate tomatoes with non-solanaceous crops to reduce soil-borne diseases."
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
+import itertools
+import json
+import os
+
+from batching import MicroBatcher
+from cache import PredictionCache, content_key
+from classes import CLASS_METADATA_VERSION, CLASS_NAMES, RESPONSE_FRAGMENTS, check_output_width
+from embeddings import EmbeddingIndex, IndexInUse
+from jobs import JobQueue, QueueFull
+from inference import DEFAULT_BUCKETS, InferenceEngine, TFLiteEngine, model_version, tflite_export_path
+from metrics import Registry, StageTimer
+import postprocess
+from preprocessing import (
+    IMAGE_SIZE, MAX_UPLOAD_BYTES, UnsupportedImage, UploadTooLarge, decode_image, decode_stream, inspect_upload,
+)
+from registry import ModelRegistry, ModelSlot, load_slot
+from tiling import TilingError, aggregate, tile_image, tile_report
+from tta import TTA_VIEWS, augment_timed, decode_views, source_size
+from uploads import TooManyImages, iter_upload_images
+from workers import BoundedPool, PoolFullError
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "trained_model.keras")
+# serve through the Keras model ("keras") or an exported TFLite file ("tflite")
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras")
+# by default the file export_tflite.py's default run writes for MODEL_PATH
+TFLITE_MODEL_PATH = os.environ.get("TFLITE_MODEL_PATH") or tflite_export_path(MODEL_PATH)
+# interpreter threads for the tflite backend, 0 lets TFLite decide
+TFLITE_THREADS = int(os.environ.get("TFLITE_THREADS", 0)) or None
+# TensorFlow thread pools for the keras backend, 0 keeps TensorFlow's default
+TF_INTRA_OP_THREADS = int(os.environ.get("TF_INTRA_OP_THREADS", 0))
+TF_INTER_OP_THREADS = int(os.environ.get("TF_INTER_OP_THREADS", 0))
+# batch sizes the engine prepares, each one costs its own activation memory
+ENGINE_BUCKETS = tuple(int(b) for b in os.environ.get("ENGINE_BUCKETS", ",".join(map(str, DEFAULT_BUCKETS))).split(","))
+# models that /models/load may swap in must live under this directory
+MODEL_DIR = os.path.realpath(os.environ.get("MODEL_DIR", os.path.dirname(os.path.abspath(__file__))))
+# the /models endpoints that change the served model require this in the X-Admin-Token header, and are off without it
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or None
+# set to keep an embedding index per model version here, for /similar and near-duplicate detection (keras backend)
+EMBEDDING_INDEX_DIR = os.environ.get("EMBEDDING_INDEX_DIR") or None
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", 256))
+EMBEDDING_DTYPE = os.environ.get("EMBEDDING_DTYPE", "int8")
+EMBEDDING_NPROBE = int(os.environ.get("EMBEDDING_NPROBE", 8))
+# cosine similarity from which an upload is a near-duplicate of a stored one and is not added again, 0 disables
+NEAR_DUPLICATE_SIMILARITY = float(os.environ.get("NEAR_DUPLICATE_SIMILARITY", 0.98))
+
+# model state, filled in by load_model() in a background thread once the server is up.
+# STARTUP["phase"] goes starting -> loading_model -> warming_up -> ready, or failed
+registry = ModelRegistry()
+STARTUP = {"phase": "starting", "error": None, "timings": {}}
+
+
+def set_phase(phase):
+    STARTUP["phase"] = phase
+    print(f"Startup phase '{phase}' at {time.perf_counter() - IMPORT_STARTED:.2f}s.")
+
+
+def load_model():
+    """
+    Load the configured model and warm it up. TensorFlow is only imported here,
+    so the server can answer health checks while this runs.
+    """
+    timings = STARTUP["timings"]
+    start = time.perf_counter()
+    set_phase("loading_model")
+    if INFERENCE_BACKEND == "tflite":
+        path = TFLITE_MODEL_PATH
+        loaded = TFLiteEngine(path, num_threads=TFLITE_THREADS, buckets=ENGINE_BUCKETS, warmup=False)
+        if EMBEDDING_INDEX_DIR:
+            print("Embeddings need the keras backend, /similar and near-duplicate detection are off.")
+    else:
+        import tensorflow as tf
+        timings["import_tensorflow_s"] = time.perf_counter() - start
+        # thread pools can only be sized before TensorFlow runs anything
+        if TF_INTRA_OP_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+        if TF_INTER_OP_THREADS:
+            tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+        path = MODEL_PATH
+        # trace the forward pass for each bucketed batch size
+        loaded = InferenceEngine(
+            tf.keras.models.load_model(path), buckets=ENGINE_BUCKETS, warmup=False, embeddings=bool(EMBEDDING_INDEX_DIR)
+        )
+    timings["load_model_s"] = time.perf_counter() - start
+    print(f"Model loaded ({INFERENCE_BACKEND}) in {timings['load_model_s']:.2f}s.")
+    # refuse to serve if the model and class_metadata.json disagree on the classes
+    check_output_width(loaded.num_classes)
+
+    set_phase("warming_up")
+    warm_start = time.perf_counter()
+    loaded.warmup()
+    timings["warmup_s"] = time.perf_counter() - warm_start
+    print(f"Warm-up inference took {timings['warmup_s']:.2f}s.")
+    # content hash of the model file, cached predictions are only reused for the same model
+    registry.activate(ModelSlot(loaded, path, model_version(path), timings["load_model_s"] + timings["warmup_s"]))
+
+
+# micro-batching settings, tune these to trade latency for throughput
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+# decode worker pool size and how many requests may be in flight before we return 503
+DECODE_WORKERS = int(os.environ.get("DECODE_WORKERS", min(4, os.cpu_count() or 1)))
+MAX_PENDING_REQUESTS = int(os.environ.get("MAX_PENDING_REQUESTS", 64))
+# how many images /predict/batch reads and decodes at a time
+BATCH_PREDICT_CHUNK = int(os.environ.get("BATCH_PREDICT_CHUNK", 32))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 1000))
+# largest request body /predict/batch and /jobs accept, in bytes
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 512 * 2**20))
+# prediction cache keyed by upload hash, set CACHE_DB_PATH to keep it across restarts
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10000))
+CACHE_TTL_S = float(os.environ.get("CACHE_TTL_S", 86400))
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH") or None
+# below this top-1 confidence (in percent) ask for a clearer photo instead of guessing, 0 disables
+ABSTAIN_CONFIDENCE = float(os.environ.get("ABSTAIN_CONFIDENCE", 0))
+ABSTAIN_MESSAGE = "Kindly take a clearer image of the plant leaf."
+# asynchronous /jobs queue, kept on disk so queued jobs survive a restart
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", "jobs.db")
+JOBS_UPLOAD_DIR = os.environ.get("JOBS_UPLOAD_DIR", "job_uploads")
+# finished jobs and their results are deleted this long after they complete
+JOBS_RETENTION_S = float(os.environ.get("JOBS_RETENTION_S", 86400))
+# images a job worker takes from the queue at a time, across jobs, so they share forward passes
+JOBS_CLAIM_SIZE = int(os.environ.get("JOBS_CLAIM_SIZE", 32))
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", 1))
+# a claimed image goes back in the queue if its worker has not finished it by then
+JOBS_LEASE_S = float(os.environ.get("JOBS_LEASE_S", 300))
+# POST /jobs returns 503 while this many images are still waiting
+JOBS_MAX_PENDING = int(os.environ.get("JOBS_MAX_PENDING", 10000))
+
+batcher = None
+pool = None
+cache = None
+jobs = None
+embedding_index = None
+job_workers = []
+# set when a job is submitted, so idle workers pick it up straight away
+jobs_wakeup = asyncio.Event()
+
+# prometheus metrics, served at /metrics
+metrics = Registry()
+REQUESTS = metrics.counter("plant_requests_total", "HTTP requests by route, method and status.", ("endpoint", "method", "status"))
+REQUEST_SECONDS = metrics.histogram("plant_request_seconds", "End-to-end request latency.", ("endpoint",))
+INFLIGHT = metrics.gauge("plant_inflight_requests", "Requests currently being handled.")
+ERRORS = metrics.counter("plant_errors_total", "Prediction errors by endpoint and exception type.", ("endpoint", "type"))
+STAGE_SECONDS = metrics.histogram("plant_stage_seconds", "Time spent in each stage of a prediction.", ("stage",))
+BATCH_SIZE = metrics.histogram("plant_batch_size", "Images per forward pass.", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+BATCH_SECONDS = metrics.histogram("plant_batch_seconds", "Duration of each batched forward pass.")
+PREDICTED_CLASS = metrics.counter("plant_predicted_class_total", "Predictions by top-1 class.", ("class_name",))
+ABSTAINED = metrics.counter("plant_abstained_total", "Predictions answered with a retake-photo message.", ("endpoint",))
+CONFIDENCE = metrics.histogram("plant_confidence", "Top-1 softmax probability.", buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99))
+metrics.gauge("plant_batch_queue_depth", "Images waiting for the next forward pass.", fn=lambda: batcher.queue_depth() if batcher else None)
+metrics.gauge("plant_pending_requests", "Requests holding a worker pool slot.", fn=lambda: pool.stats()["pending"] if pool else None)
+metrics.counter("plant_rejected_requests_total", "Requests turned away with 503 since startup.", fn=lambda: pool.stats()["rejected"] if pool else None)
+metrics.counter("plant_cache_hits_total", "Prediction cache hits since startup.", fn=lambda: cache.memory_hits + cache.disk_hits if cache else None)
+metrics.gauge("plant_shadow_agreement", "Top-1 agreement of the shadow model with the active one.",
+              fn=lambda: registry.shadow_stats()["agreement"] if registry.shadow else None)
+metrics.counter("plant_cache_misses_total", "Prediction cache misses since startup.", fn=lambda: cache.misses if cache else None)
+TILES_CLASSIFIED = metrics.histogram("plant_tiles_classified", "Tiles classified per tiled photo, after skipping background.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+NEAR_DUPLICATES = metrics.counter("plant_near_duplicates_total", "Uploads matching a stored embedding above the near-duplicate similarity.")
+metrics.gauge("plant_embedding_index_entries", "Embeddings stored for the active model.", fn=lambda: embedding_index.count if embedding_index else None)
+metrics.gauge("plant_jobs_pending_images", "Images in the job queue waiting for a result.", fn=lambda: jobs.pending() if jobs else None)
+
+
+def record_batch(size, seconds):
+    BATCH_SIZE.observe(size)
+    BATCH_SECONDS.observe(seconds)
+
+
+def record_batch_error(size, error):
+    # each request in the batch is also counted under its own endpoint when the error reaches it
+    ERRORS.inc(endpoint="batcher", type=type(error).__name__)
+    print(f"Batch of {size} failed: {type(error).__name__}: {error}")
+
+
+def predict_batch(input_arr):
+    """
+    Run one forward pass over a batch of preprocessed images. While an
+    embedding index is open, each row also carries the image's embedding.
+    """
+    return registry.predict(input_arr, embeddings=embedding_index is not None)
+
+
+def open_embedding_index(slot):
+    """
+    The embedding index for `slot`'s model, or None if embeddings are off or
+    the model cannot produce them. Each model version gets its own index, since
+    embeddings from different models are not comparable. An index can only
+    be open in one process, so it is off if another process has it.
+    """
+    if not EMBEDDING_INDEX_DIR or not slot.engine.embedding_dim:
+        return None
+    try:
+        return EmbeddingIndex(
+            os.path.join(EMBEDDING_INDEX_DIR, slot.version), slot.engine.embedding_dim,
+            dim=EMBEDDING_DIM, dtype=EMBEDDING_DTYPE, nprobe=EMBEDDING_NPROBE,
+        )
+    except IndexInUse as e:
+        print(f"Embedding index is off: {e}.")
+        return None
+
+
+def index_for(version):
+    """
+    The open embedding index if it belongs to model `version`, so embeddings
+    computed just before a model swap never land in the new model's index.
+    """
+    index = embedding_index
+    if index is not None and index.path == os.path.join(EMBEDDING_INDEX_DIR, version):
+        return index
+    return None
+
+
+async def start_serving():
+    """
+    Background part of startup: load and warm the model, then open the prediction path.
+    """
+    global batcher, cache, embedding_index
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, load_model)
+        batcher = MicroBatcher(predict_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                               on_batch=record_batch, on_error=record_batch_error)
+        await batcher.start()
+        cache = PredictionCache(registry.active.version, max_entries=CACHE_MAX_ENTRIES, ttl_s=CACHE_TTL_S, db_path=CACHE_DB_PATH)
+        cache.purge_expired()
+        embedding_index = open_embedding_index(registry.active)
+        job_workers.extend(asyncio.create_task(run_jobs()) for _ in range(max(1, JOBS_WORKERS)))
+        STARTUP["timings"]["ready_s"] = time.perf_counter() - IMPORT_STARTED
+        set_phase("ready")
+    except Exception as e:
+        print(f"Error loading TensorFlow model: {e}")
+        STARTUP["error"] = f"{type(e).__name__}: {e}"
+        set_phase("failed")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global pool, jobs
+    pool = BoundedPool(max_workers=DECODE_WORKERS, max_pending=MAX_PENDING_REQUESTS)
+    # jobs are accepted while the model loads, and ones whose worker died are picked up again
+    jobs = JobQueue(JOBS_DB_PATH, JOBS_UPLOAD_DIR, retention_s=JOBS_RETENTION_S, lease_s=JOBS_LEASE_S)
+    requeued = jobs.requeue_expired()
+    if requeued:
+        print(f"Requeued {requeued} job images whose worker stopped before finishing them.")
+    jobs.purge_expired()
+    # the model loads in the background so the server starts answering health checks right away
+    startup = asyncio.create_task(start_serving())
+    yield
+    await startup
+    # images a worker was in the middle of go back to the queue for other processes or the next start
+    for task in job_workers:
+        task.cancel()
+    await asyncio.gather(*job_workers, return_exceptions=True)
+    job_workers.clear()
+    jobs.release()
+    if batcher is not None:
+        await batcher.stop()
+    if cache is not None:
+        cache.close()
+    if embedding_index is not None:
+        embedding_index.close()
+    jobs.close()
+    pool.shutdown()
+
+
+# state of the last /models/load: idle, loading, shadowing or failed
+MODEL_SWAP = {"state": "idle", "path": None, "error": None}
+model_swap_task = None
+
+
+async def activate_slot(slot):
+    global embedding_index
+    registry.activate(slot)
+    # entries cached for the previous model are dropped, off the event loop in case they are on disk
+    await pool.run(cache.set_model_version, slot.version)
+    if embedding_index is not None:
+        index, embedding_index = embedding_index, None
+        await pool.run(index.close)
+    embedding_index = await pool.run(open_embedding_index, slot)
+    print(f"Now serving {slot.path} (version {slot.version}).")
+
+
+async def swap_model(path, shadow_rate):
+    """
+    Load and warm up `path` in the background, then either make it the active
+    model or run it in shadow on `shadow_rate` of the batches.
+    """
+    MODEL_SWAP.update(state="loading", path=path, error=None)
+    try:
+        slot = await asyncio.get_running_loop().run_in_executor(
+            None, load_slot, path, ENGINE_BUCKETS, TFLITE_THREADS, check_output_width, bool(EMBEDDING_INDEX_DIR)
+        )
+        if shadow_rate > 0:
+            registry.start_shadow(slot, shadow_rate)
+            MODEL_SWAP["state"] = "shadowing"
+            print(f"Shadowing {path} on {shadow_rate:.0%} of batches.")
+        else:
+            await activate_slot(slot)
+            MODEL_SWAP["state"] = "idle"
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        MODEL_SWAP.update(state="failed", error=f"{type(e).__name__}: {e}")
+
+
+def require_admin(request):
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Model management is off, set ADMIN_TOKEN to turn it on.")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Missing or wrong X-Admin-Token header.")
+
+
+def resolve_model_path(path):
+    full = os.path.realpath(os.path.join(MODEL_DIR, path))
+    if os.path.commonpath([full, MODEL_DIR]) != MODEL_DIR or not full.endswith((".keras", ".tflite")):
+        raise HTTPException(status_code=400, detail=f"Model must be a .keras or .tflite file under {MODEL_DIR}.")
+    if not os.path.isfile(full):
+        raise HTTPException(status_code=404, detail=f"No model file at {path}.")
+    return full
+
+
+def require_ready():
+    """
+    Reject prediction requests until the model is loaded and warmed up.
+    """
+    if STARTUP["phase"] == "failed":
+        raise HTTPException(status_code=500, detail="Model not loaded. Please check server logs.")
+    if STARTUP["phase"] != "ready":
+        raise HTTPException(status_code=503, detail="Model is still loading, please retry shortly.", headers={"Retry-After": "5"})
+
+
+def lookup_cached(key, views=1):
+    # averaged test-time augmentation results are cached separately per view count
+    if views > 1:
+        key += f":tta{views}"
+    return key, cache.get(key)
+
+
+def lookup_bytes(contents, views=1):
+    return lookup_cached(content_key(contents), views)
+
+
+def lookup_upload(fileobj, views=1):
+    # checks format, dimensions and size while hashing, before anything is decoded
+    return lookup_cached(inspect_upload(fileobj), views)
+
+
+def decode_bytes(contents, views, timings):
+    if views > 1:
+        return decode_views(contents, views, IMAGE_SIZE, timings)
+    return decode_image(contents, IMAGE_SIZE, timings)
+
+
+def decode_upload(fileobj, views, timings):
+    image = decode_stream(fileobj, source_size(views), timings)
+    return augment_timed(image, views, IMAGE_SIZE, timings) if views > 1 else image
+
+
+def remember_embedding(index, embedding, prediction, key):
+    """
+    Add an upload's embedding to the index, unless it is a near-duplicate of
+    one already there. Returns the stored entry it duplicates, or None.
+    """
+    top = int(np.argmax(prediction))
+    duplicate = index.add_if_new(embedding, top, float(prediction[top]), key, NEAR_DUPLICATE_SIMILARITY)
+    if duplicate is None:
+        return None
+    NEAR_DUPLICATES.inc()
+    entry_id, similarity = duplicate
+    entry = index.entries([entry_id])[0]
+    return {"id": entry_id, "similarity": round(similarity, 4), "predicted_class": CLASS_NAMES[entry["class_index"]]}
+
+
+async def classify(contents, timer=None, views=1, info=None):
+    """
+    Softmax output for one uploaded image, given as bytes or as a file object
+    that is read in chunks. Uploads seen before are answered from the cache
+    without decoding the image again. Stage durations go to `timer`.
+
+    With `views` > 1 the image is decoded once, augmented into that many views,
+    and the views' predictions from one forward pass are averaged.
+
+    While an embedding index is open, a new upload's embedding is stored in it,
+    and if it is a near-duplicate of a stored one that entry is put in
+    `info["near_duplicate_of"]` instead.
+    """
+    timer = timer or StageTimer(STAGE_SECONDS)
+    streamed = not isinstance(contents, bytes)
+    # hashing and the on-disk lookup happen off the event loop
+    with timer.stage("cache_lookup"):
+        key, prediction = await pool.run(lookup_upload if streamed else lookup_bytes, contents, views)
+    if prediction is None:
+        # a model swap while this request is in flight must not cache its result under the new model
+        version = registry.active.version
+        # decode and resize off the event loop
+        timings = {}
+        input_arr = await pool.run(decode_upload if streamed else decode_bytes, contents, views, timings)
+        timer.update(timings)
+        # Make prediction, batched together with any concurrent requests
+        with timer.stage("inference"):
+            if views > 1:
+                # the views get a forward pass of their own, so they are never split between batches
+                prediction = (await batcher.submit_batch(input_arr)).mean(axis=0)
+            else:
+                prediction = await batcher.submit(input_arr)
+        # rows carry the embedding after the class probabilities when the index is on
+        prediction, embedding = prediction[:len(CLASS_NAMES)], prediction[len(CLASS_NAMES):]
+        await pool.run(cache.put, key, prediction, version)
+        index = index_for(version)
+        if index is not None and embedding.size:
+            with timer.stage("embedding_index"):
+                duplicate = await pool.run(remember_embedding, index, embedding, prediction, key)
+            if duplicate is not None and info is not None:
+                info["near_duplicate_of"] = duplicate
+    top = int(np.argmax(prediction))
+    PREDICTED_CLASS.inc(class_name=CLASS_NAMES[top])
+    CONFIDENCE.observe(float(prediction[top]))
+    return prediction
+
+
+async def classify_tiles(contents, tiles, overlap, min_green, mask=None, timer=None):
+    """
+    Verdict for a photo of many leaves, given as bytes or a file object, plus
+    the per-tile report. The photo is split into `tiles` tiles across its
+    shorter side, tiles with too little green are skipped and the rest are
+    classified in one forward pass. Tiled results are not cached.
+    """
+    timer = timer or StageTimer(STAGE_SECONDS)
+    if not isinstance(contents, bytes):
+        # format, dimensions and size are checked before anything is decoded
+        with timer.stage("inspect"):
+            await pool.run(inspect_upload, contents)
+    timings = {}
+    tiled = await pool.run(tile_image, contents, tiles, overlap, min_green, IMAGE_SIZE, timings)
+    timer.update(timings)
+    TILES_CLASSIFIED.observe(len(tiled.images))
+    with timer.stage("inference"):
+        rows = await batcher.submit_batch(tiled.images)
+    prediction, probs = aggregate(rows[:, :len(CLASS_NAMES)], mask)
+    top = int(np.argmax(prediction))
+    PREDICTED_CLASS.inc(class_name=CLASS_NAMES[top])
+    CONFIDENCE.observe(float(prediction[top]))
+    return prediction, tile_report(tiled, probs)
+
+
+def check_tiling(tiles, tta):
+    if tiles and tta > 1:
+        raise HTTPException(status_code=400, detail="tiles and tta cannot be combined.")
+
+
+def parse_crop(crop):
+    """
+    Output mask for the `crop` query parameter, None when it is not set.
+    """
+    if not crop:
+        return None
+    try:
+        return postprocess.crop_mask(crop)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def rank(prediction, top_k=0, mask=None, min_confidence=None):
+    """
+    Top-1 result for one softmax vector, plus the top-k alternatives when asked,
+    restricted to the classes in `mask`. All of it comes from one argpartition.
+    """
+    k = max(top_k, 1)
+    if mask is not None:
+        prediction = postprocess.restrict(prediction, mask)
+        # never pad the list with other crops' classes
+        k = min(k, int(mask.sum()))
+    indices, probs = postprocess.top_k(prediction, k)
+    result_index = int(indices[0])
+    confidence = float(probs[0]) * 100
+    result = {"class_index": result_index, "predicted_class": CLASS_NAMES[result_index], "confidence": f"{confidence:.2f}%"}
+    threshold = ABSTAIN_CONFIDENCE if min_confidence is None else min_confidence
+    if confidence < threshold:
+        result.update(predicted_class=None, abstained=True, message=ABSTAIN_MESSAGE)
+    if top_k:
+        result["top_k"] = [
+            {"class_index": int(i), "predicted_class": CLASS_NAMES[i], "confidence": f"{float(p) * 100:.2f}%"}
+            for i, p in zip(indices, probs)
         ]
-    },
-}
+    return result
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def run_job_image(job_id, idx, path, params):
+    try:
+        contents = await pool.run(read_file, path)
+        mask = postprocess.crop_mask(params["crop"]) if params["crop"] else None
+        # jobs queued before tiling existed have no tiles parameter
+        if params.get("tiles"):
+            prediction, report = await classify_tiles(contents, params["tiles"], params["tile_overlap"], params["min_green"], mask)
+        else:
+            prediction, report = await classify(contents, views=params["tta"]), None
+        ranked = rank(prediction, params["top_k"], mask, params["min_confidence"])
+        if report is not None:
+            ranked["tiles"] = report
+        if ranked.get("abstained"):
+            ABSTAINED.inc(endpoint="/jobs")
+        return job_id, idx, ranked, None
+    except Exception as e:
+        ERRORS.inc(endpoint="/jobs", type=type(e).__name__)
+        return job_id, idx, None, f"Error processing image: {e}"
 
 
+async def run_jobs():
+    """
+    Job worker: take queued images from any job, classify them together so
+    they share forward passes, and store the results.
+    """
+    last_purge = time.monotonic()
+    while True:
+        try:
+            if time.monotonic() - last_purge > 60:
+                await pool.run(jobs.requeue_expired)
+                await pool.run(jobs.purge_expired)
+                last_purge = time.monotonic()
+            jobs_wakeup.clear()
+            claimed = await pool.run(jobs.claim, JOBS_CLAIM_SIZE)
+            if not claimed:
+                try:
+                    await asyncio.wait_for(jobs_wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            outcomes = await asyncio.gather(*[run_job_image(*item) for item in claimed])
+            await pool.run(jobs.complete, outcomes)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Job worker error: {e}")
+            await asyncio.sleep(1)
+
 
 # initialising app
 app = FastAPI(
     title="Plant Disease Prediction API",
     description="An API to predict plant diseases using a TensorFlow model.",
     docs_url=None, 
-    redoc_url=None 
+    redoc_url=None,
+    lifespan=lifespan
 )
 
+
+# turn away oversized uploads from their Content-Length,
+# before the multipart body is received and spooled
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    length = request.headers.get("content-length")
+    path = request.url.path
+    # leave room for the multipart boundaries and part headers
+    if path == "/predict/" and length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + 64 * 1024:
+        return JSONResponse(status_code=413, content={"detail": f"Upload is larger than the {MAX_UPLOAD_BYTES} byte limit."})
+    if request.method == "POST" and path in ("/predict/batch", "/jobs"):
+        # many files are spooled to disk, so their total has to be known up front
+        if not (length and length.isdigit()):
+            return JSONResponse(status_code=411, content={"detail": "Uploads to this endpoint need a Content-Length header."})
+        if int(length) > MAX_REQUEST_BYTES:
+            return JSONResponse(status_code=413, content={"detail": f"Request is larger than the {MAX_REQUEST_BYTES} byte limit."})
+    return await call_next(request)
+
+
+# count every request and time it end to end
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    INFLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        INFLIGHT.dec()
+    # label by route template rather than raw path, so /hello/{name} stays one series
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", "unmatched")
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    return response
+
 # creating my custom Swagger UI and ReDoc endpoints
 from fastapi.openapi.docs import get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
 
@@ -457,6 +623,31 @@ async def root():
                    "This API allows you to upload an image of a plant leaf and get a prediction of its health status. \n \n \n"
                    "The following crops are supported: Apple, Blueberry, Cherry (including sour), Corn (maize), Grape, Orange, Peach, Pepper (bell), Potato, Raspberry, Soybean, Squash, Strawberry, and Tomato."}
 
+# liveness probe: the process is up and the model has not failed to load
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness check. Answers as soon as the server starts, and fails only if
+    model loading failed, so the orchestrator restarts a broken process.
+    """
+    if STARTUP["phase"] == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": STARTUP["error"]})
+    return {"status": "alive", "phase": STARTUP["phase"]}
+
+# readiness probe: the model is loaded and warmed up
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness check. Returns 200 only once the model is loaded and warmed up,
+    with the time each startup phase took.
+    """
+    body = {"status": STARTUP["phase"], "model_version": registry.active.version if registry.active else None,
+            "class_metadata_version": CLASS_METADATA_VERSION, "timings": STARTUP["timings"]}
+    if STARTUP["phase"] != "ready":
+        body["error"] = STARTUP["error"]
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 # endpoint to greet a name
 @app.get('/hello/{name}')
 async def get_hello_name(name: str):
@@ -467,60 +658,415 @@ async def get_hello_name(name: str):
 
 # endpoint to predict plant disease
 @app.post("/predict/")
-async def predict_image(file: UploadFile = File(...)):
+async def predict_image(
+    request: Request,
+    file: UploadFile = File(...),
+    top_k: int = Query(0, ge=0, le=len(CLASS_NAMES), description="Also return the k most likely classes."),
+    crop: str | None = Query(None, description="Only consider this crop's classes, e.g. Tomato."),
+    min_confidence: float | None = Query(None, ge=0, le=100, description="Percent below which the API asks for a clearer photo."),
+    tta: int = Query(1, ge=1, le=len(TTA_VIEWS), description="Average over this many augmented views of the image."),
+    tiles: int = Query(0, ge=0, le=16, description="Split a photo of many leaves into up to this many overlapping tiles across its shorter side and classify each."),
+    tile_overlap: float = Query(0.25, ge=0, le=0.75, description="Fraction by which neighbouring tiles overlap."),
+    min_green: float = Query(0.15, ge=0, le=1, description="Skip tiles with less than this fraction of green pixels."),
+):
     """
     Upload an image file and get a plant disease prediction.
+
+    For a photo of many leaves, set `tiles` to classify overlapping tiles of
+    it instead of the whole frame. The response then also has a `tiles` object
+    with every classified tile's prediction and box, and heatmap grids of the
+    top class and disease probability per tile.
+
+    Send an `X-Timing: 1` header to get a per-stage breakdown back in the
+    `Server-Timing` response header.
     """
-    if model is None:
-        raise HTTPException(status_code=500, detail="Model not loaded. Please check server logs.")
+    require_ready()
+    mask = parse_crop(crop)
+    check_tiling(tiles, tta)
 
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Uploaded file is not an image.")
 
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload is larger than the {MAX_UPLOAD_BYTES} byte limit.")
+
+    timer = StageTimer(STAGE_SECONDS)
+    info = {}
     try:
-        # Read image content
-        contents = await file.read()
-        # Open image using PIL
-        image = Image.open(io.BytesIO(contents))
-
-        # Preprocess the image for the model
-        # Resize image to target_size (128, 128)
-        image = image.resize((128, 128))
-        # Convert PIL Image to TensorFlow array
-        input_arr = tf.keras.preprocessing.image.img_to_array(image)
-        # Expand dimensions to create a batch of 1 image
-        input_arr = np.array([input_arr])
-
-          # Make prediction
-        prediction = model.predict(input_arr)
-        result_index = np.argmax(prediction)
-
-        # Get class name (assuming CLASS_NAMES is defined globally)
-        predicted_class_name = CLASS_NAMES[result_index] if CLASS_NAMES and 0 <= result_index < len(CLASS_NAMES) else f"Class Index: {result_index}"
-
-         # Apply the confidence condition
-        confidence = float(np.max(prediction)* 100)
-        # if confidence < 80:
-        #     return {
-        #         "message": "Kindly take a clearer image of the plant leaf."
-        #     }
-
-        # Retrieve disease info
-        disease_info = PLANT_DISEASE_INFO.get(predicted_class_name, {
-            "description": "No detailed information available for this disease.",
-            "solutions": ["Consult with a local agricultural expert for guidance."]
-        })
-
-        return {
-            "predicted_class": predicted_class_name,
-            "confidence": f"{confidence:.2f}%",
-            "description": disease_info["description"],
-            "solutions": disease_info["solutions"]
-        }
+        async with pool.slot():
+            if tiles:
+                prediction, info["tiles"] = await classify_tiles(file.file, tiles, tile_overlap, min_green, mask, timer)
+            else:
+                # the upload is hashed, checked and decoded in chunks, never read whole
+                prediction = await classify(file.file, timer, tta, info)
+        with timer.stage("response"):
+            ranked = rank(prediction, top_k, mask, min_confidence)
+            ranked.update(info)
+            if ranked.get("abstained"):
+                ABSTAINED.inc(endpoint="/predict/")
+                keys = ("message", "abstained", "confidence", "top_k", "near_duplicate_of", "tiles")
+                result = JSONResponse({key: ranked[key] for key in keys if key in ranked})
+            else:
+                # the class's description and solutions were serialized once at startup
+                head, tail = RESPONSE_FRAGMENTS[ranked["class_index"]]
+                body = head + json.dumps(ranked["confidence"]).encode() + tail
+                for key in ("top_k", "near_duplicate_of", "tiles"):
+                    if key in ranked:
+                        body += f',"{key}":'.encode() + json.dumps(ranked[key], separators=(",", ":")).encode()
+                result = Response(body + b"}", media_type="application/json")
+        if request.headers.get("x-timing"):
+            result.headers["Server-Timing"] = timer.server_timing()
+        return result
 
+    except PoolFullError as e:
+        ERRORS.inc(endpoint="/predict/", type=type(e).__name__)
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly.", headers={"Retry-After": "1"})
+    except UploadTooLarge as e:
+        ERRORS.inc(endpoint="/predict/", type=type(e).__name__)
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImage as e:
+        ERRORS.inc(endpoint="/predict/", type=type(e).__name__)
+        raise HTTPException(status_code=415, detail=str(e))
+    except TilingError as e:
+        ERRORS.inc(endpoint="/predict/", type=type(e).__name__)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        ERRORS.inc(endpoint="/predict/", type=type(e).__name__)
         raise HTTPException(status_code=500, detail=f"Error processing image or making prediction: {e}")
 
+# endpoint to find stored uploads that look like this one
+@app.post("/similar")
+async def similar_images(
+    file: UploadFile = File(...),
+    k: int = Query(5, ge=1, le=100, description="How many similar past uploads to return."),
+):
+    """
+    Upload an image and get the most similar past uploads from the embedding
+    index, best first, with the cosine similarity and the class each was
+    predicted as. The upload itself is not added to the index.
+    """
+    require_ready()
+    index = embedding_index
+    if index is None:
+        raise HTTPException(status_code=404, detail="The embedding index is off, set EMBEDDING_INDEX_DIR to enable it.")
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload is larger than the {MAX_UPLOAD_BYTES} byte limit.")
+    try:
+        async with pool.slot():
+            await pool.run(inspect_upload, file.file)
+            row = await batcher.submit(await pool.run(decode_upload, file.file, 1, {}))
+            prediction, embedding = row[:len(CLASS_NAMES)], row[len(CLASS_NAMES):]
+            if not embedding.size:
+                raise HTTPException(status_code=503, detail="The model is being swapped, please retry shortly.", headers={"Retry-After": "1"})
+            start = time.perf_counter()
+            ids, scores = await pool.run(index.search, embedding, k)
+            search_ms = (time.perf_counter() - start) * 1000.0
+    except PoolFullError:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly.", headers={"Retry-After": "1"})
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    similar = [
+        dict(entry, predicted_class=CLASS_NAMES[entry["class_index"]], similarity=float(score))
+        for entry, score in zip(index.entries(ids), scores)
+    ]
+    top = int(np.argmax(prediction))
+    return {"predicted_class": CLASS_NAMES[top], "confidence": f"{float(prediction[top]) * 100:.2f}%",
+            "entries": index.count, "search_ms": search_ms, "similar": similar}
+
+def read_item(read):
+    try:
+        return read()
+    except UploadTooLarge as e:
+        # reported on the image's own line, the rest of the upload goes on
+        return e
+
+
+def read_chunk(items, size):
+    """
+    Pull up to `size` (name, bytes) pairs from an upload iterator. An image
+    over the size limit comes back as its UploadTooLarge instead of its bytes.
+    """
+    return [(name, read_item(read)) for name, read in itertools.islice(items, size)]
+
+
+async def classify_or_error(contents, views=1, tiling=None):
+    """
+    (prediction, tile report or None, error) for one image of a batch.
+    `tiling` is (tiles, overlap, min_green, mask) to classify it tiled.
+    """
+    try:
+        if isinstance(contents, UploadTooLarge):
+            raise contents
+        if tiling is not None:
+            prediction, report = await classify_tiles(contents, *tiling)
+            return prediction, report, None
+        return await classify(contents, views=views), None, None
+    except Exception as e:
+        ERRORS.inc(endpoint="/predict/batch", type=type(e).__name__)
+        return None, None, str(e)
+
+
+# endpoint to predict many images in one request
+# the multipart body is parsed by hand so the uploads stay open while the response streams
+@app.post("/predict/batch", openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["files"],
+    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+}}}}})
+async def predict_image_batch(
+    request: Request,
+    top_k: int = Query(0, ge=0, le=len(CLASS_NAMES), description="Also return the k most likely classes."),
+    crop: str | None = Query(None, description="Only consider this crop's classes, e.g. Tomato."),
+    min_confidence: float | None = Query(None, ge=0, le=100, description="Percent below which the API asks for a clearer photo."),
+    tta: int = Query(1, ge=1, le=len(TTA_VIEWS), description="Average over this many augmented views of the image."),
+    tiles: int = Query(0, ge=0, le=16, description="Split a photo of many leaves into up to this many overlapping tiles across its shorter side and classify each."),
+    tile_overlap: float = Query(0.25, ge=0, le=0.75, description="Fraction by which neighbouring tiles overlap."),
+    min_green: float = Query(0.15, ge=0, le=1, description="Skip tiles with less than this fraction of green pixels."),
+):
+    """
+    Upload many images, or zip/tar archives of images, in the `files` field and
+    get one JSON line back per image as soon as its batch has been classified.
+    """
+    require_ready()
+    mask = parse_crop(crop)
+    check_tiling(tiles, tta)
+    tiling = (tiles, tile_overlap, min_green, mask) if tiles else None
+    try:
+        # one slot covers the whole stream, released when the stream ends
+        pool.acquire()
+    except PoolFullError:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly.", headers={"Retry-After": "1"})
+    try:
+        form = await request.form(max_files=BATCH_MAX_FILES)
+    except Exception as e:
+        pool.release()
+        raise HTTPException(status_code=400, detail=f"Could not parse upload: {e}")
+    files = [f for f in form.getlist("files") if not isinstance(f, str)]
+    if not files:
+        pool.release()
+        await form.close()
+        raise HTTPException(status_code=400, detail="No files uploaded in the 'files' field.")
+
+    async def results():
+        try:
+            items = iter_upload_images(files, MAX_UPLOAD_BYTES)
+            while True:
+                try:
+                    # archive members are read off the event loop, one chunk at a time
+                    chunk = await pool.run(read_chunk, items, BATCH_PREDICT_CHUNK)
+                except Exception as e:
+                    yield json.dumps({"error": f"Error reading upload: {e}"}) + "\n"
+                    break
+                if not chunk:
+                    break
+                outcomes = await asyncio.gather(*[classify_or_error(contents, tta, tiling) for _, contents in chunk])
+                for (name, _), (prediction, report, err) in zip(chunk, outcomes):
+                    if err is not None:
+                        yield json.dumps({"filename": name, "error": f"Error processing image: {err}"}) + "\n"
+                        continue
+                    ranked = rank(prediction, top_k, mask, min_confidence)
+                    if report is not None:
+                        ranked["tiles"] = report
+                    if ranked.get("abstained"):
+                        ABSTAINED.inc(endpoint="/predict/batch")
+                    yield json.dumps({"filename": name, **ranked}) + "\n"
+        finally:
+            await form.close()
+            pool.release()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+# asynchronous jobs: the upload is stored and queued, results are fetched later from /jobs/{id}
+@app.post("/jobs", status_code=202, openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["files"],
+    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+}}}}})
+async def submit_job(
+    request: Request,
+    top_k: int = Query(0, ge=0, le=len(CLASS_NAMES), description="Also return the k most likely classes."),
+    crop: str | None = Query(None, description="Only consider this crop's classes, e.g. Tomato."),
+    min_confidence: float | None = Query(None, ge=0, le=100, description="Percent below which the API asks for a clearer photo."),
+    tta: int = Query(1, ge=1, le=len(TTA_VIEWS), description="Average over this many augmented views of the image."),
+    tiles: int = Query(0, ge=0, le=16, description="Split a photo of many leaves into up to this many overlapping tiles across its shorter side and classify each."),
+    tile_overlap: float = Query(0.25, ge=0, le=0.75, description="Fraction by which neighbouring tiles overlap."),
+    min_green: float = Query(0.15, ge=0, le=1, description="Skip tiles with less than this fraction of green pixels."),
+):
+    """
+    Upload images, or zip/tar archives of images, in the `files` field and get
+    a job id back straight away. Poll `GET /jobs/{id}` for the results, which
+    are kept for `JOBS_RETENTION_S` seconds after the job completes.
+    """
+    if STARTUP["phase"] == "failed":
+        require_ready()
+    parse_crop(crop)
+    check_tiling(tiles, tta)
+    pending = await pool.run(jobs.pending)
+    if pending >= JOBS_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Job queue is full, please retry later.", headers={"Retry-After": "30"})
+    try:
+        form = await request.form(max_files=BATCH_MAX_FILES)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse upload: {e}")
+    try:
+        files = [f for f in form.getlist("files") if not isinstance(f, str)]
+        if not files:
+            raise HTTPException(status_code=400, detail="No files uploaded in the 'files' field.")
+        params = {"top_k": top_k, "crop": crop, "min_confidence": min_confidence, "tta": tta,
+                  "tiles": tiles, "tile_overlap": tile_overlap, "min_green": min_green}
+        # stop unpacking as soon as the upload would overfill the queue, before storing the rest
+        images = iter_upload_images(files, MAX_UPLOAD_BYTES, JOBS_MAX_PENDING - pending)
+        try:
+            job_id, total = await pool.run(jobs.create, images, params, JOBS_MAX_PENDING)
+        except TooManyImages as e:
+            if pending == 0:
+                raise HTTPException(status_code=413, detail=f"{e} A job takes at most {JOBS_MAX_PENDING}.")
+            raise HTTPException(status_code=503, detail="Job queue is full, please retry later.", headers={"Retry-After": "30"})
+        except QueueFull:
+            raise HTTPException(status_code=503, detail="Job queue is full, please retry later.", headers={"Retry-After": "30"})
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await form.close()
+    jobs_wakeup.set()
+    return {"id": job_id, "status": "queued", "total": total, "url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status of a job and the result of every image finished so far.
+    """
+    job = await pool.run(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such job, or its results have expired.")
+    return job
+
+# endpoint for prometheus to scrape
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Request, latency, batching, error and prediction metrics in Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type=metrics.content_type)
+
+# endpoint to inspect the micro-batching scheduler
+@app.get("/stats/batching")
+async def batching_stats():
+    """
+    Batch-size and queue-depth statistics for the prediction scheduler.
+    """
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="Batcher not running.")
+    return batcher.stats()
+
+# endpoint to inspect the prediction cache
+@app.get("/stats/cache")
+async def cache_stats():
+    """
+    Hit/miss counters and size of the prediction cache.
+    """
+    if cache is None:
+        raise HTTPException(status_code=503, detail="Cache not running.")
+    return cache.stats()
+
+# endpoint to inspect the decode worker pool
+@app.get("/stats/workers")
+async def worker_stats():
+    """
+    Occupancy and rejection counts for the decode worker pool.
+    """
+    if pool is None:
+        raise HTTPException(status_code=503, detail="Worker pool not running.")
+    return pool.stats()
+
+# endpoint to inspect the job queue
+@app.get("/stats/jobs")
+async def job_stats():
+    """
+    Jobs and images in the queue by status.
+    """
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="Job queue not open.")
+    return await pool.run(jobs.stats)
+
+# endpoint to inspect the embedding index
+@app.get("/stats/embeddings")
+async def embedding_stats():
+    """
+    Size, layout and partitioning of the active model's embedding index.
+    """
+    if embedding_index is None:
+        raise HTTPException(status_code=404, detail="The embedding index is off.")
+    return embedding_index.stats()
+
+# model registry: hot swap and shadow serving without a restart
+@app.get("/models")
+async def list_models():
+    """
+    The active model, the shadow candidate with its agreement and latency
+    against the active one, and the state of the last load.
+    """
+    stats = registry.stats()
+    if stats["shadow"]:
+        for d in stats["shadow"]["recent_disagreements"]:
+            d["active_class_name"] = CLASS_NAMES[d["active_class"]]
+            d["shadow_class_name"] = CLASS_NAMES[d["shadow_class"]]
+    return dict(stats, swap=MODEL_SWAP)
+
+@app.post("/models/load", status_code=202)
+async def load_candidate(
+    request: Request,
+    path: str = Query(..., description="Model file, relative to the model directory."),
+    shadow_rate: float = Query(0.0, ge=0, le=1, description="Run in shadow on this fraction of batches instead of switching."),
+):
+    """
+    Load a model in the background. With `shadow_rate` 0 it replaces the active
+    model as soon as it is warmed up, otherwise it runs in shadow until promoted.
+    Live requests keep being served by the current model throughout.
+    """
+    global model_swap_task
+    require_admin(request)
+    require_ready()
+    full = resolve_model_path(path)
+    if MODEL_SWAP["state"] == "loading":
+        raise HTTPException(status_code=409, detail=f"Already loading {MODEL_SWAP['path']}.")
+    if registry.shadow is not None:
+        raise HTTPException(status_code=409, detail="A model is already in shadow, promote or stop it first.")
+    MODEL_SWAP.update(state="loading", path=full, error=None)
+    model_swap_task = asyncio.create_task(swap_model(full, shadow_rate))
+    return {"status": "loading", "path": full, "shadow_rate": shadow_rate}
+
+@app.post("/models/promote")
+async def promote_candidate(request: Request):
+    """
+    Make the shadow candidate the active model.
+    """
+    require_admin(request)
+    if registry.shadow is None:
+        raise HTTPException(status_code=409, detail="No model is running in shadow.")
+    # waits for a running shadow prediction, so off the event loop
+    slot = await asyncio.get_running_loop().run_in_executor(None, registry.promote)
+    await activate_slot(slot)
+    MODEL_SWAP["state"] = "idle"
+    return {"active": slot.info()}
+
+@app.delete("/models/shadow")
+async def stop_shadow(request: Request):
+    """
+    Stop shadowing and release the candidate.
+    """
+    require_admin(request)
+    slot = await asyncio.get_running_loop().run_in_executor(None, registry.stop_shadow)
+    if slot is None:
+        raise HTTPException(status_code=409, detail="No model is running in shadow.")
+    MODEL_SWAP["state"] = "idle"
+    return {"stopped": slot.info()}
+
+STARTUP["timings"]["import_s"] = time.perf_counter() - IMPORT_STARTED
+print(f"App imported in {STARTUP['timings']['import_s']:.2f}s, model will load in the background.")
+
 # --- Main execution block for Uvicorn ---
 if __name__ == "__main__":
     # Ensure Uvicorn runs the correct app instance
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from preprocessing import BatchBuffer
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-image requests into one batched forward pass.
+
+    Requests are queued and flushed together as soon as either `max_batch_size`
+    images are waiting or the oldest one has waited `max_wait_ms`. If given,
+    `on_batch(size, seconds)` is called after every forward pass and
+    `on_error(size, exception)` when a queued batch fails, instead of printing it.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, on_batch=None, on_error=None):
+        self.predict_fn = predict_fn
+        self.on_batch = on_batch
+        self.on_error = on_error
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = None
+        self._task = None
+        # a single thread so only one forward pass runs at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+        # only one flush runs at a time, so one reusable input buffer is enough
+        self._buffer = BatchBuffer(self.max_batch_size)
+        self._batch_sizes = Counter()
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._last_batch_ms = 0.0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, input_arr):
+        """
+        Queue one decoded image (H, W, C) and wait for its prediction row.
+        """
+        if self._queue is None:
+            raise RuntimeError("Batcher has not been started.")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((input_arr, future))
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def submit_batch(self, arrays):
+        """
+        Run images that belong together, e.g. the tiles of one photo or the
+        augmented views of one image, as one forward pass of their own instead
+        of spreading them over queued batches. The pass still runs on the
+        batcher's thread, so it never overlaps another one.
+        """
+        if self._queue is None:
+            raise RuntimeError("Batcher has not been started.")
+        inputs = np.asarray(arrays, np.float32)
+        start = time.perf_counter()
+        predictions = await asyncio.get_running_loop().run_in_executor(self._executor, self.predict_fn, inputs)
+        self._record(len(inputs), time.perf_counter() - start)
+        return predictions
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # take whatever is already queued before waiting on the clock
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        # drop callers that went away while queued
+        batch = [(arr, fut) for arr, fut in batch if not fut.done()]
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            # a bad input, e.g. one of the wrong shape, fails the batch it is in, not the batcher
+            inputs = self._buffer.fill([arr for arr, _ in batch])
+            predictions = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.predict_fn, inputs
+            )
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error(len(batch), e)
+            else:
+                print(f"Batch of {len(batch)} failed: {type(e).__name__}: {e}")
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self._record(len(batch), time.perf_counter() - start)
+        for (_, fut), row in zip(batch, predictions):
+            if not fut.done():
+                fut.set_result(row)
+
+    def _record(self, size, elapsed):
+        self._last_batch_ms = elapsed * 1000.0
+        if self.on_batch is not None:
+            self.on_batch(size, elapsed)
+        self._batches += 1
+        self._items += size
+        self._batch_sizes[size] += 1
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        """
+        Batch-size and queue-depth statistics since startup.
+        """
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self._max_queue_depth,
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+            "batch_size_counts": dict(sorted(self._batch_sizes.items())),
+            "last_batch_ms": self._last_batch_ms,
+        }
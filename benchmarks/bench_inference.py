@@ -0,0 +1,58 @@
+"""
+Before/after benchmark: `model.predict` versus the traced InferenceEngine.
+
+Usage:
+    python benchmarks/bench_inference.py --model trained_model.keras --iters 50
+
+For each batch size the same random input is pushed through both paths and the
+per-call latency distribution is printed, along with a check that both paths
+agree on the predicted classes.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import InferenceEngine
+
+
+def time_calls(fn, x, iters):
+    fn(x)
+    latencies = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn(x)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--iters", type=int, default=50)
+    parser.add_argument("--batch-sizes", default="1,4,16")
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    engine = InferenceEngine(model)
+    rng = np.random.default_rng(0)
+
+    print(f"{'batch':>5} {'path':<14} {'p50 ms':>9} {'mean ms':>9} {'img/s':>9}")
+    for bs in [int(b) for b in args.batch_sizes.split(",")]:
+        x = rng.uniform(0, 255, size=(bs,) + engine.input_shape).astype(np.float32)
+        same = np.array_equal(np.argmax(model.predict(x, verbose=0), axis=1), np.argmax(engine.predict(x), axis=1))
+        for name, fn in [("model.predict", lambda a: model.predict(a, verbose=0)), ("engine", engine.predict)]:
+            latencies = time_calls(fn, x, args.iters)
+            mean = statistics.mean(latencies)
+            print(f"{bs:>5} {name:<14} {statistics.median(latencies):>9.2f} {mean:>9.2f} {bs * 1000.0 / mean:>9.1f}")
+        print(f"{bs:>5} {'argmax match':<14} {same}")
+
+
+if __name__ == "__main__":
+    main()
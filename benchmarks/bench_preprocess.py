@@ -0,0 +1,128 @@
+"""
+Decode + preprocess benchmark: the original /predict/ path versus preprocessing.py.
+
+Usage:
+    python benchmarks/bench_preprocess.py --iters 20
+
+The original path is the code /predict/ used to run: a full-resolution
+Image.open, image.resize((128, 128)), img_to_array and np.array([...]).
+The new path is decode_image (JPEG draft mode, uint8) written into a
+reusable BatchBuffer. The stream path is what /predict/ runs on an upload
+spooled to disk: inspect_upload, then decode_stream feeding 64 KB chunks to
+the incremental decoder, so the file is never held in memory whole.
+Synthetic JPEGs are generated at 1, 4 and 12 MP.
+
+Each case runs in a fresh process. The RSS high-water mark is reset after
+imports (Linux /proc/self/clear_refs), so the peak RSS figure is the growth
+caused by decoding alone.
+"""
+import argparse
+import io
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = {"1MP": (1155, 866), "4MP": (2309, 1732), "12MP": (4000, 3000)}
+
+
+def synthetic_jpeg(size, seed=0):
+    # smooth colour fields plus a little noise compress like real photos, unlike pure noise
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(size[1] // 64 + 1, size[0] // 64 + 1, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize(size, Image.BILINEAR)
+    arr = np.asarray(image).astype(np.int16) + rng.integers(-8, 8, size=(size[1], size[0], 3))
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def original_path(contents):
+    import tensorflow as tf
+    image = Image.open(io.BytesIO(contents))
+    image = image.resize((128, 128))
+    input_arr = tf.keras.preprocessing.image.img_to_array(image)
+    return np.array([input_arr])
+
+
+def new_path(contents, buffer):
+    from preprocessing import decode_image
+    return buffer.fill([decode_image(contents)])
+
+
+def stream_path(fileobj, buffer):
+    from preprocessing import decode_stream, inspect_upload
+    inspect_upload(fileobj)
+    arr = decode_stream(fileobj)
+    fileobj.seek(0)
+    return buffer.fill([arr])
+
+
+def _status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def reset_peak_rss():
+    # writing 5 resets VmHWM to the current RSS
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    return _status_mb("VmRSS")
+
+
+def peak_rss_mb():
+    return _status_mb("VmHWM")
+
+
+def run_case(path_name, contents, iters, out):
+    import tensorflow  # noqa: F401 -- import cost is not part of the measurement
+    from preprocessing import BatchBuffer
+    buffer = BatchBuffer(1)
+    if path_name == "stream":
+        import tempfile
+        spooled = tempfile.TemporaryFile()
+        spooled.write(contents)
+        spooled.seek(0)
+        contents = spooled
+        fn = lambda f: stream_path(f, buffer)
+    else:
+        fn = original_path if path_name == "original" else (lambda c: new_path(c, buffer))
+    fn(contents)
+    baseline = reset_peak_rss()
+    latencies = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn(contents)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    out.put((statistics.median(latencies), statistics.mean(latencies), peak_rss_mb() - baseline))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iters", type=int, default=20)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    print(f"{'size':<6} {'path':<9} {'p50 ms':>8} {'mean ms':>8} {'peak RSS +MB':>13}")
+    for label, size in SIZES.items():
+        contents = synthetic_jpeg(size)
+        for path_name in ("original", "new", "stream"):
+            out = ctx.Queue()
+            proc = ctx.Process(target=run_case, args=(path_name, contents, args.iters, out))
+            proc.start()
+            p50, mean, rss = out.get()
+            proc.join()
+            print(f"{label:<6} {path_name:<9} {p50:>8.2f} {mean:>8.2f} {rss:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
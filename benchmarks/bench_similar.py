@@ -0,0 +1,91 @@
+"""
+Search latency and recall of the embedding index as it grows.
+
+Usage:
+    python benchmarks/bench_similar.py --sizes 10000,100000,1000000
+    python benchmarks/bench_similar.py --sizes 1000000 --dtype float16 --nprobe 16 --index-dir /tmp/index
+
+Embeddings are synthetic: non-negative 1500-d vectors drawn around a few
+hundred cluster centres, like penultimate ReLU activations of photos that
+fall into a limited number of look-alike groups. The index is filled up to
+each size in turn, the background partitioning is waited for, and then
+--queries searches are timed. Recall@k is measured against an exhaustive
+scan of the same index.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import EmbeddingIndex
+
+SOURCE_DIM = 1500
+
+
+def synthetic(rng, centres, n, noise=0.8):
+    picked = centres[rng.integers(0, len(centres), n)]
+    return np.maximum(picked + noise * rng.standard_normal((n, centres.shape[1])), 0).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--dtype", default="int8", choices=("int8", "float16"))
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-dir", help="where to build the index, a temporary directory by default")
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="bench_similar_")
+    shutil.rmtree(index_dir, ignore_errors=True)
+    rng = np.random.default_rng(0)
+    centres = np.maximum(rng.standard_normal((500, SOURCE_DIM)), 0)
+    index = EmbeddingIndex(index_dir, SOURCE_DIM, dim=args.dim, dtype=args.dtype, nprobe=args.nprobe)
+    queries = synthetic(rng, centres, args.queries)
+
+    print(f"{'entries':>9} {'lists':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'scan ms':>8} {'recall':>7} {'disk MB':>8}")
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            while index.count < size:
+                n = min(20000, size - index.count)
+                index.add(synthetic(rng, centres, n), rng.integers(0, 38, n), rng.random(n), ["0" * 32] * n)
+            # the partitioning is trained in the background, wait so the numbers are for the finished index
+            while index._training:
+                time.sleep(0.2)
+            for q in queries[:5]:
+                index.search(q, args.k)
+            latencies, found = [], []
+            for q in queries:
+                start = time.perf_counter()
+                ids, _ = index.search(q, args.k)
+                latencies.append((time.perf_counter() - start) * 1000.0)
+                found.append(ids)
+            # exhaustive scan of the same index, for recall and as the unpartitioned baseline
+            centroids, index.centroids = index.centroids, None
+            scan = []
+            exact = []
+            for q in queries[:50]:
+                start = time.perf_counter()
+                exact.append(index.search(q, args.k)[0])
+                scan.append((time.perf_counter() - start) * 1000.0)
+            index.centroids = centroids
+            recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, exact)])
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats = index.stats()
+            print(f"{index.count:>9} {stats['partitions']:>6} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} "
+                  f"{np.median(scan):>8.2f} {recall:>7.3f} {stats['bytes_on_disk'] / 1e6:>8.1f}")
+    finally:
+        if not args.index_dir:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
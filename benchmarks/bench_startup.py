@@ -0,0 +1,82 @@
+"""
+Startup time of the API, split into phases, with thresholds to catch regressions.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 3 --max-import-s 2 --max-ready-s 30
+    INFERENCE_BACKEND=tflite TFLITE_MODEL_PATH=trained_model_float32.tflite python benchmarks/bench_startup.py
+
+Each run starts app.py under uvicorn in a fresh process and polls it. Reported
+per run:
+    import    seconds for `import app` in a separate interpreter
+    live      seconds until /healthz answers 200
+    ready     seconds until /readyz answers 200 (model loaded and warmed up)
+plus the phase timings the server itself reports from /readyz. The script
+exits non-zero if the worst run exceeds --max-import-s or --max-ready-s.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from local_server import ROOT, free_port, launch, stop, wait_for
+
+
+def time_import():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def time_server(timeout):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = launch(["-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)])
+    try:
+        live, _ = wait_for(proc, url + "/healthz", started, timeout)
+        ready, body = wait_for(proc, url + "/readyz", started, timeout)
+    finally:
+        stop(proc)
+    return live, ready, body.get("timings", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--max-import-s", type=float, default=None, help="fail if importing app takes longer")
+    parser.add_argument("--max-ready-s", type=float, default=None, help="fail if /readyz takes longer")
+    parser.add_argument("--json", help="also write the results here")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'run':>3} {'import s':>9} {'live s':>8} {'ready s':>8}  server phases")
+    for run in range(args.runs):
+        import_s = time_import()
+        live, ready, phases = time_server(args.timeout)
+        results.append({"import_s": import_s, "live_s": live, "ready_s": ready, "phases": phases})
+        print(f"{run:>3} {import_s:>9.2f} {live:>8.2f} {ready:>8.2f}  "
+              + ", ".join(f"{k}={v:.2f}" for k, v in sorted(phases.items())))
+
+    worst_import = max(r["import_s"] for r in results)
+    worst_ready = max(r["ready_s"] for r in results)
+    print(f"worst: import {worst_import:.2f}s, ready {worst_ready:.2f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": results, "worst_import_s": worst_import, "worst_ready_s": worst_ready}, f, indent=2)
+
+    failed = False
+    if args.max_import_s is not None and worst_import > args.max_import_s:
+        print(f"FAIL: import took {worst_import:.2f}s, limit {args.max_import_s}s")
+        failed = True
+    if args.max_ready_s is not None and worst_ready > args.max_ready_s:
+        print(f"FAIL: ready took {worst_ready:.2f}s, limit {args.max_ready_s}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
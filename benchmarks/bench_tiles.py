@@ -0,0 +1,104 @@
+"""
+Cost of tiled inference on large field photos, per tile grid.
+
+Usage:
+    python benchmarks/bench_tiles.py --leaves cr.jpg "download c1.jpg" "download c2.jpg"
+    python benchmarks/bench_tiles.py --photo field.jpg --grids 2,4,8,12 --min-green 0,0.15 --json tiles.json
+
+Without --photo, a synthetic --size field photo is made by scattering the
+--leaves images over a soil-coloured background, --leaf-count of them, each
+--leaf-px across. Every grid is timed with each --min-green: decoding and
+tiling (the same tiling.tile_image the API runs with ?tiles=N), and one
+forward pass over the kept tiles. With background skipping on, the forward
+pass should track the number of kept tiles rather than the grid size.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import load_engine
+from tiling import tile_image
+
+
+def synthetic_field(leaves, size, count, leaf_px, seed=0):
+    rng = np.random.default_rng(seed)
+    soil = rng.normal([110, 80, 55], 18, (size[1], size[0], 3))
+    field = Image.fromarray(np.clip(soil, 0, 255).astype(np.uint8))
+    images = [Image.open(path).convert("RGB").resize((leaf_px, leaf_px)) for path in leaves]
+    for i in range(count):
+        field.paste(images[i % len(images)], (int(rng.integers(0, size[0] - leaf_px)), int(rng.integers(0, size[1] - leaf_px))))
+    out = io.BytesIO()
+    field.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def run(engine, contents, grid, min_green, repeats):
+    tile_ms, forward_ms = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        tiles = tile_image(contents, grid, min_green=min_green)
+        tiled = time.perf_counter()
+        engine.predict(tiles.images.astype(np.float32))
+        tile_ms.append((tiled - start) * 1000.0)
+        forward_ms.append((time.perf_counter() - tiled) * 1000.0)
+    rows, cols = tiles.shape
+    return {
+        "grid": grid,
+        "min_green": min_green,
+        "tiles": rows * cols,
+        "classified": len(tiles.images),
+        "tile_px": round(tiles.tile_px),
+        "tile_ms": statistics.median(tile_ms),
+        "forward_ms": statistics.median(forward_ms),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photo", help="a real field photo, instead of a synthetic one")
+    parser.add_argument("--leaves", nargs="+", default=["cr.jpg"], help="leaf images for the synthetic photo")
+    parser.add_argument("--size", default="4000x3000")
+    parser.add_argument("--leaf-count", type=int, default=6)
+    parser.add_argument("--leaf-px", type=int, default=900)
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--grids", default="1,2,4,8,12")
+    parser.add_argument("--min-green", default="0,0.15")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    if args.photo:
+        with open(args.photo, "rb") as f:
+            contents = f.read()
+    else:
+        size = tuple(int(v) for v in args.size.split("x"))
+        contents = synthetic_field(args.leaves, size, args.leaf_count, args.leaf_px)
+    width, height = Image.open(io.BytesIO(contents)).size
+    print(f"{width}x{height} photo, {len(contents) / 1e6:.1f} MB")
+    engine = load_engine(args.model)
+
+    report = []
+    print(f"{'grid':>4} {'green':>6} {'tiles':>6} {'kept':>5} {'tile px':>8} {'tile ms':>8} {'fwd ms':>8} {'ms/kept':>8}")
+    for grid in (int(g) for g in args.grids.split(",")):
+        for min_green in (float(m) for m in args.min_green.split(",")):
+            r = run(engine, contents, grid, min_green, args.repeats)
+            report.append(r)
+            print(f"{r['grid']:>4} {r['min_green']:>6.2f} {r['tiles']:>6} {r['classified']:>5} {r['tile_px']:>8} "
+                  f"{r['tile_ms']:>8.1f} {r['forward_ms']:>8.1f} {r['forward_ms'] / r['classified']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"photo": args.photo, "size": [width, height], "model": args.model, "results": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Latency overhead and accuracy gain of test-time augmentation, per number of views.
+
+Usage:
+    python benchmarks/bench_tta.py --data-dir valid/ --max-per-class 20
+    python benchmarks/bench_tta.py --data-dir valid/ --views 1,2,4,8,10 --model trained_model_float32.tflite --json tta.json
+
+--data-dir must hold one sub-directory per class, laid out like the training
+data (see compare_backends.py). Every image is decoded, augmented and
+predicted as one batch per view count, the same path the API takes with
+?tta=N. The report shows top-1 accuracy and its gain over a single view, and
+the p50/p95 per-image latency and its overhead over a single view.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from labelled import labelled_images
+from inference import load_engine
+from tta import TTA_VIEWS, decode_views
+
+
+def load_labelled(data_dir, max_per_class):
+    samples = []
+    for path, label in labelled_images(data_dir, max_per_class):
+        with open(path, "rb") as f:
+            samples.append((f.read(), label))
+    return samples
+
+
+def run(engine, samples, views):
+    correct = 0
+    latencies = []
+    for contents, label in samples:
+        start = time.perf_counter()
+        try:
+            stack = decode_views(contents, views)
+        except Exception:
+            continue
+        prediction = engine.predict(stack).mean(axis=0)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        correct += int(np.argmax(prediction) == label)
+    latencies.sort()
+    return {
+        "views": views,
+        "accuracy": correct / len(latencies),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--views", default=",".join(str(n) for n in range(1, len(TTA_VIEWS) + 1)))
+    parser.add_argument("--max-per-class", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="TFLite interpreter threads")
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    samples = load_labelled(args.data_dir, args.max_per_class)
+    print(f"{len(samples)} labelled images from {args.data_dir}")
+    engine = load_engine(args.model, num_threads=args.threads)
+
+    report = [run(engine, samples, int(v)) for v in args.views.split(",")]
+    base = report[0]
+    print(f"{'views':>5} {'acc':>7} {'gain':>7} {'p50 ms':>8} {'p95 ms':>8} {'overhead':>9}")
+    for r in report:
+        r["accuracy_gain"] = r["accuracy"] - base["accuracy"]
+        r["latency_overhead"] = r["p50_ms"] / base["p50_ms"]
+        print(f"{r['views']:>5} {r['accuracy']:>7.4f} {r['accuracy_gain']:>+7.4f} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['latency_overhead']:>8.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": len(samples), "model": args.model, "results": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Throughput and memory of serve.py against worker count, on a fixed number of cores.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1,2,4 --cores 4 --backend tflite
+    python benchmarks/bench_workers.py --workers 1,2,4 --cores 4 --backend keras
+
+For each worker count serve.py is started on its own port, then --concurrency
+client threads post the same image to /predict/ for --duration seconds.
+Memory is summed over the supervisor and all its workers in two ways. RSS
+counts shared pages once per process. PSS splits shared pages between the
+processes that map them, so it shows what sharing the weights file saves.
+"""
+import argparse
+import os
+import threading
+import time
+
+import requests
+
+from local_server import ROOT, free_port, serving
+
+
+def process_tree(root_pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def memory_mb(pids):
+    rss = pss = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            continue
+    return rss / 1024.0, pss / 1024.0
+
+
+def run_load(url, payload, concurrency, duration):
+    stop = threading.Event()
+    counts = [0] * concurrency
+
+    def client(i):
+        session = requests.Session()
+        while not stop.is_set():
+            r = session.post(url + "/predict/", files={"file": ("leaf.jpg", payload, "image/jpeg")}, timeout=120)
+            if r.status_code == 200:
+                counts[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(counts) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--cores", type=int, default=None)
+    parser.add_argument("--backend", choices=("tflite", "keras"), default="tflite")
+    parser.add_argument("--image", default=os.path.join(ROOT, "cr.jpg"))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0)
+    args = parser.parse_args()
+
+    payload = open(args.image, "rb").read()
+    # the cache would turn every repeat of the same image into a hit
+    env = dict(os.environ, CACHE_MAX_ENTRIES="0")
+    print(f"{'workers':>7} {'req/s':>8} {'RSS MB':>9} {'PSS MB':>9}")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        port = free_port()
+        cmd = ["serve.py", "--workers", str(workers), "--port", str(port), "--host", "127.0.0.1", "--backend", args.backend]
+        if args.cores:
+            cmd += ["--cores", str(args.cores)]
+        with serving(cmd, port, env) as (proc, url):
+            # /readyz answered from one worker, give the others time to finish loading
+            time.sleep(5)
+            throughput = run_load(url, payload, args.concurrency, args.duration)
+            rss, pss = memory_mb(process_tree(proc.pid))
+            print(f"{workers:>7} {throughput:>8.1f} {rss:>9.0f} {pss:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Check that the Streamlit front end predicts the same classes in-process and
+through the FastAPI service, and compare how fast each mode starts.
+
+Usage:
+    python benchmarks/check_parity.py valid/ --max-images 200
+    python benchmarks/check_parity.py cr.jpg "download c1.jpg" --url http://localhost:8000/predict/
+
+Every image is classified by main.model_prediction twice. The first run
+loads the model in process. The second has PREDICT_URL set, so it goes
+through remote.RemoteClassifier to /predict/. Without --url, app.py is started
+on a free local port with --model and its prediction cache off, and stopped
+afterwards.
+
+It also times `import main` in a fresh interpreter in remote mode and checks
+that TensorFlow was not imported. It exits non-zero if any class index
+differs, or if TensorFlow shows up in remote mode.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from local_server import ROOT, free_port, launch, stop, wait_for
+
+sys.path.insert(0, ROOT)
+
+from score import list_images
+
+IMPORT_PROBE = (
+    "import sys, time; start = time.perf_counter(); import main; "
+    "print(time.perf_counter() - start, 'tensorflow' in sys.modules)"
+)
+
+
+class Upload(io.BytesIO):
+    """
+    Stands in for Streamlit's UploadedFile.
+    """
+
+    def __init__(self, contents, name, type="image/jpeg"):
+        super().__init__(contents)
+        self.name = name
+        self.type = type
+
+
+def start_server(model, workdir, timeout=300):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), MODEL_PATH=model, INFERENCE_BACKEND="keras", CACHE_MAX_ENTRIES="0",
+               JOBS_DB_PATH=os.path.join(workdir, "jobs.db"), JOBS_UPLOAD_DIR=os.path.join(workdir, "uploads"))
+    env.pop("CACHE_DB_PATH", None)
+    env.pop("EMBEDDING_INDEX_DIR", None)
+    server = launch(["app.py"], env)
+    try:
+        wait_for(server, f"http://127.0.0.1:{port}/readyz", timeout=timeout)
+    except RuntimeError as e:
+        stop(server)
+        sys.exit(f"app.py did not start: {e}")
+    return server, f"http://127.0.0.1:{port}/predict/"
+
+
+def import_time(env):
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, env=env, capture_output=True, text=True)
+    seconds, tf_loaded = out.stdout.split()[-2:]
+    return float(seconds), tf_loaded == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="image files or directories")
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--url", help="a running service's /predict/ URL, instead of starting app.py")
+    parser.add_argument("--max-images", type=int, default=200)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    paths = []
+    for p in args.paths:
+        paths.extend(list_images(p) if os.path.isdir(p) else [p])
+    paths = paths[:args.max_images]
+    uploads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            uploads.append((os.path.basename(path), f.read()))
+    print(f"{len(uploads)} images")
+
+    os.chdir(ROOT)
+    os.environ["MODEL_PATH"] = args.model
+    os.environ.pop("PREDICT_URL", None)
+    # main.py renders its page on import, which is harmless outside `streamlit run`
+    import main
+
+    start = time.perf_counter()
+    local = [int(main.model_prediction(Upload(contents, name))) for name, contents in uploads]
+    local_s = time.perf_counter() - start
+
+    server = None
+    workdir = tempfile.mkdtemp(prefix="parity_")
+    url = args.url
+    try:
+        if url is None:
+            server, url = start_server(os.path.abspath(args.model), workdir)
+        main.PREDICT_URL = url
+        start = time.perf_counter()
+        remote = [int(main.model_prediction(Upload(contents, name))) for name, contents in uploads]
+        remote_s = time.perf_counter() - start
+    finally:
+        if server is not None:
+            stop(server)
+
+    mismatches = [
+        {"image": name, "local": l, "remote": r}
+        for (name, _), l, r in zip(uploads, local, remote) if l != r
+    ]
+    remote_import_s, remote_tf = import_time(dict(os.environ, PREDICT_URL=url))
+    local_import_s, _ = import_time(os.environ)
+    report = {
+        "images": len(uploads),
+        "mismatches": mismatches,
+        "local_seconds": local_s,
+        "remote_seconds": remote_s,
+        "remote_import_s": remote_import_s,
+        "remote_imports_tensorflow": remote_tf,
+        "local_import_s": local_import_s,
+    }
+
+    print(f"{'mode':<8} {'import s':>9} {'predict s':>10}  (local includes loading the model)")
+    print(f"{'local':<8} {local_import_s:>9.2f} {local_s:>10.2f}")
+    print(f"{'remote':<8} {remote_import_s:>9.2f} {remote_s:>10.2f}")
+    print(f"TensorFlow imported in remote mode: {remote_tf}")
+    for m in mismatches[:20]:
+        print(f"MISMATCH {m['image']}: local {m['local']} remote {m['remote']}")
+    print(f"{len(uploads) - len(mismatches)}/{len(uploads)} class indices identical")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if mismatches or remote_tf else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Accuracy-vs-latency report for the Keras model and its TFLite exports.
+
+Usage:
+    python export_tflite.py --variants float32,dynamic,float16,int8 --calibration-dir train/
+    python benchmarks/compare_backends.py --data-dir valid/ --max-per-class 50 \
+        --tflite trained_model_*.tflite --max-accuracy-drop 0.005 --json report.json
+
+--data-dir must hold one sub-directory per class, laid out like the training
+data (train.ipynb). Sub-directories are matched to the model's classes by
+name, so the set may leave classes out.
+
+For every variant the report shows top-1 accuracy, top-1 agreement with the
+Keras model, p50 batch-1 latency, batch-32 throughput and file size. The
+fastest variant whose accuracy is within --max-accuracy-drop of Keras is
+marked as the pick.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from labelled import labelled_images
+from inference import load_engine
+from preprocessing import preprocess_image
+
+
+def load_held_out(data_dir, max_per_class):
+    images, labels = [], []
+    for path, label in labelled_images(data_dir, max_per_class):
+        try:
+            with open(path, "rb") as f:
+                images.append(preprocess_image(f.read()))
+        except Exception as e:
+            print(f"skipping {path}: {e}")
+            continue
+        labels.append(label)
+    return np.stack(images), np.array(labels)
+
+
+def evaluate(engine, images, labels, iters):
+    predictions = np.concatenate([engine.predict(images[i:i + 32]) for i in range(0, len(images), 32)])
+    top1 = predictions.argmax(axis=1)
+
+    single = images[:1]
+    engine.predict(single)
+    latencies = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        engine.predict(single)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    batch = images[:32]
+    start = time.perf_counter()
+    for _ in range(max(1, iters // 10)):
+        engine.predict(batch)
+    throughput = len(batch) * max(1, iters // 10) / (time.perf_counter() - start)
+
+    return {
+        "accuracy": float((top1 == labels).mean()),
+        "top1": top1,
+        "p50_ms_batch1": statistics.median(latencies),
+        "images_per_s_batch32": throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--tflite", nargs="*", default=None, help="TFLite files to compare, default *.tflite")
+    parser.add_argument("--max-per-class", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=None, help="TFLite interpreter threads")
+    parser.add_argument("--iters", type=int, default=50)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    images, labels = load_held_out(args.data_dir, args.max_per_class)
+    print(f"{len(images)} held-out images from {args.data_dir}")
+
+    tflite_paths = args.tflite if args.tflite is not None else sorted(glob.glob("*.tflite"))
+    variants = [("keras", args.model)] + [(os.path.basename(p), p) for p in tflite_paths]
+
+    report = []
+    reference_top1 = None
+    for name, path in variants:
+        engine = load_engine(path, num_threads=args.threads)
+        result = evaluate(engine, images, labels, args.iters)
+        top1 = result.pop("top1")
+        if reference_top1 is None:
+            reference_top1 = top1
+        result["agreement"] = float((top1 == reference_top1).mean())
+        result.update(name=name, path=path, size_mb=os.path.getsize(path) / 2**20)
+        report.append(result)
+
+    budget = report[0]["accuracy"] - args.max_accuracy_drop
+    eligible = [r for r in report if r["accuracy"] >= budget]
+    pick = min(eligible, key=lambda r: r["p50_ms_batch1"])["name"] if eligible else None
+
+    print(f"{'variant':<34} {'acc':>7} {'agree':>7} {'p50 ms':>8} {'img/s':>8} {'MB':>7}")
+    for r in report:
+        mark = "  <- pick" if r["name"] == pick else ""
+        print(f"{r['name']:<34} {r['accuracy']:>7.4f} {r['agreement']:>7.4f} {r['p50_ms_batch1']:>8.2f} "
+              f"{r['images_per_s_batch32']:>8.1f} {r['size_mb']:>7.1f}{mark}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": len(images), "max_accuracy_drop": args.max_accuracy_drop, "pick": pick, "variants": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
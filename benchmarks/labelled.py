@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluate import class_index_map
+from score import list_images
+
+
+def labelled_images(data_dir, max_per_class):
+    """
+    (path, model class index) pairs for up to `max_per_class` images from each
+    class sub-directory of `data_dir`. Directory names are matched to the
+    model's classes the way evaluate.py does, so a held-out tree that lacks
+    some classes is still labelled right.
+    """
+    names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    samples = []
+    for name, label in zip(names, class_index_map(names)):
+        for path in list_images(os.path.join(data_dir, name))[:max_per_class]:
+            samples.append((path, int(label)))
+    return samples
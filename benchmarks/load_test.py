@@ -0,0 +1,119 @@
+"""
+Load test: saturate /predict/ and check that the / health check stays fast.
+
+Usage:
+    python benchmarks/load_test.py                       # starts app.py in-process
+    python benchmarks/load_test.py --url http://host:8000 --image cr.jpg
+
+Health-check latency is measured once with the server idle and once while
+`--concurrency` clients hammer /predict/. With inference off the event loop
+the two distributions should be close; 503s mean backpressure kicked in.
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def summarize(name, latencies):
+    print(f"{name:<22} n={len(latencies):<5} "
+          f"p50={percentile(latencies, 50):7.1f}ms "
+          f"p95={percentile(latencies, 95):7.1f}ms "
+          f"p99={percentile(latencies, 99):7.1f}ms "
+          f"max={max(latencies, default=float('nan')):7.1f}ms")
+
+
+def start_local_server():
+    import uvicorn
+    import app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            requests.get(url + "/", timeout=1)
+            return url, server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def probe_health(url, duration, interval, out):
+    session = requests.Session()
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        session.get(url + "/", timeout=30)
+        out.append((time.perf_counter() - start) * 1000.0)
+        time.sleep(interval)
+
+
+def hammer_predict(url, payload, stop, latencies, statuses):
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = session.post(url + "/predict/", files={"file": ("leaf.jpg", payload, "image/jpeg")}, timeout=120)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        statuses[r.status_code] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="server to test, default starts app.py in-process")
+    parser.add_argument("--image", default="cr.jpg")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between health probes")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        url, server = start_local_server()
+    payload = open(args.image, "rb").read()
+
+    idle = []
+    probe_health(url, args.duration, args.interval, idle)
+
+    stop = threading.Event()
+    predict_latencies, statuses = [], Counter()
+    clients = [threading.Thread(target=hammer_predict, args=(url, payload, stop, predict_latencies, statuses), daemon=True)
+               for _ in range(args.concurrency)]
+    for t in clients:
+        t.start()
+    loaded = []
+    probe_health(url, args.duration, args.interval, loaded)
+    stop.set()
+    for t in clients:
+        t.join()
+
+    summarize("GET / (idle)", idle)
+    summarize("GET / (saturated)", loaded)
+    summarize("POST /predict/", predict_latencies)
+    print("predict status codes:", dict(statuses))
+    print(f"health p95 ratio saturated/idle: {percentile(loaded, 95) / percentile(idle, 95):.2f}x")
+    if server is not None:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def launch(args, env=None):
+    """
+    Run `python <args>` from the repository root in its own process group, so
+    `stop` also reaches any workers it starts. Output is discarded.
+    """
+    return subprocess.Popen([sys.executable] + list(args), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def wait_for(proc, url, started=None, timeout=300.0):
+    """
+    Poll `url` until it answers 200 and return the seconds since `started`
+    (a perf_counter reading, by default now) and the JSON body. Raises
+    RuntimeError if the process exits, the server reports that its model
+    failed to load, or `timeout` seconds pass.
+    """
+    started = time.perf_counter() if started is None else started
+    while time.perf_counter() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode} during startup")
+        try:
+            r = requests.get(url, timeout=1)
+            if r.status_code == 200:
+                return time.perf_counter() - started, r.json()
+            if r.json().get("status") == "failed":
+                raise RuntimeError(f"model failed to load: {r.json().get('error')}")
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def stop(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+@contextmanager
+def serving(args, port, env=None, timeout=300.0):
+    """
+    Start `python <args>`, which must listen on `port`, wait until /readyz
+    answers and yield the process and its base URL. The server is stopped on exit.
+    """
+    proc = launch(args, env)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(proc, url + "/readyz", timeout=timeout)
+        yield proc, url
+    finally:
+        stop(proc)
@@ -0,0 +1,254 @@
+"""
+Benchmark suite over the real serving code paths, with regression tracking.
+
+Usage:
+    python benchmarks/suite.py                                   # run, save, compare to the baseline
+    python benchmarks/suite.py --save-baseline                   # accept the current numbers
+    python benchmarks/suite.py --model trained_model_float32.tflite --skip streamlit
+    python benchmarks/suite.py --quick --tolerance 0.25
+
+Cases:
+    decode/<res>      decode_image alone on a synthetic JPEG
+    forward/b<N>      raw engine forward passes at batch sizes 1 to 128
+    api/<res>         POST /predict/ through an in-process ASGI client
+                      (prediction cache off, so every call decodes and predicts)
+    streamlit/<res>   main.model_prediction, the Streamlit app's path
+
+Images are synthetic JPEGs at several resolutions, so runs are reproducible on
+any machine. Each case reports p50/p95/p99 latency, throughput and the peak
+RSS growth while it ran (Linux only).
+
+Results are written to <results-dir>/<model hash>.json. Every case is
+compared against --baseline, whichever model file it was recorded with, so a
+slower model counts as a regression too; a model change is reported next to
+the deltas. A case whose p50 is more than --tolerance slower than the baseline
+is flagged, and the script then exits non-zero. A --quick run measures smaller
+inputs with fewer iterations, so it is only compared against a baseline that
+was also recorded with --quick; keep one with --baseline quick.json.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_preprocess import peak_rss_mb, reset_peak_rss, synthetic_jpeg
+
+RESOLUTIONS = {"0.3MP": (640, 480), "1MP": (1155, 866), "4MP": (2309, 1732), "12MP": (4000, 3000)}
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128)
+CASES = ("decode", "forward", "api", "streamlit")
+
+
+def start_peak_rss():
+    # the peak RSS reset needs Linux, elsewhere memory is not reported
+    try:
+        return reset_peak_rss()
+    except OSError:
+        return None
+
+
+def summarise(latencies, items=1, rss_start=None):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "iters": len(latencies),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "items_per_s": items * len(latencies) * 1000.0 / sum(latencies),
+        "peak_rss_mb": peak_rss_mb() - rss_start if rss_start is not None else None,
+    }
+
+
+def measure(fn, iters, items=1):
+    """
+    Time `iters` calls of `fn` after one warm-up call.
+    """
+    fn()
+    rss_start = start_peak_rss()
+    latencies = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return summarise(latencies, items, rss_start)
+
+
+def bench_decode(images, iters):
+    from preprocessing import decode_image
+    return {f"decode/{res}": measure(lambda c=contents: decode_image(c), iters) for res, contents in images.items()}
+
+
+def bench_forward(model_path, batch_sizes, iters):
+    from inference import load_engine
+    engine = load_engine(model_path, buckets=batch_sizes)
+    rng = np.random.default_rng(0)
+    results = {}
+    for bs in batch_sizes:
+        x = rng.uniform(0, 255, size=(bs,) + engine.input_shape).astype(np.float32)
+        # big batches are slow, fewer repeats keep the run time bounded
+        results[f"forward/b{bs}"] = measure(lambda x=x: engine.predict(x), max(3, iters * 4 // bs), items=bs)
+    return results
+
+
+def bench_api(model_path, images, iters):
+    # configure the app before importing it; one model, no cache
+    os.environ["CACHE_MAX_ENTRIES"] = "0"
+    os.environ.pop("CACHE_DB_PATH", None)
+    if model_path.endswith(".tflite"):
+        os.environ.update(INFERENCE_BACKEND="tflite", TFLITE_MODEL_PATH=model_path)
+    else:
+        os.environ.update(INFERENCE_BACKEND="keras", MODEL_PATH=model_path)
+    import httpx
+    import app
+
+    async def run():
+        results = {}
+        async with app.lifespan(app.app):
+            while app.STARTUP["phase"] not in ("ready", "failed"):
+                await asyncio.sleep(0.05)
+            if app.STARTUP["phase"] == "failed":
+                raise RuntimeError(f"app failed to start: {app.STARTUP['error']}")
+            transport = httpx.ASGITransport(app=app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                for res, contents in images.items():
+                    async def call(contents=contents):
+                        r = await client.post("/predict/", files={"file": ("leaf.jpg", contents, "image/jpeg")})
+                        r.raise_for_status()
+                    # measure() is synchronous, so time the coroutine the same way by hand
+                    await call()
+                    rss_start = start_peak_rss()
+                    latencies = []
+                    for _ in range(iters):
+                        start = time.perf_counter()
+                        await call()
+                        latencies.append((time.perf_counter() - start) * 1000.0)
+                    results[f"api/{res}"] = summarise(latencies, rss_start=rss_start)
+        return results
+
+    return asyncio.run(run())
+
+
+def bench_streamlit(model_path, images, iters):
+    if model_path.endswith(".tflite"):
+        print("skipping streamlit: main.py only loads Keras models")
+        return {}
+    # main.py renders its page on import, which is harmless outside `streamlit run`
+    import main
+    main.MODEL_PATH = model_path
+    return {
+        f"streamlit/{res}": measure(lambda c=contents: main.model_prediction(io.BytesIO(c)), iters)
+        for res, contents in images.items()
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Cases whose p50 got more than `tolerance` slower than in `baseline`.
+    """
+    regressions = []
+    for name, current in results["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is None:
+            continue
+        ratio = current["p50_ms"] / before["p50_ms"]
+        current["vs_baseline"] = ratio
+        if ratio > 1.0 + tolerance:
+            regressions.append((name, before["p50_ms"], current["p50_ms"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--iters", type=int, default=30)
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, smaller images and batches")
+    parser.add_argument("--skip", default="", help=f"comma-separated cases to skip, from {', '.join(CASES)}")
+    parser.add_argument("--results-dir", default=os.path.join(ROOT, "benchmarks", "results"))
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # refuse before spending minutes on numbers that cannot be compared
+        if baseline.get("quick", False) != args.quick:
+            modes = {True: "a --quick run", False: "a full run"}
+            sys.exit(f"{args.baseline} was recorded by {modes[baseline.get('quick', False)]}, this is {modes[args.quick]}. "
+                     "Compare against a baseline of the same mode, or store one with --save-baseline.")
+
+    # main.py and app.py expect to run from the repository root
+    os.chdir(ROOT)
+    from inference import model_version
+
+    iters = 5 if args.quick else args.iters
+    resolutions = dict(list(RESOLUTIONS.items())[:2]) if args.quick else RESOLUTIONS
+    batch_sizes = tuple(b for b in BATCH_SIZES if b <= 16) if args.quick else BATCH_SIZES
+    images = {res: synthetic_jpeg(size) for res, size in resolutions.items()}
+    skip = {s.strip() for s in args.skip.split(",") if s.strip()}
+
+    cases = {}
+    if "decode" not in skip:
+        cases.update(bench_decode(images, iters))
+    if "forward" not in skip:
+        cases.update(bench_forward(args.model, batch_sizes, iters))
+    if "api" not in skip:
+        cases.update(bench_api(args.model, images, iters))
+    if "streamlit" not in skip:
+        cases.update(bench_streamlit(args.model, images, iters))
+
+    version = model_version(args.model)
+    results = {
+        "model": args.model,
+        "model_version": version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "quick": args.quick,
+        "cases": cases,
+    }
+
+    regressions = []
+    model_change = None
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if baseline.get("model_version") != version:
+            model_change = f"{baseline.get('model')} ({baseline.get('model_version')}) -> {args.model} ({version})"
+            results["baseline_model_version"] = baseline.get("model_version")
+
+    print(f"{'case':<18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'items/s':>9} {'peak MB':>8} {'vs base':>8}")
+    for name, r in cases.items():
+        peak = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+        ratio = f"{r['vs_baseline']:.2f}x" if "vs_baseline" in r else "-"
+        print(f"{name:<18} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{r['items_per_s']:>9.1f} {peak:>8} {ratio:>8}")
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"{version}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {path}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+
+    if model_change:
+        print(f"model changed since the baseline: {model_change}")
+    for name, before, after, ratio in regressions:
+        print(f"REGRESSION {name}: p50 {before:.2f} ms -> {after:.2f} ms ({ratio:.2f}x)"
+              + (" with the model change above" if model_change else ""))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
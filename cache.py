@@ -0,0 +1,143 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(contents):
+    """
+    Hash of the uploaded bytes, used as the cache key.
+    """
+    return hashlib.sha256(contents).hexdigest()
+
+
+class PredictionCache:
+    """
+    Caches softmax outputs by upload hash for one model version.
+
+    The in-memory tier is an LRU bounded by `max_entries`, with entries expiring
+    after `ttl_s` seconds. If `db_path` is given, results are also written to a
+    SQLite file so they survive restarts. Changing the model version through
+    `set_model_version` drops every entry made by another model.
+    """
+
+    def __init__(self, model_version, max_entries=10000, ttl_s=86400.0, db_path=None):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, model_version TEXT NOT NULL, probs BLOB NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.model_version = None
+        self.set_model_version(model_version)
+
+    def set_model_version(self, model_version):
+        """
+        Switch to a new model, invalidating everything cached for the old one.
+        """
+        with self._lock:
+            if model_version == self.model_version:
+                return
+            self.model_version = model_version
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions WHERE model_version != ?", (model_version,))
+                self._db.commit()
+
+    def get(self, key):
+        """
+        Cached softmax vector for `key`, or None.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                probs, created = entry
+                if now - created <= self.ttl_s:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return probs
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT probs, created FROM predictions WHERE key = ? AND model_version = ?",
+                    (key, self.model_version),
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl_s:
+                    probs = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, probs, row[1])
+                    self.disk_hits += 1
+                    return probs
+            self.misses += 1
+            return None
+
+    def put(self, key, probs, model_version=None):
+        """
+        Cache `probs` for `key`. If `model_version` is given and the cache has
+        moved on to another model since the prediction was made, it is dropped.
+        """
+        probs = np.asarray(probs, dtype=np.float32)
+        created = time.time()
+        with self._lock:
+            if model_version is not None and model_version != self.model_version:
+                return
+            self._remember(key, probs, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, model_version, probs, created) VALUES (?, ?, ?, ?)",
+                    (key, self.model_version, probs.tobytes(), created),
+                )
+                self._db.commit()
+
+    def _remember(self, key, probs, created):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = (probs, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def purge_expired(self):
+        """
+        Drop expired rows from the on-disk tier.
+        """
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM predictions WHERE created < ?", (time.time() - self.ttl_s,))
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model_version": self.model_version,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "persistent": self._db is not None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
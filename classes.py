@@ -0,0 +1,62 @@
+import json
+import os
+
+# class metadata for the model outputs, in output order. Edit class_metadata.json
+# and bump its version rather than keeping class lists anywhere else
+CLASS_METADATA_PATH = os.environ.get(
+    "CLASS_METADATA_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "class_metadata.json")
+)
+
+
+def load_class_metadata(path=CLASS_METADATA_PATH):
+    """
+    Read and validate the class metadata file. Returns (version, classes).
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    classes = data["classes"]
+    for i, entry in enumerate(classes):
+        if entry["index"] != i:
+            raise ValueError(f"{path}: entry {i} has index {entry['index']}, classes must be listed in output order")
+        missing = {"label", "name", "description", "solutions"} - set(entry)
+        if missing:
+            raise ValueError(f"{path}: class {i} is missing {', '.join(sorted(missing))}")
+    return data["version"], tuple(classes)
+
+
+def _dumps(value):
+    # same encoding FastAPI's JSONResponse uses
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def response_fragments(classes):
+    """
+    The /predict/ response body for each class, serialized once and split around
+    the confidence value so a request only has to join a few byte strings.
+    The tail leaves the object open for optional extra fields.
+    """
+    fragments = []
+    for entry in classes:
+        head = '{"predicted_class":' + _dumps(entry["name"]) + ',"confidence":'
+        tail = ',"description":' + _dumps(entry["description"]) + ',"solutions":' + _dumps(entry["solutions"])
+        fragments.append((head.encode("utf-8"), tail.encode("utf-8")))
+    return tuple(fragments)
+
+
+def check_output_width(width):
+    """
+    Fail fast if the model and the class metadata describe a different number of classes.
+    """
+    if int(width) != len(CLASS_NAMES):
+        raise ValueError(
+            f"Model has {width} outputs but {CLASS_METADATA_PATH} (version {CLASS_METADATA_VERSION}) "
+            f"describes {len(CLASS_NAMES)} classes"
+        )
+
+
+CLASS_METADATA_VERSION, CLASS_METADATA = load_class_metadata()
+# dataset folder names, as used during training
+CLASS_LABELS = tuple(entry["label"] for entry in CLASS_METADATA)
+# display names
+CLASS_NAMES = tuple(entry["name"] for entry in CLASS_METADATA)
+RESPONSE_FRAGMENTS = response_fragments(CLASS_METADATA)
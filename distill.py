@@ -0,0 +1,253 @@
+"""
+Distil trained_model.keras into a small depthwise-separable student.
+
+Usage:
+    python distill.py train --train shards/train --valid shards/valid -o student_model.keras
+    python distill.py train --train train/ --valid valid/ --epochs 15 --temperature 4 --alpha 0.3
+    python distill.py compare student_model.keras --valid shards/valid --tolerance 0.01
+
+The teacher's Flatten -> Dense(1500) head holds most of its parameters. The
+student replaces the conv stack with depthwise-separable blocks and the head
+with global average pooling and a single Dense layer. It takes the same
+128x128x3 input in 0-255 and outputs the same 38 softmax probabilities, so
+app.py and main.py serve it unchanged when started with
+MODEL_PATH=student_model.keras, and export_tflite.py converts it like the
+teacher.
+
+Training minimises
+    alpha * CE(labels, student) + (1 - alpha) * T^2 * KL(teacher_T || student_T)
+where _T are both models' softmax at temperature T. The teacher only outputs
+probabilities, so its logits are recovered as their log.
+
+--train and --valid are either shard directories from `train_data.py build`
+or class-per-directory image trees like train.ipynb uses.
+
+`compare` (also run at the end of `train`) prints parameters, FLOPs per image,
+single-image CPU latency, batched throughput and validation accuracy of both
+models, and exits non-zero if the student's accuracy is more than --tolerance
+below the teacher's. The report is also written next to the student as
+<name>.report.json.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from evaluate import class_index_map
+from preprocessing import IMAGE_SIZE
+
+# (filters, stride) of the separable blocks after the stem
+STUDENT_BLOCKS = ((64, 1), (128, 2), (128, 1), (256, 2), (256, 1), (512, 2), (512, 1))
+
+
+def build_student(num_classes=38, input_shape=IMAGE_SIZE + (3,), dropout=0.2):
+    """
+    Depthwise-separable conv stack with a global-average-pooling head.
+    """
+    layers = tf.keras.layers
+    inputs = tf.keras.Input(shape=input_shape)
+    # the teacher is fed 0-255 pixels, the student takes the same input and scales it itself
+    x = layers.Rescaling(1.0 / 255)(inputs)
+    x = layers.Conv2D(32, 3, strides=2, padding="same", use_bias=False)(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.ReLU()(x)
+    for filters, stride in STUDENT_BLOCKS:
+        x = layers.SeparableConv2D(filters, 3, strides=stride, padding="same", use_bias=False)(x)
+        x = layers.BatchNormalization()(x)
+        x = layers.ReLU()(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(dropout)(x)
+    logits = layers.Dense(num_classes, name="logits")(x)
+    outputs = layers.Softmax()(logits)
+    return tf.keras.Model(inputs, outputs, name="student")
+
+
+def open_dataset(path, batch_size, shuffle, num_classes=38):
+    """
+    (float32 images, one-hot labels) batches from shards or a directory tree,
+    with labels as class_metadata.json indices whatever classes the data holds.
+    """
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        from train_data import load_dataset, read_manifest
+        names = read_manifest(path)["class_names"]
+        dataset = load_dataset(path, batch_size, shuffle=shuffle, label_mode="int")
+    else:
+        dataset = tf.keras.utils.image_dataset_from_directory(
+            path, label_mode="int", batch_size=batch_size, image_size=IMAGE_SIZE,
+            interpolation="bilinear", shuffle=shuffle,
+        )
+        names = dataset.class_names
+    index_map = tf.constant(class_index_map(names))
+    return dataset.map(
+        lambda x, y: (x, tf.one_hot(tf.gather(index_map, y), num_classes)), num_parallel_calls=tf.data.AUTOTUNE
+    ).prefetch(tf.data.AUTOTUNE)
+
+
+def distill(teacher, student, train_set, valid_set, epochs, temperature, alpha, learning_rate):
+    """
+    Train `student` against `teacher`'s softened outputs and the hard labels.
+    """
+    student_logits = tf.keras.Model(student.input, student.get_layer("logits").output)
+    optimizer = tf.keras.optimizers.Adam(learning_rate)
+    kl = tf.keras.losses.KLDivergence()
+    ce = tf.keras.losses.CategoricalCrossentropy(from_logits=True)
+
+    @tf.function
+    def step(x, y):
+        teacher_probs = teacher(x, training=False)
+        soft_targets = tf.nn.softmax(tf.math.log(teacher_probs + 1e-8) / temperature)
+        with tf.GradientTape() as tape:
+            logits = student_logits(x, training=True)
+            hard = ce(y, logits)
+            soft = kl(soft_targets, tf.nn.softmax(logits / temperature)) * temperature ** 2
+            loss = alpha * hard + (1.0 - alpha) * soft
+        grads = tape.gradient(loss, student_logits.trainable_variables)
+        optimizer.apply_gradients(zip(grads, student_logits.trainable_variables))
+        return loss
+
+    student.compile(loss="categorical_crossentropy", metrics=["accuracy"])
+    best, best_weights = -1.0, None
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        losses = [float(step(x, y)) for x, y in train_set]
+        _, val_acc = student.evaluate(valid_set, verbose=0)
+        print(f"epoch {epoch}/{epochs}: loss {statistics.fmean(losses):.4f}, "
+              f"val_accuracy {val_acc:.4f}, {time.perf_counter() - start:.0f}s")
+        # keep the best epoch, distillation can overshoot once the soft targets are fitted
+        if val_acc > best:
+            best, best_weights = val_acc, student.get_weights()
+    student.set_weights(best_weights)
+    return best
+
+
+def count_flops(model):
+    """
+    Multiply-adds times two per image, over the conv and dense layers.
+    """
+    flops = 0
+    for layer in model.layers:
+        if not isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.DepthwiseConv2D,
+                                  tf.keras.layers.SeparableConv2D, tf.keras.layers.Dense)):
+            continue
+        cin = layer.input.shape[-1]
+        out = layer.output.shape
+        positions = int(np.prod(out[1:-1])) if len(out) > 2 else 1
+        if isinstance(layer, tf.keras.layers.Dense):
+            macs = cin * out[-1]
+        elif isinstance(layer, tf.keras.layers.SeparableConv2D):
+            kh, kw = layer.kernel_size
+            macs = positions * (kh * kw * cin * layer.depth_multiplier + cin * layer.depth_multiplier * out[-1])
+        elif isinstance(layer, tf.keras.layers.DepthwiseConv2D):
+            kh, kw = layer.kernel_size
+            macs = positions * kh * kw * cin * layer.depth_multiplier
+        else:
+            kh, kw = layer.kernel_size
+            macs = positions * kh * kw * cin * out[-1]
+        flops += 2 * macs
+    return flops
+
+
+def cpu_speed(path, batch_size, iters):
+    """
+    p50 single-image latency and batched throughput through the serving engine.
+    """
+    from inference import load_engine
+    engine = load_engine(path, buckets=(1, batch_size))
+    rng = np.random.default_rng(0)
+    one = rng.uniform(0, 255, (1,) + IMAGE_SIZE + (3,)).astype(np.float32)
+    batch = rng.uniform(0, 255, (batch_size,) + IMAGE_SIZE + (3,)).astype(np.float32)
+    latencies = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        engine.predict(one)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    start = time.perf_counter()
+    rounds = max(2, iters // 4)
+    for _ in range(rounds):
+        engine.predict(batch)
+    return statistics.median(latencies), batch_size * rounds / (time.perf_counter() - start)
+
+
+def compare(teacher_path, student_path, valid_path, batch_size, iters, tolerance):
+    report = {"tolerance": tolerance}
+    valid_set = open_dataset(valid_path, batch_size, shuffle=False) if valid_path else None
+    for role, path in (("teacher", teacher_path), ("student", student_path)):
+        model = tf.keras.models.load_model(path)
+        entry = {"path": path, "params": model.count_params(), "flops": count_flops(model),
+                 "file_mb": os.path.getsize(path) / 1e6}
+        if valid_set is not None:
+            model.compile(loss="categorical_crossentropy", metrics=["accuracy"])
+            entry["val_accuracy"] = float(model.evaluate(valid_set, verbose=0)[1])
+        del model
+        entry["latency_ms"], entry["images_per_s"] = cpu_speed(path, batch_size, iters)
+        report[role] = entry
+
+    teacher, student = report["teacher"], report["student"]
+    print(f"{'':<10} {'params':>12} {'MFLOPs':>9} {'file MB':>8} {'p50 ms':>8} {'img/s':>8} {'val acc':>8}")
+    for role in ("teacher", "student"):
+        e = report[role]
+        acc = f"{e['val_accuracy']:.4f}" if "val_accuracy" in e else "-"
+        print(f"{role:<10} {e['params']:>12,} {e['flops'] / 1e6:>9.1f} {e['file_mb']:>8.1f} "
+              f"{e['latency_ms']:>8.2f} {e['images_per_s']:>8.1f} {acc:>8}")
+    print(f"student: {teacher['params'] / student['params']:.1f}x fewer parameters, "
+          f"{teacher['flops'] / student['flops']:.1f}x fewer FLOPs, "
+          f"{teacher['latency_ms'] / student['latency_ms']:.1f}x lower latency")
+    ok = True
+    if "val_accuracy" in student:
+        drop = teacher["val_accuracy"] - student["val_accuracy"]
+        report["accuracy_drop"] = drop
+        ok = drop <= tolerance
+        print(f"accuracy drop {drop:+.4f} against a tolerance of {tolerance:.4f}: {'ok' if ok else 'TOO LARGE'}")
+    report["within_tolerance"] = ok
+
+    with open(os.path.splitext(student_path)[0] + ".report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train", help="distil the teacher into a new student")
+    train.add_argument("--train", required=True, help="shard directory or image tree")
+    train.add_argument("--valid", required=True, help="shard directory or image tree")
+    train.add_argument("-o", "--output", default="student_model.keras")
+    train.add_argument("--epochs", type=int, default=10)
+    train.add_argument("--temperature", type=float, default=4.0)
+    train.add_argument("--alpha", type=float, default=0.3, help="weight of the hard-label loss")
+    train.add_argument("--learning-rate", type=float, default=1e-3)
+    cmp = sub.add_parser("compare", help="compare an existing student with the teacher")
+    cmp.add_argument("student")
+    cmp.add_argument("--valid", help="shard directory or image tree, for accuracy")
+    for p in (train, cmp):
+        p.add_argument("--teacher", default="trained_model.keras")
+        p.add_argument("--batch-size", type=int, default=32)
+        p.add_argument("--iters", type=int, default=30, help="timed predictions for the latency figures")
+        p.add_argument("--tolerance", type=float, default=0.01, help="allowed drop in validation accuracy")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        teacher = tf.keras.models.load_model(args.teacher)
+        teacher.trainable = False
+        num_classes = teacher.output_shape[-1]
+        student = build_student(num_classes, teacher.input_shape[1:])
+        train_set = open_dataset(args.train, args.batch_size, shuffle=True, num_classes=num_classes)
+        valid_set = open_dataset(args.valid, args.batch_size, shuffle=False, num_classes=num_classes)
+        best = distill(teacher, student, train_set, valid_set, args.epochs, args.temperature, args.alpha,
+                       args.learning_rate)
+        student.save(args.output)
+        print(f"Saved the best student (val_accuracy {best:.4f}) to {args.output}")
+        del teacher
+        args.student = args.output
+
+    ok = compare(args.teacher, args.student, args.valid, args.batch_size, args.iters, args.tolerance)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
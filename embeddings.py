@@ -0,0 +1,355 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: nothing stops two processes opening one index
+    fcntl = None
+
+# what is kept alongside each embedding; the key is the start of the upload's sha256
+ENTRY_DTYPE = np.dtype([("class_index", "<i2"), ("confidence", "<f4"), ("created", "<f8"), ("key", "S32")])
+DTYPES = ("float16", "int8")
+
+
+class IndexInUse(RuntimeError):
+    """
+    Another process already has the embedding index open.
+    """
+
+
+class EmbeddingIndex:
+    """
+    Append-only store of image embeddings with cosine top-k search, kept in
+    memory-mapped files under `path`, so it costs page cache rather than heap
+    and is there again after a restart.
+
+    Embeddings are reduced to `dim` dimensions with a fixed random projection,
+    L2-normalised and stored as int8 scaled by 127, or as float16. A million
+    256-dimensional int8 entries take 256 MB on disk. int8 is the default since
+    NumPy widens it to float32 several times faster than float16.
+
+    Below `ivf_min` entries a search scans everything. From then on the index
+    is partitioned: about sqrt(N) k-means centroids are trained in a background
+    thread and each entry is filed under its nearest one. A search scans the
+    entries of the `nprobe` centroids closest to the query, stopping early once
+    it has `max_candidates`, so lopsided partitions cannot blow up its cost.
+    The partitioning is retrained each time the index grows fourfold.
+
+    An index belongs to one process: the entry count lives in memory and rows
+    are appended without coordination, so opening one that another process
+    holds raises IndexInUse. The count is saved with the memory maps flushed
+    every `save_every` entries and on `flush`, so a crash loses at most the
+    entries added since, never the index.
+    """
+
+    def __init__(self, path, source_dim, dim=256, dtype="int8", ivf_min=20000, nprobe=8, max_candidates=4096,
+                 save_every=1024):
+        if dtype not in DTYPES:
+            raise ValueError(f"Embedding dtype must be one of {', '.join(DTYPES)}, not {dtype}")
+        self.path = path
+        self.nprobe = nprobe
+        self.max_candidates = max_candidates
+        self.ivf_min = ivf_min
+        self.save_every = save_every
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, "lock"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise IndexInUse(f"{path} is open in another process")
+        state = self._read_state()
+        if state is not None:
+            if state["source_dim"] != source_dim:
+                raise ValueError(f"{path} holds {state['source_dim']}-d embeddings, the model gives {source_dim}")
+            dim, dtype = state["dim"], state["dtype"]
+        self.source_dim = source_dim
+        self.dim = min(dim, source_dim)
+        self.dtype = np.dtype(dtype)
+        self.count = state["count"] if state else 0
+        self.trained_count = state["trained_count"] if state else 0
+
+        projection_path = os.path.join(path, "projection.npy")
+        if self.dim == source_dim:
+            self.projection = None
+        elif os.path.exists(projection_path):
+            self.projection = np.load(projection_path)
+        else:
+            rng = np.random.default_rng(0)
+            self.projection = (rng.standard_normal((source_dim, self.dim)) / np.sqrt(self.dim)).astype(np.float32)
+            np.save(projection_path, self.projection)
+
+        self.saved_count = self.count
+        # _lock guards what searches read; _write_lock serialises changes and saves, and is taken first
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._training = False
+        self._capacity = 0
+        self._vectors = self._entries = self._lists = None
+        self._grow(max(self.count, 1024))
+
+        self.centroids = None
+        self._postings = None
+        self._tail = None
+        centroids_path = os.path.join(path, "centroids.npy")
+        if self.trained_count and os.path.exists(centroids_path):
+            self._set_partitions(np.load(centroids_path))
+        if state is None:
+            self._write_state()
+
+    def _read_state(self):
+        try:
+            with open(os.path.join(self.path, "state.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save(self):
+        # called holding _write_lock, so nothing it writes can change under it
+        for m in (self._vectors, self._entries, self._lists):
+            m.flush()
+        self._write_state()
+        self.saved_count = self.count
+
+    def _write_state(self):
+        state = {"count": self.count, "source_dim": self.source_dim, "dim": self.dim, "dtype": self.dtype.name,
+                 "trained_count": self.trained_count}
+        tmp = os.path.join(self.path, "state.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, os.path.join(self.path, "state.json"))
+
+    def _map(self, name, dtype, shape):
+        filename = os.path.join(self.path, name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        # extend the file in place, rows already written stay where they are
+        with open(filename, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(filename, dtype=dtype, mode="r+", shape=shape)
+
+    def _grow(self, needed):
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2, 1024)
+        for m in (self._vectors, self._entries, self._lists):
+            if m is not None:
+                m.flush()
+        # searches holding the old maps keep working, they only read rows below their count
+        self._vectors = self._map("vectors.bin", self.dtype, (capacity, self.dim))
+        self._entries = self._map("entries.bin", ENTRY_DTYPE, (capacity,))
+        self._lists = self._map("lists.bin", np.int32, (capacity,))
+        self._capacity = capacity
+
+    def encode(self, embeddings):
+        """
+        Project and normalise raw embeddings into (N, dim) float32 unit vectors.
+        """
+        x = np.atleast_2d(np.asarray(embeddings, np.float32))
+        if self.projection is not None:
+            x = x @ self.projection
+        return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+    def _store(self, unit):
+        if self.dtype == np.int8:
+            return np.round(unit * 127).astype(np.int8)
+        return unit.astype(np.float16)
+
+    def _load(self, rows):
+        x = rows.astype(np.float32)
+        return x / 127 if self.dtype == np.int8 else x
+
+    def _scores(self, rows, q):
+        # scale the query rather than every stored row
+        return rows.astype(np.float32) @ (q / 127 if self.dtype == np.int8 else q)
+
+    def add(self, embeddings, class_index, confidence, keys):
+        """
+        Append raw embeddings with their top-1 class, confidence and upload key.
+        Returns the new entries' ids.
+        """
+        with self._write_lock:
+            return self._add(embeddings, class_index, confidence, keys)
+
+    def add_if_new(self, embedding, class_index, confidence, key, min_similarity):
+        """
+        Append one raw embedding unless a stored entry is at least
+        `min_similarity` close to it. Returns that entry's id and similarity,
+        or None if the embedding was added. No add can slip in between the
+        search and the add, so two uploads of one image are never both stored.
+        """
+        with self._write_lock:
+            if min_similarity > 0:
+                ids, scores = self.search(embedding, 1)
+                if len(ids) and scores[0] >= min_similarity:
+                    return int(ids[0]), float(scores[0])
+            self._add(embedding, class_index, confidence, [key])
+        return None
+
+    def _add(self, embeddings, class_index, confidence, keys):
+        unit = self.encode(embeddings)
+        n = len(unit)
+        with self._lock:
+            start = self.count
+            self._grow(start + n)
+            ids = np.arange(start, start + n)
+            self._vectors[start:start + n] = self._store(unit)
+            entries = self._entries[start:start + n]
+            entries["class_index"] = class_index
+            entries["confidence"] = confidence
+            entries["created"] = time.time()
+            entries["key"] = [k[:32].encode() if isinstance(k, str) else k[:32] for k in np.atleast_1d(keys)]
+            if self.centroids is not None:
+                lists = np.argmax(unit @ self.centroids.T, axis=1)
+                self._lists[start:start + n] = lists
+                for i, lst in zip(ids, lists):
+                    self._tail[lst].append(i)
+            else:
+                self._lists[start:start + n] = -1
+            self.count = start + n
+            retrain = (not self._training and self.count >= self.ivf_min
+                       and (not self.trained_count or self.count >= 4 * self.trained_count))
+            if retrain:
+                self._training = True
+        # searches are not held up by the save
+        if self.count - self.saved_count >= self.save_every:
+            self._save()
+        if retrain:
+            threading.Thread(target=self._train, name="ivf-train", daemon=True).start()
+        return ids
+
+    def search(self, embedding, k=5, nprobe=None):
+        """
+        Ids and cosine similarities of the `k` stored entries closest to one raw embedding, best first.
+        """
+        q = self.encode(embedding)[0]
+        with self._lock:
+            count, vectors, centroids = self.count, self._vectors, self.centroids
+            if centroids is not None:
+                parts = []
+                size = 0
+                for c in np.argsort(-(centroids @ q))[:nprobe or self.nprobe]:
+                    if size >= self.max_candidates:
+                        break
+                    parts += [self._postings[c], np.array(self._tail[c], np.int64)]
+                    size += len(parts[-2]) + len(parts[-1])
+                candidates = np.concatenate(parts)
+        if count == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        if centroids is not None:
+            candidates.sort()
+            scores = self._scores(vectors[candidates], q)
+        else:
+            candidates = None
+            # scan in slices so the float32 copy stays small
+            scores = np.concatenate([self._scores(vectors[s:min(s + 65536, count)], q) for s in range(0, count, 65536)])
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top])]
+        ids = candidates[top] if candidates is not None else top
+        # quantisation can push a perfect match a little past 1
+        return ids.astype(np.int64), np.clip(scores[top], -1.0, 1.0)
+
+    def entries(self, ids):
+        """
+        Stored metadata for entry ids, as dicts.
+        """
+        rows = self._entries[np.asarray(ids, np.int64)]
+        return [
+            {"id": int(i), "class_index": int(r["class_index"]), "confidence": float(r["confidence"]),
+             "created": float(r["created"]), "key": r["key"].decode()}
+            for i, r in zip(ids, rows)
+        ]
+
+    def _set_partitions(self, centroids):
+        n = self.trained_count
+        lists = np.asarray(self._lists[:n])
+        order = np.argsort(lists, kind="stable")
+        bounds = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+        self._postings = [order[bounds[c]:bounds[c + 1]] for c in range(len(centroids))]
+        self._tail = [[] for _ in range(len(centroids))]
+        # entries added after the partitioning was trained were filed as they came in
+        for i in range(n, self.count):
+            lst = int(self._lists[i])
+            if lst >= 0:
+                self._tail[lst].append(i)
+        self.centroids = centroids
+
+    def _assign(self, centroids, start, stop):
+        # into a new array, the stored lists still belong to the current centroids
+        lists = np.empty(stop - start, np.int32)
+        for s in range(start, stop, 65536):
+            e = min(s + 65536, stop)
+            lists[s - start:e - start] = np.argmax(self._load(self._vectors[s:e]) @ centroids.T, axis=1)
+        return lists
+
+    def _train(self, iterations=10, per_centroid=40, seed=0):
+        try:
+            n = self.count
+            nlist = int(np.clip(np.sqrt(n), 16, 4096))
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(n, min(n, nlist * per_centroid), replace=False))
+            x = self._load(self._vectors[sample])
+            centroids = x[rng.choice(len(x), nlist, replace=False)]
+            for _ in range(iterations):
+                assign = np.argmax(x @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, x)
+                filled = np.bincount(assign, minlength=nlist) > 0
+                # an empty centroid keeps its place rather than collapsing to zero
+                centroids[filled] = sums[filled] / np.linalg.norm(sums[filled], axis=1, keepdims=True).clip(1e-12)
+            lists = self._assign(centroids, 0, n)
+            with self._write_lock:
+                with self._lock:
+                    # searches see either the old partitioning or the new one, never a mix
+                    self._lists[:n] = lists
+                    # entries added while training ran
+                    self._lists[n:self.count] = self._assign(centroids, n, self.count)
+                    self._lists.flush()
+                    tmp = os.path.join(self.path, "centroids.tmp.npy")
+                    np.save(tmp, centroids)
+                    os.replace(tmp, os.path.join(self.path, "centroids.npy"))
+                    self.trained_count = n
+                    self._set_partitions(centroids)
+                self._save()
+            print(f"Embedding index partitioned into {nlist} lists over {n} entries.")
+        except Exception as e:
+            print(f"Embedding index training failed: {e}")
+        finally:
+            self._training = False
+
+    def flush(self):
+        """
+        Write everything added so far to disk.
+        """
+        with self._write_lock:
+            self._save()
+
+    def close(self):
+        """
+        Flush and let another process open the index. Searches already running
+        can finish, but nothing may be added after this.
+        """
+        self.flush()
+        self._lock_file.close()
+
+    def stats(self):
+        return {
+            "entries": self.count,
+            "dim": self.dim,
+            "source_dim": self.source_dim,
+            "dtype": self.dtype.name,
+            "partitions": len(self.centroids) if self.centroids is not None else 0,
+            "partitioned_entries": self.trained_count,
+            "nprobe": self.nprobe,
+            "max_candidates": self.max_candidates,
+            "bytes_on_disk": self._capacity * (self.dim * self.dtype.itemsize + ENTRY_DTYPE.itemsize + 4),
+        }
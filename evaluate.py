@@ -0,0 +1,206 @@
+"""
+Evaluate a model on a labelled image tree in one streaming pass.
+
+Usage:
+    python evaluate.py --data-dir valid/ -o eval/
+    python evaluate.py --shards shards/valid --model trained_model_float32.tflite -o eval/ --batch-size 128
+
+--data-dir is a class-per-directory tree like the one train.ipynb validates
+on, read with image_dataset_from_directory and the same preprocessing as
+training. --shards reads TFRecords written by `train_data.py build` instead.
+Directory names are matched to class_metadata.json labels, so a tree holding
+only some of the classes still scores against the right indices.
+
+Each batch is predicted once and its labels come with it, so the data is read
+a single time. Only a 38x38 confusion matrix and a fixed-size latency
+histogram are kept between batches, which keeps memory flat however large the
+set is.
+
+Writes to the -o directory:
+    report.json        accuracy, per-class precision/recall/F1/support, latency
+    confusion.csv      rows are true classes, columns predicted classes
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from classes import CLASS_LABELS
+from inference import load_engine, model_version
+from preprocessing import IMAGE_SIZE
+
+
+class LatencyHistogram:
+    """
+    Log-spaced histogram of durations in seconds, for percentiles in constant memory.
+    Percentiles are exact to within one bin, about 2%.
+    """
+
+    def __init__(self, low=1e-5, high=100.0, bins=800):
+        self.edges = np.geomspace(low, high, bins + 1)
+        self.counts = np.zeros(bins + 2, np.int64)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        # bin 0 and the last bin catch values outside [low, high]
+        self.counts[np.searchsorted(self.edges, seconds, side="right")] += 1
+        self.total += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * self.count))
+        # the upper edge of the bin the percentile falls in, never past the largest value seen
+        return min(float(self.edges[min(i, len(self.edges) - 1)]), self.max)
+
+    def summary(self):
+        if not self.count:
+            return None
+        ms = 1000.0
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * ms,
+            "p50_ms": self.percentile(50) * ms,
+            "p95_ms": self.percentile(95) * ms,
+            "p99_ms": self.percentile(99) * ms,
+            "max_ms": self.max * ms,
+        }
+
+
+def class_index_map(names):
+    """
+    Map a dataset's own label indices (sorted directory names) to model class indices.
+    """
+    unknown = [n for n in names if n not in CLASS_LABELS]
+    if unknown:
+        sys.exit(f"Directories that are not known classes: {', '.join(unknown)}")
+    return np.array([CLASS_LABELS.index(n) for n in names], np.int64)
+
+
+def open_dataset(args):
+    """
+    (dataset, index map) where the dataset yields (float32 images, integer labels) batches.
+    """
+    if args.shards:
+        from train_data import load_dataset, read_manifest
+        names = read_manifest(args.shards)["class_names"]
+        dataset = load_dataset(args.shards, args.batch_size, shuffle=False, label_mode="int")
+    else:
+        import tensorflow as tf
+        dataset = tf.keras.utils.image_dataset_from_directory(
+            args.data_dir, label_mode="int", batch_size=args.batch_size, image_size=IMAGE_SIZE,
+            interpolation="bilinear", shuffle=False,
+        )
+        names = dataset.class_names
+        dataset = dataset.prefetch(tf.data.AUTOTUNE)
+    return dataset, class_index_map(names)
+
+
+def per_class(confusion):
+    """
+    Precision, recall, F1 and support per class from a confusion matrix.
+    """
+    tp = np.diag(confusion).astype(np.float64)
+    predicted = confusion.sum(axis=0)
+    actual = confusion.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(actual > 0, tp / actual, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return precision, recall, f1, actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data-dir", help="class-per-directory image tree")
+    source.add_argument("--shards", help="directory written by train_data.py build")
+    parser.add_argument("-o", "--output", required=True, help="directory for report.json and confusion.csv")
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="TFLite interpreter threads")
+    args = parser.parse_args()
+
+    engine = load_engine(args.model, buckets=(args.batch_size,), num_threads=args.threads)
+    n = engine.num_classes
+    if n != len(CLASS_LABELS):
+        sys.exit(f"{args.model} predicts {n} classes but class_metadata.json describes {len(CLASS_LABELS)}")
+    dataset, index_map = open_dataset(args)
+
+    confusion = np.zeros((n, n), np.int64)
+    forward = LatencyHistogram()
+    waiting = LatencyHistogram()
+    images = 0
+    start = time.perf_counter()
+    mark = start
+    for x, y in dataset:
+        x, y = x.numpy(), index_map[y.numpy()]
+        waiting.observe(time.perf_counter() - mark)
+        t = time.perf_counter()
+        predicted = engine.predict(x).argmax(axis=1)
+        forward.observe(time.perf_counter() - t)
+        # one bincount over true * n + predicted fills the whole batch into the matrix
+        confusion += np.bincount(y * n + predicted, minlength=n * n).reshape(n, n)
+        images += len(y)
+        mark = time.perf_counter()
+        if forward.count % 50 == 0:
+            print(f"{images} images, {images / (mark - start):.0f} images/s")
+    elapsed = time.perf_counter() - start
+    if not images:
+        sys.exit("No images found.")
+
+    precision, recall, f1, support = per_class(confusion)
+    present = support > 0
+    report = {
+        "model": args.model,
+        "model_version": model_version(args.model),
+        "data": args.shards or args.data_dir,
+        "images": images,
+        "accuracy": float(np.trace(confusion) / images),
+        # macro averages only over classes that appear in the data
+        "macro_precision": float(precision[present].mean()),
+        "macro_recall": float(recall[present].mean()),
+        "macro_f1": float(f1[present].mean()),
+        "images_per_s": images / elapsed,
+        "latency": {
+            "forward_per_batch": forward.summary(),
+            "input_wait_per_batch": waiting.summary(),
+            "forward_per_image_ms": forward.total * 1000.0 / images,
+        },
+        "classes": [
+            {"label": label, "precision": float(p), "recall": float(r), "f1": float(f), "support": int(s)}
+            for label, p, r, f, s in zip(CLASS_LABELS, precision, recall, f1, support)
+        ],
+    }
+
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(args.output, "confusion.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["true\\predicted"] + list(CLASS_LABELS))
+        for label, row in zip(CLASS_LABELS, confusion):
+            writer.writerow([label] + row.tolist())
+
+    print(f"{'class':<52} {'prec':>6} {'recall':>6} {'f1':>6} {'support':>8}")
+    for c in report["classes"]:
+        if c["support"]:
+            print(f"{c['label']:<52} {c['precision']:>6.3f} {c['recall']:>6.3f} {c['f1']:>6.3f} {c['support']:>8}")
+    print(f"\naccuracy {report['accuracy']:.4f}  macro F1 {report['macro_f1']:.4f}  "
+          f"over {images} images at {report['images_per_s']:.0f} images/s")
+    fw = report["latency"]["forward_per_batch"]
+    print(f"forward pass per batch of {args.batch_size}: p50 {fw['p50_ms']:.1f} ms, "
+          f"p95 {fw['p95_ms']:.1f} ms, p99 {fw['p99_ms']:.1f} ms")
+    print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Export trained_model.keras to TFLite for CPU serving.
+
+Usage:
+    python export_tflite.py --variants float32,dynamic,float16
+    python export_tflite.py --variants int8 --calibration-dir valid/ --calibration-samples 300
+
+Variants:
+    float32   plain conversion, no quantization
+    dynamic   dynamic-range quantization: int8 weights, float activations
+    float16   float16 weights
+    int8      full integer quantization of weights and activations, calibrated
+              on images from --calibration-dir (inputs and outputs stay float)
+
+Each variant is written as <out-dir>/<model name>_<variant>.tflite. Serve one by
+starting app.py with INFERENCE_BACKEND=tflite TFLITE_MODEL_PATH=<file>; without
+TFLITE_MODEL_PATH it serves the dynamic variant of MODEL_PATH, which the default
+run writes.
+"""
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from inference import DEFAULT_TFLITE_VARIANT, tflite_export_path
+from preprocessing import preprocess_image
+from score import list_images
+
+VARIANTS = ("float32", "dynamic", "float16", "int8")
+
+
+def representative_dataset(calibration_dir, samples, seed=0):
+    """
+    Yields single preprocessed images for int8 calibration, spread over all classes.
+    """
+    paths = list_images(calibration_dir)
+    if not paths:
+        sys.exit(f"No images found under {calibration_dir}")
+    random.Random(seed).shuffle(paths)
+
+    def gen():
+        used = 0
+        for path in paths:
+            if used >= samples:
+                break
+            try:
+                with open(path, "rb") as f:
+                    arr = preprocess_image(f.read())
+            except Exception:
+                continue
+            used += 1
+            yield [arr[np.newaxis]]
+
+    return gen
+
+
+def convert(model, variant, calibration_dir=None, calibration_samples=200):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if variant == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if not calibration_dir:
+            sys.exit("The int8 variant needs --calibration-dir")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(calibration_dir, calibration_samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif variant != "float32":
+        raise ValueError(f"Unknown variant {variant!r}, expected one of {', '.join(VARIANTS)}")
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--variants", default=f"{DEFAULT_TFLITE_VARIANT},float16", help=f"comma-separated, from {', '.join(VARIANTS)}")
+    parser.add_argument("--calibration-dir", help="directory of sample images for int8 calibration")
+    parser.add_argument("--calibration-samples", type=int, default=200)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    os.makedirs(args.out_dir, exist_ok=True)
+    for variant in [v.strip() for v in args.variants.split(",") if v.strip()]:
+        tflite_model = convert(model, variant, args.calibration_dir, args.calibration_samples)
+        path = tflite_export_path(args.model, variant, args.out_dir)
+        with open(path, "wb") as f:
+            f.write(tflite_model)
+        print(f"{variant:<8} {len(tflite_model) / 2**20:8.1f} MB  {path}")
+
+
+if __name__ == "__main__":
+    main()
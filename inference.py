@@ -0,0 +1,196 @@
+import hashlib
+import importlib
+import os
+
+import numpy as np
+
+# TensorFlow is imported inside the engines rather than here, so importing this
+# module stays fast and the tflite backend can run without TensorFlow at all
+
+# batch sizes we trace ahead of time; other sizes are padded up to the next one
+DEFAULT_BUCKETS = (1, 2, 4, 8, 16, 32)
+# the export_tflite.py variant the tflite backend serves unless told otherwise
+DEFAULT_TFLITE_VARIANT = "dynamic"
+
+
+def tflite_export_path(model_path, variant=DEFAULT_TFLITE_VARIANT, out_dir="."):
+    """
+    Where export_tflite.py writes `variant` of the Keras model at `model_path`.
+    """
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(out_dir, f"{stem}_{variant}.tflite")
+
+
+class BucketedEngine:
+    """
+    Shared batching logic: split large batches and pad small ones up to a fixed
+    bucket size, so the backend only ever sees a handful of input shapes.
+
+    Subclasses set `input_shape`, `num_classes` and `buckets` and implement `_forward(bucket, x)`.
+    Engines with a non-zero `embedding_dim` return each image's embedding after
+    its softmax row, and `predict` strips it unless asked for.
+    """
+
+    input_shape = ()
+    num_classes = 0
+    embedding_dim = 0
+    buckets = DEFAULT_BUCKETS
+
+    def _forward(self, bucket, x):
+        raise NotImplementedError
+
+    def warmup(self):
+        """
+        Run every bucket once so the first real request is not slow.
+        """
+        for b in self.buckets:
+            self._forward(b, np.zeros((b,) + self.input_shape, np.float32))
+
+    def _bucket_for(self, n):
+        for b in self.buckets:
+            if b >= n:
+                return b
+        return self.buckets[-1]
+
+    def predict(self, batch, embeddings=False):
+        """
+        Return softmax outputs for a (N, H, W, C) batch as a NumPy array. With
+        `embeddings`, each row is followed by the image's `embedding_dim` embedding.
+        """
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.ndim == len(self.input_shape):
+            batch = batch[np.newaxis]
+        largest = self.buckets[-1]
+        outputs = []
+        for start in range(0, len(batch), largest):
+            chunk = batch[start:start + largest]
+            n = len(chunk)
+            bucket = self._bucket_for(n)
+            if bucket != n:
+                # pad with zeros up to the traced size, the extra rows are dropped below
+                chunk = np.concatenate([chunk, np.zeros((bucket - n,) + self.input_shape, np.float32)])
+            outputs.append(self._forward(bucket, chunk)[:n])
+        outputs = np.concatenate(outputs)
+        return outputs if embeddings or not self.embedding_dim else outputs[:, :self.num_classes]
+
+
+class InferenceEngine(BucketedEngine):
+    """
+    Wraps a loaded Keras model in traced `tf.function`s, one per bucketed batch size.
+
+    `model.predict` builds a data adapter and callbacks on every call, which costs
+    more than the forward pass itself for a single image. Here every call goes
+    straight into a graph that was traced and warmed up once.
+
+    With `embeddings`, the same pass also returns the input of the final Dense
+    layer, i.e. the penultimate activations the classifier head sees.
+    """
+
+    def __init__(self, model, buckets=DEFAULT_BUCKETS, warmup=True, embeddings=False):
+        import tensorflow as tf
+
+        self._tf = tf
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+        self.num_classes = int(model.output_shape[-1])
+        self.buckets = tuple(sorted(set(int(b) for b in buckets)))
+
+        if embeddings:
+            head = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Dense)][-1]
+            self.embedding_dim = int(head.input.shape[-1])
+            both = tf.keras.Model(model.inputs, [model.outputs[0], head.input])
+            forward = tf.function(lambda x: tf.concat(both(x, training=False), axis=1))
+        else:
+            forward = tf.function(lambda x: model(x, training=False))
+        self._fns = {
+            b: forward.get_concrete_function(tf.TensorSpec((b,) + self.input_shape, tf.float32))
+            for b in self.buckets
+        }
+        if warmup:
+            self.warmup()
+
+    def _forward(self, bucket, x):
+        return self._fns[bucket](self._tf.constant(x)).numpy()
+
+
+def tflite_interpreter_class():
+    """
+    The lightest TFLite interpreter installed: the standalone LiteRT or
+    tflite_runtime package if present, otherwise the one bundled with TensorFlow.
+    """
+    for module in ("ai_edge_litert.interpreter", "tflite_runtime.interpreter"):
+        try:
+            return importlib.import_module(module).Interpreter
+        except ImportError:
+            continue
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteEngine(BucketedEngine):
+    """
+    Same interface as InferenceEngine, backed by the TFLite interpreter.
+
+    One interpreter is kept per bucket size so tensors are never reallocated on
+    the hot path. The interpreters map the .tflite file rather than copying it.
+    Quantized inputs and outputs are converted from and to float here.
+    Interpreters are not thread-safe, so call `predict` from one thread at a time.
+    """
+
+    def __init__(self, model_path, num_threads=None, buckets=DEFAULT_BUCKETS, warmup=True):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.buckets = tuple(sorted(set(int(b) for b in buckets)))
+        self._interpreter_class = tflite_interpreter_class()
+        probe = self._interpreter_class(model_path=model_path)
+        self.input_shape = tuple(int(d) for d in probe.get_input_details()[0]["shape"][1:])
+        self.num_classes = int(probe.get_output_details()[0]["shape"][-1])
+        self._interpreters = {b: self._make_interpreter(b) for b in self.buckets}
+        if warmup:
+            self.warmup()
+
+    def _make_interpreter(self, batch_size):
+        interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+        index = interpreter.get_input_details()[0]["index"]
+        interpreter.resize_tensor_input(index, (batch_size,) + self.input_shape, strict=False)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def _forward(self, bucket, x):
+        interpreter = self._interpreters[bucket]
+        inp = interpreter.get_input_details()[0]
+        out = interpreter.get_output_details()[0]
+        if inp["dtype"] != np.float32:
+            scale, zero_point = inp["quantization"]
+            info = np.iinfo(inp["dtype"])
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(inp["dtype"])
+        interpreter.set_tensor(inp["index"], x)
+        interpreter.invoke()
+        y = interpreter.get_tensor(out["index"])
+        if out["dtype"] != np.float32:
+            scale, zero_point = out["quantization"]
+            y = (y.astype(np.float32) - zero_point) * scale
+        return y
+
+
+def load_engine(path="trained_model.keras", buckets=DEFAULT_BUCKETS, warmup=True, num_threads=None, embeddings=False):
+    """
+    Load a saved Keras or TFLite model and wrap it in the matching engine.
+    Embeddings are only available from Keras models.
+    """
+    if path.endswith(".tflite"):
+        return TFLiteEngine(path, num_threads=num_threads, buckets=buckets, warmup=warmup)
+    import tensorflow as tf
+    model = tf.keras.models.load_model(path)
+    return InferenceEngine(model, buckets=buckets, warmup=warmup, embeddings=embeddings)
+
+
+def model_version(path="trained_model.keras"):
+    """
+    Short content hash of a saved model file, changes whenever the file is replaced.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
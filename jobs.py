@@ -0,0 +1,280 @@
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from preprocessing import UploadTooLarge
+
+
+class QueueFull(Exception):
+    """
+    Queuing the job would put more images in the queue than it takes.
+    """
+
+
+class JobQueue:
+    """
+    Durable queue of prediction jobs, kept in a SQLite file with the uploaded
+    images stored under `upload_dir`.
+
+    A job is a set of images plus the ranking options it was submitted with.
+    Workers `claim` queued images across all jobs, oldest first, so one forward
+    pass can serve several jobs, then `complete` them with their results. Each
+    upload is deleted as soon as its result is stored, and finished jobs are
+    dropped `retention_s` after they complete.
+
+    Several processes can share one queue. A claim is a lease held by this
+    queue's `owner` for `lease_s` seconds; images whose lease ran out (the
+    process died, or took far too long) are put back in the queue by
+    `requeue_expired`, and `release` hands back a queue's claims when it shuts
+    down cleanly. A result is only stored by the queue currently holding the
+    claim, so no image is ever counted twice.
+    """
+
+    def __init__(self, db_path, upload_dir, retention_s=86400.0, lease_s=300.0):
+        self.upload_dir = upload_dir
+        self.retention_s = float(retention_s)
+        self.lease_s = float(lease_s)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(upload_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # transactions are begun explicitly, see _write
+        self._db = sqlite3.connect(db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._write() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL,"
+                " total INTEGER NOT NULL, finished INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0,"
+                " created REAL NOT NULL, completed REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                " job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT, status TEXT NOT NULL,"
+                " result TEXT, error TEXT, owner TEXT, lease_until REAL, PRIMARY KEY (job_id, idx))"
+            )
+            # queues made before claims were leased
+            columns = {row[1] for row in db.execute("PRAGMA table_info(items)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE items ADD COLUMN {column} {kind}")
+            db.execute("CREATE INDEX IF NOT EXISTS items_queued ON items (status, job_id, idx)")
+
+    @contextmanager
+    def _write(self):
+        """
+        One write transaction, taking SQLite's write lock up front so that
+        concurrent queues in other processes wait instead of interleaving.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.rollback()
+                raise
+            self._db.commit()
+
+    def _path(self, job_id, idx):
+        return os.path.join(self.upload_dir, job_id, str(idx))
+
+    def create(self, images, params, max_pending=None):
+        """
+        Store (filename, read) pairs, as from uploads.iter_upload_images, as a
+        new queued job, returning its id and number of images. Images whose
+        `read()` raises UploadTooLarge are recorded as failed straight away.
+        Raises QueueFull, keeping nothing, if the queue would then hold more
+        than `max_pending` images waiting for a result.
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.upload_dir, job_id)
+        os.makedirs(job_dir)
+        items = []
+        try:
+            for idx, (name, read) in enumerate(images):
+                try:
+                    contents = read()
+                except UploadTooLarge as e:
+                    items.append((job_id, idx, name, "failed", str(e)))
+                    continue
+                with open(self._path(job_id, idx), "wb") as f:
+                    f.write(contents)
+                items.append((job_id, idx, name, "queued", None))
+            if not items:
+                raise ValueError("No images found in the upload.")
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        failed = sum(1 for item in items if item[3] == "failed")
+        now = time.time()
+        try:
+            with self._write() as db:
+                # checked in the same transaction as the insert, so concurrent uploads cannot both squeeze in
+                if max_pending is not None:
+                    pending = db.execute("SELECT COUNT(*) FROM items WHERE status IN ('queued', 'running')").fetchone()[0]
+                    if pending + len(items) - failed > max_pending:
+                        raise QueueFull(f"The job queue has room for {max(0, max_pending - pending)} more images.")
+                db.execute(
+                    "INSERT INTO jobs (id, status, params, total, finished, failed, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, "queued", json.dumps(params), len(items), failed, failed, now),
+                )
+                db.executemany("INSERT INTO items (job_id, idx, filename, status, error) VALUES (?, ?, ?, ?, ?)", items)
+                self._finish_if_done(job_id, now)
+        except QueueFull:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        return job_id, len(items)
+
+    def claim(self, limit):
+        """
+        Lease up to `limit` queued images to this queue and return them as
+        (job_id, idx, path, params) tuples, oldest job first.
+        """
+        now = time.time()
+        with self._write() as db:
+            # one conditional update, so two queues can never claim the same image
+            claimed = db.execute(
+                "UPDATE items SET status = 'running', owner = ?, lease_until = ?"
+                " WHERE status = 'queued' AND rowid IN ("
+                "  SELECT i.rowid FROM items i JOIN jobs j ON j.id = i.job_id"
+                "  WHERE i.status = 'queued' ORDER BY j.created, i.idx LIMIT ?)"
+                " RETURNING job_id, idx",
+                (self.owner, now + self.lease_s, limit),
+            ).fetchall()
+            job_ids = sorted({job_id for job_id, _ in claimed})
+            jobs = {}
+            for job_id in job_ids:
+                db.execute("UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'", (job_id,))
+                jobs[job_id] = db.execute("SELECT params, created FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        # RETURNING gives no order guarantee
+        claimed.sort(key=lambda row: (jobs[row[0]][1], row[0], row[1]))
+        return [(job_id, idx, self._path(job_id, idx), json.loads(jobs[job_id][0])) for job_id, idx in claimed]
+
+    def complete(self, outcomes):
+        """
+        Store (job_id, idx, result, error) outcomes of images this queue
+        claimed and delete their uploads. Outcomes for claims that are no
+        longer ours (the lease ran out and the image was requeued) are
+        dropped. A job is done once all its images are.
+        """
+        now = time.time()
+        stored = []
+        with self._write() as db:
+            for job_id, idx, result, error in outcomes:
+                updated = db.execute(
+                    "UPDATE items SET status = ?, result = ?, error = ?, owner = NULL, lease_until = NULL"
+                    " WHERE job_id = ? AND idx = ? AND status = 'running' AND owner = ?",
+                    ("failed" if error else "done", json.dumps(result) if result is not None else None, error,
+                     job_id, idx, self.owner),
+                ).rowcount
+                if not updated:
+                    continue
+                db.execute(
+                    "UPDATE jobs SET finished = finished + 1, failed = failed + ? WHERE id = ?",
+                    (1 if error else 0, job_id),
+                )
+                stored.append((job_id, idx))
+            for job_id in {job_id for job_id, _ in stored}:
+                self._finish_if_done(job_id, now)
+        for job_id, idx in stored:
+            try:
+                os.remove(self._path(job_id, idx))
+            except FileNotFoundError:
+                pass
+        return len(stored)
+
+    def _finish_if_done(self, job_id, now):
+        self._db.execute(
+            "UPDATE jobs SET status = 'done', completed = ? WHERE id = ? AND finished >= total AND status != 'done'",
+            (now, job_id),
+        )
+
+    def requeue_expired(self):
+        """
+        Put images whose claim has expired back in the queue. Claims of live
+        queues, in this process or another, are left alone.
+        """
+        with self._write() as db:
+            return db.execute(
+                "UPDATE items SET status = 'queued', owner = NULL, lease_until = NULL"
+                " WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+                (time.time(),),
+            ).rowcount
+
+    def release(self):
+        """
+        Put images this queue claimed but did not complete back in the queue,
+        when shutting down cleanly.
+        """
+        with self._write() as db:
+            return db.execute(
+                "UPDATE items SET status = 'queued', owner = NULL, lease_until = NULL"
+                " WHERE status = 'running' AND owner = ?",
+                (self.owner,),
+            ).rowcount
+
+    def get(self, job_id):
+        """
+        Status and per-image results of a job, or None if it is unknown or expired.
+        """
+        with self._lock:
+            job = self._db.execute(
+                "SELECT status, params, total, finished, failed, created, completed FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            items = self._db.execute(
+                "SELECT idx, filename, status, result, error FROM items WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        status, params, total, finished, failed, created, completed = job
+        results = []
+        for idx, filename, item_status, result, error in items:
+            entry = {"index": idx, "filename": filename, "status": item_status}
+            if result is not None:
+                entry.update(json.loads(result))
+            if error is not None:
+                entry["error"] = error
+            results.append(entry)
+        return {
+            "id": job_id, "status": status, "params": json.loads(params), "total": total, "finished": finished,
+            "failed": failed, "created": created, "completed": completed,
+            "expires": completed + self.retention_s if completed else None, "results": results,
+        }
+
+    def purge_expired(self):
+        """
+        Drop jobs that finished more than `retention_s` ago, with any files left for them.
+        """
+        cutoff = time.time() - self.retention_s
+        with self._write() as db:
+            expired = [r[0] for r in db.execute(
+                "SELECT id FROM jobs WHERE status = 'done' AND completed < ?", (cutoff,)
+            ).fetchall()]
+            db.executemany("DELETE FROM items WHERE job_id = ?", [(j,) for j in expired])
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(j,) for j in expired])
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.upload_dir, job_id), ignore_errors=True)
+        return len(expired)
+
+    def pending(self):
+        """
+        Images still waiting for a result.
+        """
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM items WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        with self._lock:
+            jobs = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            items = dict(self._db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+        return {"jobs": jobs, "images": items, "retention_s": self.retention_s}
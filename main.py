@@ -1,17 +1,59 @@
 import streamlit as st
-import tensorflow as tf
 import numpy as np
+import os
+import time
 
-# tensorflow model prediction
+from classes import CLASS_LABELS, check_output_width
+from preprocessing import decode_image
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "trained_model.keras")
+# set to the FastAPI service's /predict/ URL to classify remotely, then TensorFlow is never imported here
+PREDICT_URL = os.environ.get("PREDICT_URL") or None
+PREDICT_TIMEOUT_S = float(os.environ.get("PREDICT_TIMEOUT_S", 30))
+PREDICT_RETRIES = int(os.environ.get("PREDICT_RETRIES", 3))
+
+
+# load the model once per process and share it across sessions,
+# the file's mtime and size are part of the cache key so a new model on disk is picked up
+@st.cache_resource(max_entries=1, show_spinner="Loading model...")
+def load_engine(path, mtime_ns, size):
+    import tensorflow as tf
+    from inference import InferenceEngine
+    start = time.perf_counter()
+    model = tf.keras.models.load_model(path)
+    loaded = time.perf_counter()
+    engine = InferenceEngine(model, buckets=(1,), warmup=False)
+    check_output_width(engine.num_classes)
+    engine.warmup()
+    warmed = time.perf_counter()
+    timings = {"load_s": loaded - start, "warmup_s": warmed - loaded}
+    print(f"Model loaded in {timings['load_s']:.2f}s, warm-up took {timings['warmup_s']:.2f}s.")
+    return engine, timings
+
+
+def get_engine():
+    stat = os.stat(MODEL_PATH)
+    return load_engine(MODEL_PATH, stat.st_mtime_ns, stat.st_size)
+
+
+# one pooled keep-alive client per process, shared across sessions
+@st.cache_resource
+def get_remote():
+    from remote import RemoteClassifier
+    return RemoteClassifier(PREDICT_URL, timeout=(3.05, PREDICT_TIMEOUT_S), retries=PREDICT_RETRIES)
+
+
+# tensorflow model prediction, in process or through the API
 def model_prediction(test_image):
-    model = tf.keras.models.load_model("trained_model.keras")
-    # prep
-    image = tf.keras.preprocessing.image.load_img(test_image, target_size=(128,128))
-    # convert to array
-    input_arr = tf.keras.preprocessing.image.img_to_array(image)
-    # convert to single img to batch
-    input_arr = np.array([input_arr])
-    prediction = model.predict(input_arr)
+    contents = test_image.getvalue()
+    if PREDICT_URL:
+        name = getattr(test_image, "name", "upload.jpg")
+        result_index, _ = get_remote().predict(contents, name, getattr(test_image, "type", None) or "image/jpeg")
+        return result_index
+    engine, _ = get_engine()
+    # same decode and resize as the API, so both modes see the same pixels
+    input_arr = decode_image(contents).astype(np.float32)[np.newaxis]
+    prediction = engine.predict(input_arr)
     result_index = np.argmax(prediction)
     return result_index
 
@@ -82,20 +124,17 @@ elif(app_mode=="Predict Disease"):
     if(st.button("Predict")):
         with st.spinner("Please wait..."):
             st.write("Prediction")
-            result_index = model_prediction(test_image)
-            # define our classnames
-            class_name = ['Apple___Apple_scab', 'Apple___Black_rot', 'Apple___Cedar_apple_rust', 'Apple___healthy',
-                        'Blueberry___healthy', 'Cherry_(including_sour)___Powdery_mildew', 
-                        'Cherry_(including_sour)___healthy', 'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot', 
-                        'Corn_(maize)___Common_rust_', 'Corn_(maize)___Northern_Leaf_Blight', 'Corn_(maize)___healthy', 
-                        'Grape___Black_rot', 'Grape___Esca_(Black_Measles)', 'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)', 
-                        'Grape___healthy', 'Orange___Haunglongbing_(Citrus_greening)', 'Peach___Bacterial_spot',
-                        'Peach___healthy', 'Pepper,_bell___Bacterial_spot', 'Pepper,_bell___healthy', 
-                        'Potato___Early_blight', 'Potato___Late_blight', 'Potato___healthy', 
-                        'Raspberry___healthy', 'Soybean___healthy', 'Squash___Powdery_mildew', 
-                        'Strawberry___Leaf_scorch', 'Strawberry___healthy', 'Tomato___Bacterial_spot', 
-                        'Tomato___Early_blight', 'Tomato___Late_blight', 'Tomato___Leaf_Mold', 
-                        'Tomato___Septoria_leaf_spot', 'Tomato___Spider_mites Two-spotted_spider_mite', 
-                        'Tomato___Target_Spot', 'Tomato___Tomato_Yellow_Leaf_Curl_Virus', 'Tomato___Tomato_mosaic_virus',
-                        'Tomato___healthy']
-            st.success("This is an image of {}".format(class_name[result_index]))
+            start = time.perf_counter()
+            try:
+                result_index = model_prediction(test_image)
+            except Exception as e:
+                if not PREDICT_URL:
+                    raise
+                st.error("The prediction service could not be reached, please try again. ({})".format(e))
+                st.stop()
+            st.success("This is an image of {}".format(CLASS_LABELS[result_index]))
+            if PREDICT_URL:
+                st.caption("Classified by {} in {:.0f} ms.".format(PREDICT_URL, (time.perf_counter() - start) * 1000))
+            else:
+                _, timings = get_engine()
+                st.caption("Model loaded in {:.2f}s, warm-up took {:.2f}s.".format(timings["load_s"], timings["warmup_s"]))
@@ -0,0 +1,59 @@
+import numpy as np
+
+from classes import CLASS_NAMES
+
+# crop name of each class, the part of the display name before " - "
+CLASS_CROPS = [name.split(" - ")[0] for name in CLASS_NAMES]
+CROPS = sorted(set(CLASS_CROPS))
+# classes that are a healthy leaf rather than a disease
+CLASS_HEALTHY = np.array([name.endswith("healthy") for name in CLASS_NAMES])
+
+
+def find_crop(crop):
+    """
+    Canonical crop name for a case-insensitive prefix such as "tomato" or "corn".
+    Raises ValueError when it matches no crop or more than one.
+    """
+    wanted = crop.strip().lower()
+    matches = [c for c in CROPS if c.lower() == wanted] or [c for c in CROPS if c.lower().startswith(wanted)]
+    if len(matches) != 1:
+        raise ValueError(f"Unknown crop {crop!r}, expected one of: {', '.join(CROPS)}")
+    return matches[0]
+
+
+def crop_mask(crop):
+    """
+    Boolean mask over the model outputs that keeps only the classes of `crop`.
+    """
+    crop = find_crop(crop)
+    return np.array([c == crop for c in CLASS_CROPS])
+
+
+def restrict(probs, mask):
+    """
+    Renormalise softmax outputs over the classes in `mask`.
+
+    The model ends in a softmax, so this is the same as setting the masked-out
+    logits to -inf and applying the softmax again.
+    """
+    probs = np.where(mask, probs, 0.0)
+    total = probs.sum(axis=-1, keepdims=True)
+    return probs / np.maximum(total, np.finfo(np.float32).tiny)
+
+
+def top_k(probs, k):
+    """
+    Indices and probabilities of the k most likely classes, highest first.
+
+    Works on one (C,) vector or a (N, C) batch. argpartition finds the k largest
+    without sorting all C outputs, then only those k get sorted.
+    """
+    probs = np.asarray(probs)
+    k = max(1, min(int(k), probs.shape[-1]))
+    if k < probs.shape[-1]:
+        idx = np.argpartition(probs, -k, axis=-1)[..., -k:]
+    else:
+        idx = np.broadcast_to(np.arange(probs.shape[-1]), probs.shape)
+    top = np.take_along_axis(probs, idx, axis=-1)
+    order = np.argsort(-top, axis=-1, kind="stable")
+    return np.take_along_axis(idx, order, axis=-1), np.take_along_axis(top, order, axis=-1)
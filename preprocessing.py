@@ -0,0 +1,295 @@
+import hashlib
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+# the model was trained on 128x128 RGB images
+IMAGE_SIZE = (128, 128)
+# refuse anything bigger than this before decoding it (decompression bombs)
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 50_000_000))
+# keep PIL's own bomb check in line with ours
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+# largest upload /predict/ accepts, in bytes
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 20 * 2**20))
+# uploads are hashed and decoded this many bytes at a time
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# give up looking for the image header after this many bytes
+MAX_HEADER_BYTES = 1 * 2**20
+
+# leading bytes of the image formats we decode
+MAGIC_BYTES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+
+class UploadTooLarge(ValueError):
+    """
+    The upload, or the image inside it, is over the configured size limits.
+    """
+
+
+class UnsupportedImage(ValueError):
+    """
+    The upload is not an image in a format we decode.
+    """
+
+
+def sniff_format(head):
+    """
+    Image format from the first bytes of a file, or None if it is not one we decode.
+    """
+    for magic, name in MAGIC_BYTES:
+        if head.startswith(magic):
+            return name
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def check_dimensions(width, height):
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadTooLarge(f"Image is {width}x{height}, larger than the {MAX_IMAGE_PIXELS} pixel limit.")
+
+
+def open_image(contents):
+    """
+    Open uploaded bytes, or a file object, with PIL and check the pixel count
+    before any decoding.
+    """
+    try:
+        image = Image.open(io.BytesIO(contents) if isinstance(contents, bytes) else contents)
+    except Image.DecompressionBombError as e:
+        raise UploadTooLarge(str(e))
+    except Image.UnidentifiedImageError:
+        # PIL's own message names the file object, which means nothing to a client
+        raise UnsupportedImage("Uploaded file is empty or not a readable image.")
+    check_dimensions(*image.size)
+    return image
+
+
+def decode_image(contents, size=IMAGE_SIZE, timings=None):
+    """
+    Decode uploaded bytes into a (128, 128, 3) uint8 array.
+
+    JPEGs are decoded at a reduced DCT scale (draft mode), which for phone photos
+    skips most of the work of a full-resolution decode. We ask for twice the
+    target size so the final resize still has real pixels to filter.
+    If a `timings` dict is given, seconds spent in decode, resize and to_array
+    are added to it.
+    """
+    start = time.perf_counter()
+    image = open_image(contents)
+    if image.format == "JPEG":
+        image.draft("RGB", (size[0] * 2, size[1] * 2))
+    # every image in a batch must have the same shape, so force 3 channels
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # PIL decodes lazily, force it here so the decode is not billed to resize
+    image.load()
+    return _resize_to_array(image, size, timings, start)
+
+
+def _resize_to_array(image, size, timings, start):
+    decoded = time.perf_counter()
+    image = image.resize(size)
+    resized = time.perf_counter()
+    arr = np.asarray(image)
+    if timings is not None:
+        timings["decode"] = timings.get("decode", 0.0) + decoded - start
+        timings["resize"] = timings.get("resize", 0.0) + resized - decoded
+        timings["to_array"] = timings.get("to_array", 0.0) + time.perf_counter() - resized
+    return arr
+
+
+def _header_dimensions(head):
+    try:
+        with io.BytesIO(head) as fp:
+            return Image.open(fp).size
+    except Image.DecompressionBombError as e:
+        raise UploadTooLarge(str(e))
+    except OSError:
+        # not enough of the header yet
+        return None
+
+
+def inspect_upload(fileobj, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Check an uploaded file without decoding it and return its content hash
+    (the same as cache.content_key). The file is read in chunks, so rejections
+    happen as early as possible: a wrong format after the first chunk, too many
+    pixels as soon as the header has arrived, too many bytes once the limit is
+    passed. The file is rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    head = b""
+    nbytes = 0
+    fmt = None
+    dimensions = None
+    while True:
+        chunk = fileobj.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        nbytes += len(chunk)
+        if nbytes > max_bytes:
+            raise UploadTooLarge(f"Upload is larger than the {max_bytes} byte limit.")
+        digest.update(chunk)
+        if dimensions is None:
+            head += chunk
+            fmt = fmt or sniff_format(head)
+            if fmt is None:
+                raise UnsupportedImage("Uploaded file is not a JPEG, PNG, GIF, BMP, TIFF or WebP image.")
+            dimensions = _header_dimensions(head)
+            if dimensions is not None:
+                check_dimensions(*dimensions)
+                head = b""
+            elif len(head) > MAX_HEADER_BYTES:
+                raise UnsupportedImage(f"No readable {fmt} header in the first {MAX_HEADER_BYTES} bytes.")
+    if dimensions is None:
+        raise UnsupportedImage("Uploaded file is empty or not a readable image.")
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class IncrementalDecoder:
+    """
+    Decodes a JPEG from chunks as they arrive, in draft mode, so neither the
+    whole file nor a full-resolution bitmap is ever held in memory.
+
+    Works like PIL's ImageFile.Parser, which buffers JPEGs whole instead.
+    `feed` returns False for images it cannot decode this way (anything but a
+    single-tile JPEG), or when the Pillow internals it drives are missing or
+    have changed; the caller then falls back to decode_image.
+    """
+
+    def __init__(self, size=IMAGE_SIZE):
+        self.size = size
+        self.image = None
+        self._decoder = None
+        self._data = b""
+        self._offset = 0
+        self._finished = False
+
+    def feed(self, data):
+        if self._finished:
+            return True
+        self._data += data
+        if self._decoder is None:
+            try:
+                with io.BytesIO(self._data) as fp:
+                    image = Image.open(fp)
+            except OSError:
+                # header not complete yet
+                return True
+            if image.format != "JPEG" or len(image.tile) != 1:
+                return False
+            check_dimensions(*image.size)
+            try:
+                self._decoder, self._offset = self._start(image)
+            except (AttributeError, TypeError, ValueError):
+                # private Pillow API, a Pillow upgrade may have changed it
+                return False
+            self.image = image
+        if self._offset:
+            # skip the header, the decoder starts at the image data
+            skip = min(len(self._data), self._offset)
+            self._data = self._data[skip:]
+            self._offset -= skip
+            if self._offset or not self._data:
+                return True
+        try:
+            consumed, error = self._decoder.decode(self._data)
+        except (AttributeError, TypeError):
+            return False
+        if consumed < 0:
+            self._finished = True
+            self._data = b""
+            if error < 0:
+                raise OSError(f"Image data is corrupt (decoder error {error}).")
+            return True
+        self._data = self._data[consumed:]
+        return True
+
+    def _start(self, image):
+        image.draft("RGB", (self.size[0] * 2, self.size[1] * 2))
+        image.load_prepare()
+        codec, extents, offset, args = image.tile[0]
+        image.tile = []
+        decoder = Image._getdecoder(image.mode, codec, args, image.decoderconfig)
+        decoder.setimage(image.im, extents)
+        return decoder, offset
+
+    def close(self):
+        """
+        The decoded image, or None if the decoder gave up on the last bytes
+        and the caller has to fall back to decode_image.
+        """
+        if self._decoder is not None and not self._finished:
+            if not self.feed(b""):
+                return None
+        if not self._finished:
+            raise OSError("Image file is truncated.")
+        return self.image
+
+
+def decode_stream(fileobj, size=IMAGE_SIZE, timings=None):
+    """
+    Decode an uploaded file into a (128, 128, 3) uint8 array, like decode_image,
+    reading it in chunks. JPEGs go through IncrementalDecoder, other formats are
+    read whole and handed to decode_image.
+    """
+    start = time.perf_counter()
+    decoder = IncrementalDecoder(size)
+    while True:
+        chunk = fileobj.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        if not decoder.feed(chunk):
+            fileobj.seek(0)
+            return decode_image(fileobj.read(), size, timings)
+    image = decoder.close()
+    if image is None:
+        fileobj.seek(0)
+        return decode_image(fileobj.read(), size, timings)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return _resize_to_array(image, size, timings, start)
+
+
+def preprocess_image(contents):
+    """
+    Decode uploaded bytes into a (128, 128, 3) float array for the model.
+    """
+    return decode_image(contents).astype(np.float32)
+
+
+class BatchBuffer:
+    """
+    A reusable float32 batch array that decoded uint8 images are written into.
+
+    Saves allocating and stacking a fresh batch for every forward pass. The
+    buffer only grows, and `fill` returns a view so nothing else is copied.
+    """
+
+    def __init__(self, capacity=32, image_shape=IMAGE_SIZE + (3,)):
+        self.image_shape = tuple(image_shape)
+        self._buffer = np.empty((max(1, capacity),) + self.image_shape, np.float32)
+
+    def fill(self, arrays):
+        n = len(arrays)
+        shape = tuple(np.shape(arrays[0]))
+        if n > len(self._buffer) or shape != self.image_shape:
+            self.image_shape = shape
+            self._buffer = np.empty((max(n, len(self._buffer)),) + shape, np.float32)
+        for i, arr in enumerate(arrays):
+            # casts uint8 to float32 while writing, no intermediate array
+            np.copyto(self._buffer[i], arr, casting="unsafe")
+        return self._buffer[:n]
@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference import DEFAULT_BUCKETS, load_engine, model_version
+
+
+class ModelSlot:
+    """
+    A loaded and warmed-up engine, with the file it came from.
+    """
+
+    def __init__(self, engine, path, version, load_s=0.0):
+        self.engine = engine
+        self.path = path
+        self.version = version
+        self.load_s = load_s
+        self.loaded_at = time.time()
+
+    def info(self):
+        return {"path": self.path, "version": self.version, "load_s": self.load_s, "loaded_at": self.loaded_at}
+
+
+def load_slot(path, buckets=DEFAULT_BUCKETS, num_threads=None, check=None, embeddings=False):
+    """
+    Load and warm up a .keras or .tflite model. `check(num_classes)` can reject
+    it before the warm-up is paid for.
+    """
+    start = time.perf_counter()
+    engine = load_engine(path, buckets=buckets, warmup=False, num_threads=num_threads, embeddings=embeddings)
+    if check is not None:
+        check(engine.num_classes)
+    engine.warmup()
+    return ModelSlot(engine, path, model_version(path), time.perf_counter() - start)
+
+
+class ModelRegistry:
+    """
+    The model serving traffic, plus optionally a candidate running in shadow.
+
+    `predict` always answers from the active model. Swapping it is a single
+    assignment, so a batch that has already started finishes on the engine it
+    started with and the old engine is freed once nothing refers to it.
+
+    While a shadow is set, a `shadow_rate` fraction of batches is copied to it
+    and predicted on its own thread, off the request path. Its top-1 agreement
+    with the active model and both latencies are recorded. A sample is skipped
+    if the shadow is still busy with the previous one, so a slow candidate can
+    never build up a backlog.
+    """
+
+    def __init__(self, max_disagreements=50):
+        self.active = None
+        self.shadow = None
+        self.shadow_rate = 0.0
+        self._lock = threading.Lock()
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._shadow_busy = False
+        self._max_disagreements = max_disagreements
+        self._reset_shadow_stats()
+
+    def _reset_shadow_stats(self):
+        self._shadow_stats = {"batches": 0, "images": 0, "disagreements": 0, "errors": 0,
+                              "active_seconds": 0.0, "shadow_seconds": 0.0}
+        self._recent = deque(maxlen=self._max_disagreements)
+
+    def activate(self, slot):
+        self.active = slot
+
+    def start_shadow(self, slot, rate):
+        with self._lock:
+            self._reset_shadow_stats()
+            self.shadow_rate = min(1.0, max(0.0, float(rate)))
+            self.shadow = slot
+
+    def stop_shadow(self):
+        """
+        Stop shadowing and wait for a running shadow prediction to finish.
+        Returns the candidate that was in shadow.
+        """
+        # samples are only handed to the shadow under the lock, so none can be submitted after this
+        with self._lock:
+            slot, self.shadow = self.shadow, None
+        # interpreters are not thread-safe, so the candidate must be idle before anyone else uses it
+        self._shadow_executor.submit(lambda: None).result()
+        return slot
+
+    def promote(self):
+        """
+        Make the shadow candidate the active model.
+        """
+        slot = self.stop_shadow()
+        if slot is None:
+            raise ValueError("No model is running in shadow.")
+        self.activate(slot)
+        return slot
+
+    def predict(self, batch, embeddings=False):
+        """
+        Softmax rows from the active model, followed by embeddings if asked for
+        and the model provides them.
+        """
+        active = self.active
+        start = time.perf_counter()
+        outputs = active.engine.predict(batch, embeddings)
+        elapsed = time.perf_counter() - start
+        if self.shadow is None:
+            return outputs
+        with self._lock:
+            shadow = self.shadow
+            if shadow is not None and not self._shadow_busy and random.random() < self.shadow_rate:
+                self._shadow_busy = True
+                # the batch lives in a reused buffer, so the shadow gets its own copy
+                self._shadow_executor.submit(
+                    self._run_shadow, shadow, np.array(batch), outputs[:, :active.engine.num_classes], elapsed
+                )
+        return outputs
+
+    def _run_shadow(self, shadow, batch, active_outputs, active_seconds):
+        try:
+            with self._lock:
+                if shadow is not self.shadow:
+                    # stopped or replaced while this sample was queued
+                    return
+            start = time.perf_counter()
+            outputs = shadow.engine.predict(batch)
+            elapsed = time.perf_counter() - start
+            active_top = active_outputs.argmax(axis=1)
+            shadow_top = outputs.argmax(axis=1)
+            with self._lock:
+                if shadow is not self.shadow:
+                    return
+                stats = self._shadow_stats
+                stats["batches"] += 1
+                stats["images"] += len(batch)
+                stats["active_seconds"] += active_seconds
+                stats["shadow_seconds"] += elapsed
+                for i in np.flatnonzero(active_top != shadow_top):
+                    stats["disagreements"] += 1
+                    self._recent.append({
+                        "active_class": int(active_top[i]),
+                        "active_confidence": float(active_outputs[i, active_top[i]]),
+                        "shadow_class": int(shadow_top[i]),
+                        "shadow_confidence": float(outputs[i, shadow_top[i]]),
+                        "at": time.time(),
+                    })
+        except Exception as e:
+            print(f"Shadow prediction failed: {e}")
+            with self._lock:
+                self._shadow_stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._shadow_busy = False
+
+    def shadow_stats(self):
+        """
+        Agreement and latency of the shadow candidate against the active model.
+        """
+        with self._lock:
+            stats = dict(self._shadow_stats)
+            recent = list(self._recent)
+        batches = stats["batches"]
+        stats["agreement"] = 1.0 - stats["disagreements"] / stats["images"] if stats["images"] else None
+        stats["active_ms_per_batch"] = stats["active_seconds"] * 1000.0 / batches if batches else None
+        stats["shadow_ms_per_batch"] = stats["shadow_seconds"] * 1000.0 / batches if batches else None
+        stats["recent_disagreements"] = recent
+        return stats
+
+    def stats(self):
+        return {
+            "active": self.active.info() if self.active else None,
+            "shadow": dict(self.shadow.info(), rate=self.shadow_rate, **self.shadow_stats()) if self.shadow else None,
+        }
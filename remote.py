@@ -0,0 +1,52 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from classes import CLASS_NAMES
+
+
+class RemoteClassifier:
+    """
+    Client for the FastAPI /predict/ endpoint, for front ends that leave the
+    model to the service instead of loading it themselves.
+
+    Every call goes through one keep-alive connection pool. Connection errors,
+    read timeouts and 502/503/504 answers are retried with exponential backoff,
+    honouring Retry-After, which covers a service that is still loading its
+    model or briefly overloaded. `timeout` is (connect, read) in seconds.
+    """
+
+    def __init__(self, url, timeout=(3.05, 30.0), retries=3, backoff=0.5, pool_size=10):
+        self.url = url
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            # a prediction has no side effects, so a POST is safe to repeat
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def predict(self, contents, filename="upload.jpg", content_type="image/jpeg"):
+        """
+        (class index, confidence in percent) for one image's bytes.
+        """
+        response = self.session.post(
+            self.url,
+            files={"file": (filename, contents, content_type)},
+            # always get a class back, the caller decides what to do with a low confidence
+            params={"min_confidence": 0},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        body = response.json()
+        return CLASS_NAMES.index(body["predicted_class"]), float(body["confidence"].rstrip("%"))
+
+    def close(self):
+        self.session.close()
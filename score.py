@@ -0,0 +1,247 @@
+"""
+Bulk-score a directory tree (or a list of files) of leaf images.
+
+Usage:
+    python score.py images/ -o predictions.csv
+    python score.py --file-list paths.txt -o predictions.parquet --top-k 5 --batch-size 128
+    python score.py images/ -o predictions.csv --tta 4
+
+Images go through the same preprocessing as the /predict/ endpoint (RGB,
+128x128, float32) inside a tf.data pipeline with parallel decode and
+prefetch, so memory stays flat no matter how many files there are.
+
+--tta N averages each image's prediction over its first N test-time
+augmentation views (flips, crops, small rotations, see tta.py). The views are
+built from one decode and cost about N times the forward-pass compute.
+
+Progress is checkpointed next to the output file. Re-running the same command
+after an interruption carries on after the last rows that reached the output,
+so nothing is scored twice. --restart discards the earlier output.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from classes import CLASS_NAMES
+from inference import InferenceEngine
+from postprocess import top_k
+from preprocessing import IMAGE_SIZE
+from tta import TTA_VIEWS, decode_views
+from uploads import IMAGE_EXTENSIONS
+
+
+def list_images(root):
+    """
+    Every image file under `root`, in a stable order so runs can be resumed.
+    """
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(dirpath, name))
+    return paths
+
+
+def _decode(contents, views=1):
+    # a broken file must not stop the whole run, so flag it instead of raising
+    try:
+        return decode_views(contents, views), True
+    except Exception:
+        return np.zeros((views,) + IMAGE_SIZE + (3,), np.uint8), False
+
+
+def build_dataset(paths, batch_size, views=1):
+    """
+    tf.data pipeline yielding (paths, images, ok) batches. With test-time
+    augmentation each image contributes `views` consecutive rows to `images`.
+    """
+    def load(path):
+        image, ok = tf.numpy_function(lambda c: _decode(c, views), [tf.io.read_file(path)], [tf.uint8, tf.bool])
+        image.set_shape((views,) + IMAGE_SIZE + (3,))
+        ok.set_shape(())
+        # images travel through the pipeline as uint8 and become float32 only once batched
+        return path, image, ok
+
+    return (
+        tf.data.Dataset.from_tensor_slices(paths)
+        .map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+        .batch(batch_size)
+        .map(lambda p, x, ok: (p, tf.cast(tf.reshape(x, (-1,) + IMAGE_SIZE + (3,)), tf.float32), ok))
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+class CsvWriter:
+    """
+    Appends rows to one CSV file. On resume, the rows already in the file are
+    counted and a line cut short by a crash is dropped.
+    """
+
+    def __init__(self, path, columns, resume):
+        import csv
+        exists = resume and os.path.exists(path) and os.path.getsize(path) > 0
+        self.rows = 0
+        if exists:
+            with open(path, "r+b") as f:
+                data = f.read()
+                complete = data.rfind(b"\n") + 1
+                f.truncate(complete)
+            with open(path, newline="") as f:
+                self.rows = max(0, sum(1 for _ in csv.reader(f)) - 1)
+        self._file = open(path, "a" if exists else "w", newline="")
+        self._writer = csv.writer(self._file)
+        if not exists:
+            self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Writes one part file per flush into a directory, so a resumed run only adds
+    parts. Each part is named after the rows it holds and renamed into place
+    once complete, so the parts on disk are exactly the rows that are done.
+    """
+
+    def __init__(self, path, columns, resume):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow: pip install pyarrow")
+        self._pa, self._pq = pa, pq
+        self.path = path
+        self.columns = columns
+        os.makedirs(path, exist_ok=True)
+        self.rows = 0
+        for name in sorted(os.listdir(path)):
+            if not name.startswith((".part-", "part-")):
+                continue
+            if not resume or not name.endswith(".parquet"):
+                # earlier output on --restart, or a part a crash cut short
+                os.remove(os.path.join(path, name))
+                continue
+            try:
+                start, stop = (int(v) for v in name[len("part-"):-len(".parquet")].split("-"))
+            except ValueError:
+                sys.exit(f"{path} has parts from an older score.py, use --restart to start over.")
+            if start == self.rows:
+                self.rows = stop
+
+    def write(self, rows):
+        table = self._pa.table({c: [r[i] for r in rows] for i, c in enumerate(self.columns)})
+        name = f"part-{self.rows:09d}-{self.rows + len(rows):09d}"
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        self._pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(self.path, name + ".parquet"))
+        self.rows += len(rows)
+
+    def close(self):
+        pass
+
+
+def check_checkpoint(path, n_paths):
+    """
+    Refuse to resume output made for a different file list. How far the run
+    got is read from the output itself, which is never behind the checkpoint.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("total") != n_paths:
+        sys.exit(f"Checkpoint {path} was made for a different file list, delete it to start over.")
+
+
+def save_checkpoint(path, done, total):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"done": done, "total": total}, f)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", nargs="?", help="directory to walk for images")
+    parser.add_argument("--file-list", help="text file with one image path per line, instead of a directory")
+    parser.add_argument("-o", "--output", required=True, help="output .csv file or .parquet directory")
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--tta", type=int, default=1, choices=range(1, len(TTA_VIEWS) + 1), metavar=f"1-{len(TTA_VIEWS)}",
+                        help="average predictions over this many augmented views of each image")
+    parser.add_argument("--flush-every", type=int, default=10, help="batches between output flushes and checkpoints")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start from scratch")
+    args = parser.parse_args()
+
+    if args.file_list:
+        with open(args.file_list) as f:
+            paths = [line.strip() for line in f if line.strip()]
+    elif args.root:
+        paths = list_images(args.root)
+    else:
+        parser.error("give a directory or --file-list")
+
+    checkpoint = args.output.rstrip("/") + ".checkpoint.json"
+    if not args.restart:
+        check_checkpoint(checkpoint, len(paths))
+
+    k = max(1, min(args.top_k, len(CLASS_NAMES)))
+    columns = ["path", "ok", "class_index", "class_name", "confidence"]
+    for i in range(1, k + 1):
+        columns += [f"top{i}_class", f"top{i}_prob"]
+    writer_cls = ParquetWriter if args.output.endswith(".parquet") else CsvWriter
+    writer = writer_cls(args.output, columns, resume=not args.restart)
+    done = writer.rows
+    if done >= len(paths):
+        writer.close()
+        print(f"All {len(paths)} images already scored in {args.output}.")
+        return
+    print(f"Scoring {len(paths) - done} of {len(paths)} images" + (f", resuming after {done}." if done else "."))
+
+    # with --tta a batch holds batch_size * tta rows, run in passes of batch_size to bound memory
+    engine = InferenceEngine(tf.keras.models.load_model(args.model), buckets=(args.batch_size,))
+    rows = []
+    batches = 0
+    for batch_paths, images, ok in build_dataset(paths[done:], args.batch_size, args.tta):
+        probs = engine.predict(images.numpy())
+        probs = probs.reshape(len(ok), args.tta, -1).mean(axis=1)
+        top, _ = top_k(probs, k)
+        for path, good, p, t in zip(batch_paths.numpy(), ok.numpy(), probs, top):
+            row = [path.decode(), bool(good)]
+            if good:
+                row += [int(t[0]), CLASS_NAMES[t[0]], float(p[t[0]])]
+                for idx in t:
+                    row += [CLASS_NAMES[idx], float(p[idx])]
+            else:
+                row += [-1, "", 0.0] + ["", 0.0] * k
+            rows.append(row)
+        batches += 1
+        if batches % args.flush_every == 0:
+            writer.write(rows)
+            done += len(rows)
+            save_checkpoint(checkpoint, done, len(paths))
+            print(f"{done}/{len(paths)} scored")
+            rows = []
+    if rows:
+        writer.write(rows)
+        done += len(rows)
+        save_checkpoint(checkpoint, done, len(paths))
+    writer.close()
+    print(f"Done: {done}/{len(paths)} images written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
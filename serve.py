@@ -0,0 +1,108 @@
+"""
+Multi-process serving: one supervisor, several uvicorn workers sharing one copy of the weights.
+
+Usage:
+    python serve.py --workers 4
+    python serve.py --workers 2 --variant dynamic --port 8080
+    python serve.py --workers 4 --backend keras      # no sharing, threads still split
+
+With the default tflite backend the supervisor makes sure an up-to-date
+.tflite export of trained_model.keras exists, converting it once in a child
+process so the supervisor itself never imports TensorFlow. Every worker
+opens that file with the TFLite interpreter, which maps it read-only, so the
+weights sit in the page cache once no matter how many workers run.
+
+The available cores are split evenly: each worker gets cores // workers
+interpreter (or TensorFlow intra-op) threads and one inter-op thread, so the
+workers do not fight each other for the CPU.
+
+The embedding index (EMBEDDING_INDEX_DIR) can only be kept by one process,
+so it needs --workers 1.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import uvicorn
+
+from inference import tflite_export_path
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def ensure_tflite(keras_path, variant, calibration_dir=None):
+    """
+    Path of the .tflite export for `variant`, converting it if it is missing or
+    older than the Keras model.
+    """
+    out_dir = os.path.dirname(os.path.abspath(keras_path))
+    path = tflite_export_path(keras_path, variant, out_dir)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(keras_path):
+        return path
+    print(f"Converting {keras_path} to {path} ...")
+    cmd = [sys.executable, os.path.join(HERE, "export_tflite.py"), "--model", keras_path,
+           "--out-dir", out_dir, "--variants", variant]
+    if calibration_dir:
+        cmd += ["--calibration-dir", calibration_dir]
+    subprocess.run(cmd, check=True, cwd=HERE)
+    return path
+
+
+def worker_env(backend, workers, tflite_path=None, cores=None, buckets=None):
+    """
+    Environment variables that configure each worker's threads and model.
+    """
+    cores = cores or available_cores()
+    per_worker = max(1, cores // workers)
+    env = {
+        "INFERENCE_BACKEND": backend,
+        "TFLITE_THREADS": str(per_worker),
+        "TF_INTRA_OP_THREADS": str(per_worker),
+        "TF_INTER_OP_THREADS": "1",
+        "DECODE_WORKERS": str(per_worker),
+    }
+    if tflite_path:
+        env["TFLITE_MODEL_PATH"] = tflite_path
+    if buckets:
+        env["ENGINE_BUCKETS"] = buckets
+        # no point batching past the largest prepared bucket
+        if "BATCH_MAX_SIZE" not in os.environ:
+            env["BATCH_MAX_SIZE"] = buckets.split(",")[-1]
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--backend", choices=("tflite", "keras"), default="tflite")
+    parser.add_argument("--model", default="trained_model.keras")
+    parser.add_argument("--variant", default="float32", help="TFLite variant to serve, see export_tflite.py")
+    parser.add_argument("--calibration-dir", help="sample images, only needed to build the int8 variant")
+    parser.add_argument("--cores", type=int, help="cores to split between workers, default all available")
+    parser.add_argument("--buckets", default="1,4,16", help="batch sizes each worker prepares, fewer means less memory")
+    args = parser.parse_args()
+    if os.environ.get("EMBEDDING_INDEX_DIR") and args.workers > 1:
+        sys.exit("EMBEDDING_INDEX_DIR is set, but the embedding index can only be kept by one process: use --workers 1.")
+
+    tflite_path = None
+    if args.backend == "tflite":
+        tflite_path = ensure_tflite(args.model, args.variant, args.calibration_dir)
+    env = worker_env(args.backend, args.workers, tflite_path, args.cores, args.buckets)
+    # uvicorn starts the workers as child processes, which inherit this environment
+    os.environ.update(env)
+    print(f"Starting {args.workers} workers: " + ", ".join(f"{k}={v}" for k, v in sorted(env.items())))
+    uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers, app_dir=HERE)
+
+
+if __name__ == "__main__":
+    main()
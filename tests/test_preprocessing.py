@@ -0,0 +1,53 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import UPLOAD_CHUNK_BYTES, IncrementalDecoder, decode_image, decode_stream
+
+
+def jpeg(width=1600, height=1200):
+    # smooth gradients with some noise, large enough to span several chunks
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    rgb = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    rgb = np.clip(rgb + rng.integers(-20, 20, rgb.shape), 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(rgb).save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def test_incremental_decoder_decodes_jpeg_without_fallback():
+    # fails if a Pillow upgrade breaks the private API the decoder drives
+    contents = jpeg()
+    decoder = IncrementalDecoder()
+    for start in range(0, len(contents), UPLOAD_CHUNK_BYTES):
+        assert decoder.feed(contents[start:start + UPLOAD_CHUNK_BYTES])
+    image = decoder.close()
+    assert image is not None
+    # decoded at a reduced DCT scale, never at full size
+    assert min(image.size) >= 256 and image.size[0] < 1600
+
+
+def test_decode_stream_matches_decode_image():
+    contents = jpeg()
+    streamed = decode_stream(io.BytesIO(contents))
+    assert streamed.shape == (128, 128, 3)
+    assert np.array_equal(streamed, decode_image(contents))
+
+
+@pytest.mark.parametrize("error", [AttributeError, TypeError, ValueError])
+def test_decode_stream_falls_back_when_private_api_changes(monkeypatch, error):
+    # Pillow's own decoding uses the same internals, so break only the decoder's use of them
+    def start(self, image):
+        raise error("changed in this Pillow")
+
+    contents = jpeg()
+    monkeypatch.setattr(IncrementalDecoder, "_start", start)
+    assert not IncrementalDecoder().feed(contents)
+    assert np.array_equal(decode_stream(io.BytesIO(contents)), decode_image(contents))
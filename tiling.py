@@ -0,0 +1,173 @@
+import math
+import os
+import time
+
+import numpy as np
+
+from classes import CLASS_NAMES
+from postprocess import CLASS_HEALTHY, restrict
+from preprocessing import IMAGE_SIZE, open_image
+
+# most tiles one photo may be split into, before any are skipped
+MAX_TILES = int(os.environ.get("MAX_TILES", 256))
+# a pixel counts as plant when 2G - R - B (excess green) is above this
+EXCESS_GREEN_THRESHOLD = int(os.environ.get("EXCESS_GREEN_THRESHOLD", 20))
+
+
+class TilingError(ValueError):
+    """
+    The photo cannot be tiled as asked, it would take too many tiles.
+    """
+
+
+class Tiles:
+    """
+    The tiles of one photo worth classifying, and where they came from.
+
+    `images` is an (N, 128, 128, 3) uint8 stack of the kept tiles, `positions`
+    their (row, col) in the grid and `boxes` their (x0, y0, x1, y1) in source
+    pixels. `green` holds every grid cell's fraction of plant pixels, kept or not.
+    """
+
+    def __init__(self, images, positions, boxes, green, tile_px, overlap):
+        self.images = images
+        self.positions = positions
+        self.boxes = boxes
+        self.green = green
+        self.tile_px = tile_px
+        self.overlap = overlap
+
+    @property
+    def shape(self):
+        return self.green.shape
+
+
+def tile_layout(width, height, grid, overlap, min_side=IMAGE_SIZE[0]):
+    """
+    Side of a square tile in source pixels and the x and y origins of the
+    tiles, for `grid` tiles across the shorter side overlapping by `overlap`.
+    Along the longer side there are as many as it takes to cover it with at
+    least that overlap. Small photos get fewer tiles, down to one, so that
+    tiles are never smaller than `min_side` and never upscaled.
+    """
+    fits = 1 + (min(width, height) / min_side - 1) / (1 - overlap)
+    grid = max(1, min(grid, math.floor(fits + 1e-9)))
+    side = min(width, height) / (1 + (grid - 1) * (1 - overlap))
+    stride = side * (1 - overlap)
+    cols = max(1, math.ceil((width - side) / stride - 1e-9) + 1)
+    rows = max(1, math.ceil((height - side) / stride - 1e-9) + 1)
+    return side, np.linspace(0, width - side, cols), np.linspace(0, height - side, rows)
+
+
+def green_fraction(image, xs, ys, size):
+    """
+    Fraction of plant pixels in each `size` x `size` window with its corner at
+    (xs[c], ys[r]), as a (rows, cols) array. One pass builds a summed-area
+    table of the excess-green mask, after which every window is four lookups.
+    """
+    rgb = image.astype(np.int16)
+    plant = 2 * rgb[..., 1] - rgb[..., 0] - rgb[..., 2] > EXCESS_GREEN_THRESHOLD
+    table = np.pad(plant.cumsum(axis=0, dtype=np.int32).cumsum(axis=1), ((1, 0), (1, 0)))
+    y, x = ys[:, None], xs[None, :]
+    counts = table[y + size, x + size] - table[y, x + size] - table[y + size, x] + table[y, x]
+    return counts / float(size * size)
+
+
+def tile_image(source, grid=4, overlap=0.25, min_green=0.15, size=IMAGE_SIZE, timings=None):
+    """
+    Split a photo, given as bytes or a file object, into overlapping square
+    tiles the model's input size and keep those worth classifying.
+
+    Rather than cutting full-resolution tiles and resizing each, the photo is
+    decoded once at the scale where one tile is exactly `size` (JPEGs in draft
+    mode, so a 12 MP photo never exists at full size) and the tiles are slices
+    of that. Tiles with less than `min_green` plant pixels are skipped; if none
+    has enough, the greenest one is kept so there is always a verdict. If a
+    `timings` dict is given, seconds spent in decode, resize and tile are added
+    to it.
+    """
+    start = time.perf_counter()
+    image = open_image(source)
+    width, height = image.size
+    side, xs, ys = tile_layout(width, height, grid, overlap, size[0])
+    if len(xs) * len(ys) > MAX_TILES:
+        raise TilingError(f"{grid} tiles across makes {len(ys)}x{len(xs)} tiles, more than the {MAX_TILES} tile limit.")
+    t = size[0]
+    scale = t / side
+    work_size = (max(t, round(width * scale)), max(t, round(height * scale)))
+    if image.format == "JPEG":
+        # draft picks the smallest DCT scale at least this big, up to twice the working size
+        image.draft("RGB", work_size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.load()
+    decoded = time.perf_counter()
+    work = np.asarray(image.resize(work_size))
+    resized = time.perf_counter()
+
+    wx = np.minimum(np.round(xs * scale).astype(np.int64), work_size[0] - t)
+    wy = np.minimum(np.round(ys * scale).astype(np.int64), work_size[1] - t)
+    green = green_fraction(work, wx, wy, t)
+    kept = green >= min_green
+    if not kept.any():
+        kept.flat[np.argmax(green)] = True
+    positions = np.argwhere(kept)
+    images = np.empty((len(positions), t, t, 3), np.uint8)
+    for i, (r, c) in enumerate(positions):
+        images[i] = work[wy[r]:wy[r] + t, wx[c]:wx[c] + t]
+    boxes = np.stack([xs[positions[:, 1]], ys[positions[:, 0]], xs[positions[:, 1]] + side, ys[positions[:, 0]] + side], axis=1)
+    if timings is not None:
+        timings["decode"] = timings.get("decode", 0.0) + decoded - start
+        timings["resize"] = timings.get("resize", 0.0) + resized - decoded
+        timings["tile"] = timings.get("tile", 0.0) + time.perf_counter() - resized
+    return Tiles(images, positions, np.round(boxes).astype(np.int64), green, side, overlap)
+
+
+def aggregate(probs, mask=None):
+    """
+    One softmax vector for the whole photo from its tiles' (N, C) outputs,
+    restricted to the classes in `mask`.
+
+    A field is as sick as its sickest leaves, so when any tile's top class is
+    a disease the verdict averages only those tiles, otherwise all of them.
+    Returns the verdict and the (possibly restricted) per-tile outputs.
+    """
+    if mask is not None:
+        probs = restrict(probs, mask)
+    diseased = ~CLASS_HEALTHY[np.argmax(probs, axis=1)]
+    verdict = probs[diseased].mean(axis=0) if diseased.any() else probs.mean(axis=0)
+    return verdict, probs
+
+
+def tile_report(tiles, probs):
+    """
+    Per-tile predictions and heatmap grids for a response. In the grids,
+    skipped tiles have class index -1 and a disease probability of None.
+    """
+    rows, cols = tiles.shape
+    top = np.argmax(probs, axis=1)
+    disease = 1.0 - probs[:, CLASS_HEALTHY].sum(axis=1)
+    class_grid = np.full((rows, cols), -1, np.int64)
+    disease_grid = [[None] * cols for _ in range(rows)]
+    predictions = []
+    for (r, c), box, i, p, d in zip(tiles.positions, tiles.boxes, top, probs, disease):
+        class_grid[r, c] = i
+        disease_grid[r][c] = round(float(d), 4)
+        predictions.append({
+            "row": int(r), "col": int(c), "box": [int(v) for v in box], "class_index": int(i),
+            "predicted_class": CLASS_NAMES[i], "confidence": f"{float(p[i]) * 100:.2f}%",
+        })
+    return {
+        "grid": [rows, cols],
+        "tile_px": int(round(tiles.tile_px)),
+        "overlap": tiles.overlap,
+        "classified": len(predictions),
+        "skipped": rows * cols - len(predictions),
+        "diseased": int((~CLASS_HEALTHY[top]).sum()),
+        "predictions": predictions,
+        "heatmap": {
+            "class_index": class_grid.tolist(),
+            "disease": disease_grid,
+            "green": np.round(tiles.green, 3).tolist(),
+        },
+    }
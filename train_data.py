@@ -0,0 +1,247 @@
+"""
+Training input pipeline over pre-decoded, sharded TFRecords.
+
+Usage:
+    python train_data.py build train/ shards/train
+    python train_data.py build valid/ shards/valid --compression GZIP
+    python train_data.py bench shards/train --raw-dir train/ --model trained_model.keras
+
+`build` walks a class-per-directory tree (the layout train.ipynb reads with
+image_dataset_from_directory), decodes and resizes every image to 128x128
+once, and writes them as uint8 with their labels into shuffled shards of
+--shard-size images, plus a manifest.json with the class names and counts.
+Decoding and resizing match image_dataset_from_directory (bilinear, RGB),
+rounded to uint8.
+
+In a notebook, use it in place of image_dataset_from_directory:
+
+    from train_data import load_dataset
+    training_set = load_dataset("shards/train", batch_size=32)
+    validation_set = load_dataset("shards/valid", batch_size=32, shuffle=False)
+
+Batches are (float32 images in 0-255, one-hot labels), the same as the
+"categorical" datasets train.ipynb builds today. Shards are read with parallel
+interleave, shuffled through a buffer, parsed a batch at a time and
+prefetched, so no JPEG is decoded during training.
+
+`bench` prints the images/sec the pipeline delivers and, with --raw-dir, the
+images/sec of image_dataset_from_directory on the original JPEGs. With
+--model it also measures training-step throughput, which shows whether an
+epoch is bound by the input pipeline or by compute.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import tensorflow as tf
+
+from preprocessing import IMAGE_SIZE
+from score import list_images
+
+MANIFEST = "manifest.json"
+# bump when the record layout changes
+FORMAT_VERSION = 1
+
+
+def class_directories(data_dir):
+    # sorted, which is how image_dataset_from_directory assigns label indices
+    return sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+
+
+def _load(path, label):
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(image, IMAGE_SIZE, method="bilinear")
+    image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    return image, label
+
+
+def _example(image, label):
+    return tf.train.Example(features=tf.train.Features(feature={
+        "image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+        "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label)])),
+    })).SerializeToString()
+
+
+def build_shards(data_dir, out_dir, shard_size=2000, compression=None, seed=0):
+    """
+    Decode every image under `data_dir` once and write them into TFRecord shards.
+    """
+    classes = class_directories(data_dir)
+    paths, labels = [], []
+    for label, name in enumerate(classes):
+        for path in list_images(os.path.join(data_dir, name)):
+            paths.append(path)
+            labels.append(label)
+    if not paths:
+        sys.exit(f"No images found under {data_dir}")
+    # mix classes across shards so a small shuffle buffer still sees every class
+    order = list(range(len(paths)))
+    random.Random(seed).shuffle(order)
+    paths = [paths[i] for i in order]
+    labels = [labels[i] for i in order]
+
+    os.makedirs(out_dir, exist_ok=True)
+    options = tf.io.TFRecordOptions(compression_type=compression or "")
+    dataset = (
+        tf.data.Dataset.from_tensor_slices((paths, labels))
+        .map(_load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+        # a broken file is skipped rather than ending the build
+        .ignore_errors()
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    shards, counts = [], [0] * len(classes)
+    writer = None
+    written = 0
+    start = time.perf_counter()
+    for image, label in dataset.as_numpy_iterator():
+        if written % shard_size == 0:
+            if writer is not None:
+                writer.close()
+            name = f"shard-{len(shards):05d}.tfrecord"
+            shards.append(name)
+            writer = tf.io.TFRecordWriter(os.path.join(out_dir, name), options)
+        writer.write(_example(image, label))
+        counts[label] += 1
+        written += 1
+        if written % 5000 == 0:
+            print(f"{written}/{len(paths)} images, {written / (time.perf_counter() - start):.0f} images/s")
+    if writer is not None:
+        writer.close()
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "source": os.path.abspath(data_dir),
+        "image_size": list(IMAGE_SIZE),
+        "compression": compression,
+        "class_names": classes,
+        "class_counts": counts,
+        "images": written,
+        "skipped": len(paths) - written,
+        "shards": shards,
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {written} images into {len(shards)} shards in {out_dir} "
+          f"({len(paths) - written} skipped) in {time.perf_counter() - start:.1f}s.")
+    return manifest
+
+
+def read_manifest(shard_dir):
+    with open(os.path.join(shard_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{shard_dir} was built with format {manifest.get('format_version')}, rebuild it.")
+    return manifest
+
+
+def load_dataset(shard_dir, batch_size=32, shuffle=True, shuffle_buffer=10000, label_mode="categorical", seed=None):
+    """
+    Stream (images, labels) batches from the shards in `shard_dir`.
+    """
+    manifest = read_manifest(shard_dir)
+    num_classes = len(manifest["class_names"])
+    height, width = manifest["image_size"]
+    files = [os.path.join(shard_dir, name) for name in manifest["shards"]]
+
+    dataset = tf.data.Dataset.from_tensor_slices(files)
+    if shuffle:
+        dataset = dataset.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(
+        lambda path: tf.data.TFRecordDataset(path, compression_type=manifest["compression"] or ""),
+        cycle_length=min(len(files), 8),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle,
+    )
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    features = {
+        "image": tf.io.FixedLenFeature([], tf.string),
+        "label": tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    def parse(records):
+        # parse a whole batch in one op rather than record by record
+        parsed = tf.io.parse_example(records, features)
+        images = tf.reshape(tf.io.decode_raw(parsed["image"], tf.uint8), (-1, height, width, 3))
+        labels = parsed["label"]
+        if label_mode == "categorical":
+            labels = tf.one_hot(labels, num_classes)
+        return tf.cast(images, tf.float32), labels
+
+    return dataset.batch(batch_size).map(parse, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def images_per_second(dataset, batches, warmup=5):
+    """
+    Throughput of a dataset when nothing else consumes it.
+    """
+    iterator = iter(dataset)
+    for _ in range(warmup):
+        next(iterator)
+    images = 0
+    start = time.perf_counter()
+    for _ in range(batches):
+        try:
+            x, _ = next(iterator)
+        except StopIteration:
+            break
+        images += int(x.shape[0])
+    return images / (time.perf_counter() - start)
+
+
+def train_images_per_second(model_path, batch_size, steps):
+    """
+    Training-step throughput on one in-memory batch, i.e. with the input pipeline out of the picture.
+    """
+    model = tf.keras.models.load_model(model_path)
+    num_classes = model.output_shape[-1]
+    x = tf.random.uniform((batch_size,) + IMAGE_SIZE + (3,), 0, 255)
+    y = tf.one_hot(tf.random.uniform((batch_size,), 0, num_classes, tf.int32), num_classes)
+    model.train_on_batch(x, y)
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.train_on_batch(x, y)
+    return batch_size * steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="convert an image directory tree into shards")
+    build.add_argument("data_dir")
+    build.add_argument("out_dir")
+    build.add_argument("--shard-size", type=int, default=2000, help="images per shard, about 100 MB uncompressed")
+    build.add_argument("--compression", choices=("GZIP", "ZLIB"), default=None)
+    build.add_argument("--seed", type=int, default=0)
+    bench = sub.add_parser("bench", help="measure images/sec of the pipeline")
+    bench.add_argument("shard_dir")
+    bench.add_argument("--batch-size", type=int, default=32)
+    bench.add_argument("--batches", type=int, default=200)
+    bench.add_argument("--raw-dir", help="also measure image_dataset_from_directory on this tree")
+    bench.add_argument("--model", help="also measure training-step throughput of this model")
+    bench.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_shards(args.data_dir, args.out_dir, args.shard_size, args.compression, args.seed)
+        return
+
+    shards = images_per_second(load_dataset(args.shard_dir, args.batch_size).repeat(), args.batches)
+    print(f"sharded records          {shards:10.0f} images/s")
+    if args.raw_dir:
+        raw = tf.keras.utils.image_dataset_from_directory(
+            args.raw_dir, label_mode="categorical", batch_size=args.batch_size, image_size=IMAGE_SIZE, shuffle=True
+        )
+        print(f"image_dataset_from_dir   {images_per_second(raw.repeat(), args.batches):10.0f} images/s")
+    if args.model:
+        train = train_images_per_second(args.model, args.batch_size, args.steps)
+        print(f"training step            {train:10.0f} images/s")
+        bound = "compute" if shards > train else "the input pipeline"
+        print(f"epochs are bound by {bound} ({shards / train:.1f}x headroom in the pipeline)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import IMAGE_SIZE, decode_image
+
+# test-time augmentation views, in the order they are used: asking for n views
+# always means the first n. Predictions over the views are averaged by the caller
+TTA_VIEWS = (
+    "identity", "hflip", "vflip",
+    "center", "top_left", "top_right", "bottom_left", "bottom_right",
+    "rotate_cw", "rotate_ccw",
+)
+# crops cover this fraction of each side
+CROP_FRACTION = 0.875
+ROTATION_DEGREES = 10
+_CROPS = ("center", "top_left", "top_right", "bottom_left", "bottom_right")
+
+
+def source_size(views, size=IMAGE_SIZE):
+    """
+    Size to decode at for `views` views. Once crops are involved this is larger
+    than `size`, so the crops keep full detail instead of being upscaled.
+    """
+    if not any(name in _CROPS for name in TTA_VIEWS[:views]):
+        return size
+    return tuple(int(round(s / CROP_FRACTION)) for s in size)
+
+
+def _resize(arr, size):
+    if arr.shape[1] == size[0] and arr.shape[0] == size[1]:
+        return arr
+    return np.asarray(Image.fromarray(arr).resize(size))
+
+
+def augment(image, views, size=IMAGE_SIZE):
+    """
+    Stack the first `views` views of a (H, W, C) uint8 image into a
+    (views, size[1], size[0], C) uint8 batch.
+    """
+    names = TTA_VIEWS[:max(1, views)]
+    base = _resize(image, size)
+    h, w = image.shape[:2]
+    ch, cw = int(round(h * CROP_FRACTION)), int(round(w * CROP_FRACTION))
+    offsets = {
+        "center": ((h - ch) // 2, (w - cw) // 2),
+        "top_left": (0, 0),
+        "top_right": (0, w - cw),
+        "bottom_left": (h - ch, 0),
+        "bottom_right": (h - ch, w - cw),
+    }
+    out = np.empty((len(names), size[1], size[0], image.shape[2]), np.uint8)
+    for i, name in enumerate(names):
+        if name == "identity":
+            out[i] = base
+        elif name == "hflip":
+            out[i] = base[:, ::-1]
+        elif name == "vflip":
+            out[i] = base[::-1]
+        elif name in offsets:
+            y, x = offsets[name]
+            out[i] = _resize(image[y:y + ch, x:x + cw], size)
+        else:
+            angle = -ROTATION_DEGREES if name == "rotate_cw" else ROTATION_DEGREES
+            out[i] = np.asarray(Image.fromarray(base).rotate(angle, resample=Image.BILINEAR))
+    return out
+
+
+def augment_timed(image, views, size=IMAGE_SIZE, timings=None):
+    """
+    augment(), adding the seconds it took to `timings["augment"]`.
+    """
+    start = time.perf_counter()
+    stack = augment(image, views, size)
+    if timings is not None:
+        timings["augment"] = timings.get("augment", 0.0) + time.perf_counter() - start
+    return stack
+
+
+def decode_views(contents, views, size=IMAGE_SIZE, timings=None):
+    """
+    Decode uploaded bytes once and return the stacked views as uint8.
+    """
+    return augment_timed(decode_image(contents, source_size(views, size), timings), views, size, timings)
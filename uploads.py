@@ -0,0 +1,111 @@
+import os
+import tarfile
+import zipfile
+
+from preprocessing import UploadTooLarge
+
+# file types we try to decode when they show up inside an archive
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp"}
+
+
+class TooManyImages(ValueError):
+    """
+    The upload holds more images than the caller takes.
+    """
+
+
+def is_archive(filename, content_type=""):
+    name = (filename or "").lower()
+    return (
+        name.endswith((".zip", ".tar", ".tar.gz", ".tgz"))
+        or content_type in ("application/zip", "application/x-zip-compressed", "application/x-tar", "application/gzip")
+    )
+
+
+def _wanted(name):
+    base = os.path.basename(name)
+    return (
+        not base.startswith(".")
+        and "__MACOSX" not in name
+        and os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def _too_large(name, size, max_bytes):
+    def read():
+        raise UploadTooLarge(f"{name} is {size} bytes, larger than the {max_bytes} byte limit.")
+    return read
+
+
+def _read_zip_member(archive, info, max_bytes):
+    with archive.open(info) as member:
+        # the declared size was checked, but never trust it for how much to read
+        data = member.read() if max_bytes is None else member.read(max_bytes + 1)
+    if max_bytes is not None and len(data) > max_bytes:
+        raise UploadTooLarge(f"{info.filename} is larger than the {max_bytes} byte limit.")
+    return data
+
+
+def iter_archive(fileobj, filename, max_bytes=None):
+    """
+    Yield (name, read) pairs for every image inside a zip or tar archive.
+
+    `read()` returns the member's bytes. Members are only read when asked for,
+    so the whole archive is never held in memory at once. Members whose size
+    is over `max_bytes` are never read; their `read()` raises UploadTooLarge.
+    """
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        archive = zipfile.ZipFile(fileobj)
+        for info in archive.infolist():
+            if info.is_dir() or not _wanted(info.filename):
+                continue
+            if max_bytes is not None and info.file_size > max_bytes:
+                yield info.filename, _too_large(info.filename, info.file_size, max_bytes)
+            else:
+                yield info.filename, (lambda info=info: _read_zip_member(archive, info, max_bytes))
+        return
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        raise ValueError(f"{filename} is not a readable zip or tar archive")
+    # tar members have to be read in order, so read each one as it is reached
+    for member in archive:
+        if not member.isfile() or not _wanted(member.name):
+            continue
+        if max_bytes is not None and member.size > max_bytes:
+            yield member.name, _too_large(member.name, member.size, max_bytes)
+            continue
+        data = archive.extractfile(member).read()
+        yield member.name, (lambda data=data: data)
+
+
+def _read_upload(upload, max_bytes):
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    if max_bytes is not None and size > max_bytes:
+        raise UploadTooLarge(f"{upload.filename} is {size} bytes, larger than the {max_bytes} byte limit.")
+    upload.file.seek(0)
+    return upload.file.read()
+
+
+def iter_upload_images(files, max_bytes=None, max_images=None):
+    """
+    Flatten a list of UploadFiles, expanding archives, into (name, read) pairs.
+    `read()` raises UploadTooLarge instead of reading an image over `max_bytes`.
+    Images are counted as archives are unpacked, and TooManyImages is raised
+    instead of yielding image number `max_images` + 1.
+    """
+    count = 0
+    for upload in files:
+        if is_archive(upload.filename, upload.content_type or ""):
+            images = iter_archive(upload.file, upload.filename, max_bytes)
+        else:
+            images = [(upload.filename, (lambda upload=upload: _read_upload(upload, max_bytes)))]
+        for image in images:
+            count += 1
+            if max_images is not None and count > max_images:
+                raise TooManyImages(f"The upload holds more than {max_images} images.")
+            yield image
@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+
+class PoolFullError(Exception):
+    """
+    Raised when a request arrives while every pending slot is taken.
+    """
+
+
+class BoundedPool:
+    """
+    A fixed-size thread pool for blocking work (image decoding) with a cap on
+    how many requests may be admitted at once.
+
+    Requests beyond `max_pending` are rejected straight away instead of queueing,
+    so latency stays bounded under overload and the event loop stays free.
+    """
+
+    def __init__(self, max_workers=4, max_pending=64):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="decode")
+        self._pending = 0
+        self._rejected = 0
+
+    def acquire(self):
+        """
+        Take one admission slot or raise PoolFullError. Pair with `release()`.
+        """
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise PoolFullError(f"{self._pending} requests already pending")
+        self._pending += 1
+
+    def release(self):
+        self._pending -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one admission slot for the lifetime of a request.
+        """
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, fn, *args):
+        """
+        Run a blocking callable on the pool without blocking the event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "rejected": self._rejected,
+        }